@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, CustomerProfile, ProviderProfile, Service, Booking
+from .models import CustomUser, CustomerProfile, ProviderProfile, Service, Booking, ProviderBookingStats, Payment, PaymentWebhookEvent, DocumentUpload
 
 
 @admin.register(CustomUser)
@@ -29,4 +29,8 @@ class CustomUserAdmin(UserAdmin):
 admin.site.register(CustomerProfile)
 admin.site.register(ProviderProfile)
 admin.site.register(Service)
-admin.site.register(Booking)
\ No newline at end of file
+admin.site.register(Booking)
+admin.site.register(ProviderBookingStats)
+admin.site.register(Payment)
+admin.site.register(PaymentWebhookEvent)
+admin.site.register(DocumentUpload)
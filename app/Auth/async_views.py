@@ -0,0 +1,146 @@
+"""
+native async versions of the read heavy and payment endpoints. under ASGI they
+run on the event loop without the sync_to_async thread hop DRF views need.
+DRF has no async views, so these are plain Django views returning JsonResponse
+"""
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedJWTAuthentication
+from .cache import acatalog_key, aread_through
+from .fast_serializers import BookingValuesSerializer, ServiceValuesSerializer
+from .models import Booking, Service
+from .pagination import KeysetPagination, akeyset_page, cursor_link
+from .payments import GatewayUnavailable, PaymentGatewayError, apayable_booking, arecord_order, get_gateway, order_data, verify_payment_signature
+from .routers import replica_reads
+from .serializers import BookingSerializer
+
+authenticator = CachedJWTAuthentication()
+
+
+def jwt_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            result = await authenticator.aauthenticate(request)
+        except AuthenticationFailed as e:
+            # InvalidToken carries a dict, rendered as is like DRF does
+            detail = e.detail if isinstance(e.detail, dict) else {"detail": e.detail}
+            return JsonResponse(detail, status=status.HTTP_401_UNAUTHORIZED)
+        if result is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+        request.user = result[0]
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _json_body(request):
+    """
+    the body as a dict, None when it is not JSON or not an object
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@require_GET
+@jwt_required
+async def service_list(request):
+    paginator = KeysetPagination()
+    cursor = request.GET.get(paginator.cursor_query_param)
+    page_size = paginator.get_page_size(request)
+    base_url = request.build_absolute_uri()
+
+    async def build():
+        rows, next_position, previous_position = await akeyset_page(
+            ServiceValuesSerializer.values(Service.objects.all()), cursor, page_size
+        )
+        return {
+            'next': cursor_link(base_url, next_position, False, paginator.cursor_query_param),
+            'previous': cursor_link(base_url, previous_position, True, paginator.cursor_query_param),
+            'results': ServiceValuesSerializer.serialize(rows),
+        }
+
+    # built from the primary, see AvailableServicesListView.list
+    data = await aread_through(await acatalog_key('list', base_url), build)
+    return JsonResponse(data)
+
+
+@require_GET
+@jwt_required
+async def customer_bookings(request):
+    user = request.user
+    if not hasattr(user, 'customer_profile'):
+        return JsonResponse([], safe=False)
+    with replica_reads():
+        queryset = Booking.objects.filter(customer_id=user.customer_profile.pk).order_by('schedule')
+        rows = [row async for row in BookingValuesSerializer.values(queryset)]
+    return JsonResponse(BookingValuesSerializer.serialize(rows), safe=False)
+
+
+@require_GET
+@jwt_required
+async def booking_detail(request, pk):
+    try:
+        booking = await Booking.objects.select_related('service').aget(pk=pk)
+    except Booking.DoesNotExist:
+        return JsonResponse({"error": "Booking not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    user = request.user
+    is_customer = hasattr(user, 'customer_profile') and user.customer_profile.pk == booking.customer_id
+    is_provider = hasattr(user, 'provider_profile') and user.provider_profile.pk == booking.service.provider_id
+    if not (is_customer or is_provider):
+        return JsonResponse({"detail": "You are not authorized to view this booking."}, status=status.HTTP_403_FORBIDDEN)
+    return JsonResponse(BookingSerializer(booking).data)
+
+
+@csrf_exempt
+@require_POST
+@jwt_required
+async def create_order(request):
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({"detail": "Expected a JSON object."}, status=status.HTTP_400_BAD_REQUEST)
+    booking = await apayable_booking(request.user, data.get('booking'))
+    if booking is None:
+        return JsonResponse({'error': 'Booking not found'}, status=400)
+
+    order = order_data(booking.service.price)
+    try:
+        razorpay_order = await get_gateway().acreate_order(order)
+    except GatewayUnavailable as e:
+        return JsonResponse({'error': str(e)}, status=503)
+    except PaymentGatewayError as e:
+        return JsonResponse({'error': str(e)}, status=502)
+    await arecord_order(razorpay_order, order, booking.pk)
+    return JsonResponse({
+        'order_id': razorpay_order['id'],
+        'razorpay_key': settings.RAZORPAY_KEY_ID,
+        'amount': order['amount'],
+        'currency': 'INR'
+    })
+
+
+@csrf_exempt
+@require_POST
+async def verify_payment(request):
+    data = _json_body(request)
+    try:
+        order_id = data['razorpay_order_id']
+        payment_id = data['razorpay_payment_id']
+        signature = data['razorpay_signature']
+    except (KeyError, TypeError):
+        return JsonResponse({'error': 'Invalid data'}, status=400)
+
+    if verify_payment_signature(order_id, payment_id, signature):
+        return JsonResponse({'status': 'Payment verified successfully'})
+    return JsonResponse({'error': 'Signature mismatch'}, status=400)
@@ -0,0 +1,114 @@
+"""
+helpers shared by the bench_* management commands
+"""
+import itertools
+import os
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def throwaway_database():
+    """
+    migrates a fresh file backed database for the duration of the block, so a
+    benchmark never touches real data and every worker thread can connect to it
+    """
+    settings_dict = connection.settings_dict
+    fd, path = tempfile.mkstemp(prefix='bench-', suffix='.sqlite3')
+    os.close(fd)
+    settings_dict.setdefault('TEST', {})['NAME'] = path
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield path
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+@contextmanager
+def throwaway_cache():
+    """
+    replaces every configured cache with an empty local memory one for the
+    duration of the block, so a benchmark never flushes or fills a real Redis
+    and runs without one
+    """
+    backends = {
+        alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'bench-{alias}'}
+        for alias in settings.CACHES
+    }
+    with override_settings(CACHES=backends):
+        # local memory caches outlive the override, a second run starts empty
+        for alias in backends:
+            caches[alias].clear()
+        yield
+
+
+def summarize(latencies, elapsed):
+    """
+    requests/sec and latency percentiles in milliseconds
+    """
+    if not latencies:
+        return {'requests': 0}
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 3)
+
+    return {
+        'requests': len(ordered),
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(len(ordered) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+    }
+
+
+def run_concurrently(task, requests, concurrency):
+    """
+    calls task(i) for i in range(requests) from `concurrency` threads and
+    returns (latencies, elapsed, errors). each thread closes its database
+    connection when it runs out of work
+    """
+    latencies = []
+    errors = []
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                i = next(counter)
+                if i >= requests:
+                    return
+                start = time.perf_counter()
+                try:
+                    task(i)
+                except Exception as e:
+                    with lock:
+                        errors.append(repr(e))
+                    continue
+                took = time.perf_counter() - start
+                with lock:
+                    latencies.append(took)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start, errors
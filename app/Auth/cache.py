@@ -0,0 +1,123 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_HITS_KEY = 'catalog:hits'
+CATALOG_MISSES_KEY = 'catalog:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _incr(cache, key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # first write for this key, add() so a concurrent first write is not lost
+        if not cache.add(key, 1, timeout=None):
+            return cache.incr(key)
+        return 1
+
+
+def catalog_version():
+    """
+    every catalog key embeds this version, bumping it invalidates all of them
+    at once without having to know which pages or services were cached
+    """
+    cache = get_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+async def acatalog_version():
+    cache = get_cache()
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = await cache.aget(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_catalog():
+    _incr(get_cache(), CATALOG_VERSION_KEY)
+
+
+def catalog_key(kind, *parts):
+    return _catalog_key(catalog_version(), kind, parts)
+
+
+def _catalog_key(version, kind, parts):
+    digest = hashlib.md5('|'.join(str(p) for p in parts).encode()).hexdigest()
+    return f"catalog:{version}:{kind}:{digest}"
+
+
+async def acatalog_key(kind, *parts):
+    return _catalog_key(await acatalog_version(), kind, parts)
+
+
+def read_through(key, builder):
+    """
+    returns the cached value for key, calling builder() and caching its result
+    on a miss
+    """
+    cache = get_cache()
+    value = cache.get(key)
+    if value is not None:
+        _incr(cache, CATALOG_HITS_KEY)
+        return value
+    _incr(cache, CATALOG_MISSES_KEY)
+    value = builder()
+    cache.set(key, value, timeout=getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+    return value
+
+
+async def _aincr(cache, key):
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, timeout=None):
+            return await cache.aincr(key)
+        return 1
+
+
+async def aread_through(key, builder):
+    """
+    read_through() for async views, builder is a coroutine function
+    """
+    cache = get_cache()
+    value = await cache.aget(key)
+    if value is not None:
+        await _aincr(cache, CATALOG_HITS_KEY)
+        return value
+    await _aincr(cache, CATALOG_MISSES_KEY)
+    value = await builder()
+    await cache.aset(key, value, timeout=getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+    return value
+
+
+def catalog_cache_stats():
+    cache = get_cache()
+    values = cache.get_many([CATALOG_HITS_KEY, CATALOG_MISSES_KEY])
+    hits = values.get(CATALOG_HITS_KEY, 0)
+    misses = values.get(CATALOG_MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+        'version': catalog_version(),
+    }
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    get_cache().delete(user_cache_key(user_id))
@@ -0,0 +1,38 @@
+from django_filters import rest_framework as filters
+
+from .models import Service
+from .search import search_services
+
+
+class ServiceFilter(filters.FilterSet):
+    """
+    search and facets for the service catalog
+    """
+    q = filters.CharFilter(method='filter_text')
+    min_price = filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = filters.NumberFilter(field_name='price', lookup_expr='lte')
+    provider = filters.NumberFilter(field_name='provider_id')
+    ordering = filters.ChoiceFilter(
+        method='filter_ordering',
+        choices=[('relevance', 'Relevance'), ('price', 'Price'), ('-price', 'Price (descending)')],
+    )
+
+    class Meta:
+        model = Service
+        fields = ['q', 'min_price', 'max_price', 'provider', 'ordering']
+
+    def filter_text(self, queryset, name, value):
+        return search_services(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        # ordering is applied in filter_queryset once the text match is known
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        ordering = self.form.cleaned_data.get('ordering')
+        if ordering in ('price', '-price'):
+            return queryset.order_by(ordering, 'id')
+        if self.form.cleaned_data.get('q'):
+            return queryset.order_by('-relevance', 'id')
+        return queryset.order_by('-created_at', '-id')
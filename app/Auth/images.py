@@ -0,0 +1,176 @@
+"""
+profile picture processing. after an upload commits, a background worker
+resizes the picture into square variants, each as WebP and as a JPEG fallback,
+and records them in the profile's picture_variants. files are named after the
+SHA-256 of the original upload, so the same picture uploaded twice is stored
+and processed once
+"""
+import hashlib
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .cache import invalidate_catalog, invalidate_cached_user
+
+logger = logging.getLogger(__name__)
+
+# Pillow format, file extension
+FORMATS = (('WEBP', 'webp'), ('JPEG', 'jpg'))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_image_executor():
+    """
+    small pool for image work, Pillow releases the GIL while it resizes and
+    encodes so requests keep being served
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2),
+                    thread_name_prefix='image-processing',
+                )
+    return _executor
+
+
+def content_name(digest, suffix, ext):
+    # two levels of directories keep any one of them small
+    return posixpath.join('images', digest[:2], digest[2:4], f'{digest}{suffix}.{ext}')
+
+
+def _save(name, data):
+    # same name, same content. a file already there is a duplicate
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'JPEG':
+        image = image.convert('RGB')
+        image.save(buffer, fmt, quality=getattr(settings, 'IMAGE_QUALITY', 80), optimize=True, progressive=True)
+    else:
+        image.save(buffer, fmt, quality=getattr(settings, 'IMAGE_QUALITY', 80), method=4)
+    return buffer.getvalue()
+
+
+def build_variants(data):
+    """
+    stores the original and its variants under content hash names and returns
+    the picture_variants mapping: {'original': name, 'sizes': {size: {ext: name}}}
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        ext = (image.format or 'png').lower().replace('jpeg', 'jpg')
+        # phones store the rotation in EXIF, the variants have it applied
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+        original = _save(content_name(digest, '', ext), data)
+        sizes = {}
+        for size in getattr(settings, 'IMAGE_VARIANT_SIZES', [64, 128, 256]):
+            names = {}
+            for fmt, fmt_ext in FORMATS:
+                name = content_name(digest, f'-{size}', fmt_ext)
+                if not default_storage.exists(name):
+                    # crops to a square from the centre, as avatars are shown
+                    thumb = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+                    _save(name, _encode(thumb, fmt))
+                names[fmt_ext] = name
+            sizes[str(size)] = names
+    return {'original': original, 'sizes': sizes}
+
+
+def is_processed(profile):
+    return (profile.picture_variants or {}).get('original') == profile.profile_picture.name
+
+
+def process_profile_picture(model, pk):
+    """
+    processes the current picture of one profile. safe to run twice, and a
+    picture replaced while this ran is left for the run its own save started
+    """
+    profile = model.objects.filter(pk=pk).only('user', 'profile_picture', 'picture_variants').first()
+    if profile is None or not profile.profile_picture:
+        return None
+    uploaded = profile.profile_picture.name
+    if is_processed(profile):
+        return profile.picture_variants
+    try:
+        with profile.profile_picture.open('rb') as f:
+            variants = build_variants(f.read())
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+        logger.warning("Could not process %s: %s", uploaded, e)
+        return None
+
+    updated = model.objects.filter(pk=pk, profile_picture=uploaded).update(
+        profile_picture=variants['original'], picture_variants=variants,
+    )
+    if not updated:
+        return None
+    # the upload now lives under its content hash name
+    if uploaded != variants['original']:
+        default_storage.delete(uploaded)
+    # update() sends no post_save, so drop what the receivers would have
+    invalidate_cached_user(profile.user_id)
+    if model._meta.model_name == 'providerprofile':
+        invalidate_catalog()
+    return variants
+
+
+def schedule_processing(model, pk):
+    """
+    hands the profile to the image pool once the transaction that saved the
+    upload commits
+    """
+    transaction.on_commit(lambda: get_image_executor().submit(_process_in_background, model, pk))
+
+
+def _process_in_background(model, pk):
+    try:
+        process_profile_picture(model, pk)
+    except Exception:
+        logger.exception("Processing the picture of %s %s failed", model.__name__, pk)
+    finally:
+        connection.close()
+
+
+def picture_urls(profile):
+    """
+    urls of a profile's picture. the variants appear once processing finished,
+    until then only the original is there
+    """
+    return picture_urls_from(profile.profile_picture.name, profile.picture_variants)
+
+
+def picture_urls_from(name, variants):
+    """
+    picture_urls() for the raw column values, as read by values()
+    """
+    if not name:
+        return None
+    variants = variants or {}
+    if variants.get('original') != name:
+        return {'original': default_storage.url(name), 'sizes': {}}
+    return {
+        'original': default_storage.url(variants['original']),
+        'sizes': {
+            size: {ext: default_storage.url(name) for ext, name in names.items()}
+            for size, names in variants['sizes'].items()
+        },
+    }
@@ -0,0 +1,104 @@
+"""
+logging pieces referenced from settings.LOGGING. records are put on a bounded
+queue on the request thread and formatted and written by a listener thread, so
+a slow disk never holds up a response
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# attributes every LogRecord has, anything else came in through extra=
+RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    one JSON object per line with the extra= fields at the top level
+    """
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    keeps `rate` of the successful, fast request records. errors and requests
+    slower than slow_threshold seconds are always kept
+    """
+
+    def __init__(self, rate=1.0, slow_threshold=1.0):
+        super().__init__()
+        self.rate = rate
+        self.slow_threshold = slow_threshold
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        status = getattr(record, 'status', 0)
+        duration_ms = getattr(record, 'duration_ms', 0)
+        if status >= 400 or duration_ms >= self.slow_threshold * 1000:
+            return True
+        return random.random() < self.rate
+
+
+class QueuedFileHandler(QueueHandler):
+    """
+    FileHandler behind a QueueHandler. the formatter set by dictConfig is used
+    by the file handler on the listener thread. when the queue is full records
+    are dropped and counted rather than blocking the request
+    """
+
+    def __init__(self, filename, maxsize=10000, encoding=None):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.FileHandler(filename, encoding=encoding)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # freeze what depends on the caller's state, formatting happens later
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            self.target.close()
+        super().close()
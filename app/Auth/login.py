@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import CustomUser
+
+
+class LoginError(Exception):
+    pass
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_hashing_executor():
+    """
+    bounded pool that runs password hash checks for async views. PBKDF2 runs
+    in C without the GIL, so the checks overlap while the event loop keeps
+    serving other requests
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'PASSWORD_HASHING_WORKERS', 4),
+                    thread_name_prefix='password-hashing',
+                )
+    return _executor
+
+
+def _check_password(user, password_ok):
+    if not password_ok:
+        raise LoginError("Invalid credentials")
+    return user
+
+
+def authenticate_credentials(email, password):
+    """
+    returns the verified user owning email and password with one SELECT and
+    one hash check, raising LoginError otherwise
+    """
+    try:
+        user = CustomUser.objects.get(email=email.lower())
+    except CustomUser.DoesNotExist:
+        raise LoginError("User not found")
+    if not user.is_verified:
+        raise LoginError("User not verified")
+    return _check_password(user, user.check_password(password))
+
+
+async def aauthenticate_credentials(email, password):
+    try:
+        user = await CustomUser.objects.aget(email=email.lower())
+    except CustomUser.DoesNotExist:
+        raise LoginError("User not found")
+    if not user.is_verified:
+        raise LoginError("User not verified")
+    loop = asyncio.get_running_loop()
+    password_ok = await loop.run_in_executor(get_hashing_executor(), user.check_password, password)
+    return _check_password(user, password_ok)
+
+
+def login_payload(user):
+    refresh = RefreshToken.for_user(user)
+    return {
+        "success": True,
+        "message": "Login successful",
+        "data": {
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+            'user': {
+                'id': user.id,
+                'username': user.username,
+                'email': user.email
+            }
+        },
+    }
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from Auth.bench import run_concurrently, summarize, throwaway_database
+from Auth.models import Booking, CustomUser, CustomerProfile, ProviderProfile, Service
+
+# (name, sync path, async path)
+ENDPOINTS = [
+    ('list_services', '/api/list_services/', '/api/async/list_services/'),
+    ('my_bookings', '/api/my/', '/api/async/my/'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the sync DRF endpoints served through WSGI and ASGI with their native async versions "
+        "under concurrent load, against a throwaway database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--services', type=int, default=200)
+        parser.add_argument('--bookings', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            token = self.populate(options['services'], options['bookings'])
+            report = {'requests': options['requests'], 'concurrency': options['concurrency'], 'endpoints': {}}
+            for name, sync_path, async_path in ENDPOINTS:
+                report['endpoints'][name] = {
+                    'wsgi_sync': self.wsgi(sync_path, token, options['requests'], options['concurrency']),
+                    'asgi_sync': asyncio.run(self.asgi(sync_path, token, options['requests'], options['concurrency'])),
+                    'asgi_async': asyncio.run(self.asgi(async_path, token, options['requests'], options['concurrency'])),
+                }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def populate(self, services, bookings):
+        password = make_password(None)
+        provider_user = CustomUser.objects.create(email='provider@example.com', password=password, is_provider=True, is_verified=True)
+        customer_user = CustomUser.objects.create(email='customer@example.com', password=password, is_verified=True)
+        provider = ProviderProfile.objects.get(user=provider_user)
+        customer = CustomerProfile.objects.get(user=customer_user)
+        created = Service.objects.bulk_create(
+            Service(name=f'Service {i}', description='benchmark service', price=100 + i, provider=provider)
+            for i in range(services)
+        )
+        start = timezone.now() + timedelta(days=1)
+        Booking.objects.bulk_create(
+            Booking(customer=customer, service=created[i % len(created)],
+                    schedule=start + timedelta(hours=i), schedule_end=start + timedelta(hours=i + 1))
+            for i in range(bookings)
+        )
+        return str(RefreshToken.for_user(customer_user).access_token)
+
+    def wsgi(self, path, token, requests, concurrency):
+        def get(i):
+            response = Client().get(path, headers={'Authorization': f'Bearer {token}'})
+            assert response.status_code == 200, response.content
+
+        latencies, elapsed, errors = run_concurrently(get, requests, concurrency)
+        return summarize(latencies, elapsed) | {'errors': len(errors)}
+
+    async def asgi(self, path, token, requests, concurrency):
+        client = AsyncClient()
+        limit = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+
+        async def get():
+            nonlocal errors
+            async with limit:
+                start = time.perf_counter()
+                response = await client.get(path, headers={'Authorization': f'Bearer {token}'})
+                if response.status_code != 200:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(get() for _ in range(requests)))
+        return summarize(latencies, time.perf_counter() - start) | {'errors': errors}
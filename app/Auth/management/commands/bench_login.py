@@ -0,0 +1,102 @@
+import asyncio
+import json
+import time
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+
+from Auth.bench import run_concurrently, summarize, throwaway_database
+from Auth.login import authenticate_credentials
+from Auth.models import CustomUser
+
+PASSWORD = 'bench-password-123'
+
+
+def legacy_login(email, password):
+    """
+    the login flow before the single pass rewrite: the serializer fetched and
+    checked the user, then the view did both again
+    """
+    user = CustomUser.objects.get(email=email)
+    if not user.is_verified or not user.check_password(password):
+        return None
+    user = CustomUser.objects.get(email=email)
+    if not user.check_password(password):
+        return None
+    return user
+
+
+class Command(BaseCommand):
+    help = "Measures login throughput, queries and hash checks per login against a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=40)
+        parser.add_argument('--concurrency', type=int, default=4)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            report = self.run(options['users'], options['requests'], options['concurrency'])
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, users, requests, concurrency):
+        # one hash shared by every user, creating them is not what is measured
+        password = make_password(PASSWORD)
+        emails = [f'bench{i}@example.com' for i in range(users)]
+        CustomUser.objects.bulk_create(
+            CustomUser(email=email, password=password, is_verified=True) for email in emails
+        )
+
+        report = {'users': users, 'requests': requests, 'concurrency': concurrency}
+        report['per_login'] = {
+            'legacy': self.cost(lambda: legacy_login(emails[0], PASSWORD)),
+            'single_pass': self.cost(lambda: authenticate_credentials(emails[0], PASSWORD)),
+        }
+
+        latencies, elapsed, errors = run_concurrently(
+            lambda i: legacy_login(emails[i % users], PASSWORD), requests, concurrency
+        )
+        report['legacy_direct'] = summarize(latencies, elapsed) | {'errors': len(errors)}
+
+        def sync_login(i):
+            response = Client().post('/api/login/', {'email': emails[i % users], 'password': PASSWORD},
+                                     content_type='application/json')
+            assert response.status_code == 200, response.content
+
+        latencies, elapsed, errors = run_concurrently(sync_login, requests, concurrency)
+        report['wsgi_login'] = summarize(latencies, elapsed) | {'errors': len(errors)}
+
+        report['async_login'] = asyncio.run(self.async_logins(emails, requests, concurrency))
+        return report
+
+    def cost(self, login):
+        original = CustomUser.check_password
+        with mock.patch.object(CustomUser, 'check_password', autospec=True, side_effect=original) as checks:
+            with CaptureQueriesContext(connection) as queries:
+                login()
+        return {'queries': len(queries.captured_queries), 'hash_checks': checks.call_count}
+
+    async def async_logins(self, emails, requests, concurrency):
+        client = AsyncClient()
+        limit = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+
+        async def one(i):
+            nonlocal errors
+            async with limit:
+                start = time.perf_counter()
+                response = await client.post('/api/async/login/', {'email': emails[i % len(emails)], 'password': PASSWORD},
+                                             content_type='application/json')
+                if response.status_code != 200:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return summarize(latencies, time.perf_counter() - start) | {'errors': errors}
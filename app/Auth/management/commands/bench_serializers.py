@@ -0,0 +1,87 @@
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from Auth.bench import throwaway_database
+from Auth.fast_serializers import BookingValuesSerializer, ServiceValuesSerializer
+from Auth.models import Booking, CustomUser, ProviderProfile, Service
+from Auth.renderers import ORJSONRenderer, orjson
+from Auth.serializers import BookingSerializer, ServiceSerializer
+
+
+def best_of(repeat, function):
+    """
+    the fastest of `repeat` runs in milliseconds and the last result
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        took = time.perf_counter() - start
+        best = took if best is None else min(best, took)
+    return round(best * 1000, 3), result
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the ModelSerializer + JSONRenderer path against the values() serializers + ORJSONRenderer "
+        "path for the service and booking lists on a throwaway database, split into fetch+serialize and "
+        "render, and checks both produce the same bytes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help="services and bookings in each list")
+        parser.add_argument('--repeat', type=int, default=5, help="runs per measurement, the best one counts")
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            services, bookings = self.populate(options['rows'])
+            report = {
+                'rows': options['rows'],
+                'orjson': orjson is not None,
+                'services': self.compare(services, ServiceSerializer, ServiceValuesSerializer, options['repeat']),
+                'bookings': self.compare(bookings, BookingSerializer, BookingValuesSerializer, options['repeat']),
+            }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def populate(self, rows):
+        providers = ProviderProfile.objects.bulk_create(
+            ProviderProfile(user=user, first_name='Provider', last_name=str(i), address='Pune')
+            for i, user in enumerate(CustomUser.objects.bulk_create(
+                CustomUser(email=f'bench-provider{i}@example.com', is_provider=True) for i in range(20)
+            ))
+        )
+        # the post_save receiver creates the profile
+        customer = CustomUser.objects.create(email='bench-customer@example.com').customer_profile
+        services = Service.objects.bulk_create(
+            Service(name=f'Service {i}', description='serializer bench ' * 4, price=100 + i, provider=providers[i % len(providers)])
+            for i in range(rows)
+        )
+        start = timezone.now()
+        Booking.objects.bulk_create(
+            Booking(customer=customer, service=services[i], schedule=start + timedelta(hours=i),
+                    schedule_end=start + timedelta(hours=i + 1))
+            for i in range(rows)
+        )
+        return (
+            Service.objects.select_related('provider').order_by('-created_at', '-id'),
+            Booking.objects.filter(customer=customer).order_by('schedule'),
+        )
+
+    def compare(self, queryset, serializer_class, values_serializer_class, repeat):
+        # fresh querysets each run, so the database fetch is part of the time
+        drf_ms, drf_data = best_of(repeat, lambda: serializer_class(queryset.all(), many=True).data)
+        values_ms, values_data = best_of(repeat, lambda: values_serializer_class.serialize(values_serializer_class.values(queryset.all())))
+        json_ms, drf_output = best_of(repeat, lambda: JSONRenderer().render(drf_data))
+        orjson_ms, values_output = best_of(repeat, lambda: ORJSONRenderer().render(values_data))
+        return {
+            'model_serializer': {'serialize_ms': drf_ms, 'render_ms': json_ms, 'total_ms': round(drf_ms + json_ms, 3)},
+            'values_serializer': {'serialize_ms': values_ms, 'render_ms': orjson_ms, 'total_ms': round(values_ms + orjson_ms, 3)},
+            'speedup': round((drf_ms + json_ms) / (values_ms + orjson_ms), 1),
+            'identical_output': drf_output == values_output,
+            'bytes': len(values_output),
+        }
@@ -0,0 +1,110 @@
+import json
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from Auth.bench import run_concurrently, summarize, throwaway_database
+from Auth.models import CustomUser, CustomerProfile
+
+PASSWORD = 'bench-password-123'
+
+
+def legacy_signup(email, phone_number):
+    """
+    the signup flow before it relied on unique constraints: the serializer's
+    UniqueValidator and two more existence checks, then the user and profile
+    inserts outside any transaction
+    """
+    if CustomUser.objects.filter(email=email).exists():
+        return None
+    if CustomUser.objects.filter(email=email).exists():
+        return None
+    if CustomUser.objects.filter(phone_number=phone_number).exists():
+        return None
+    user = CustomUser(email=email, phone_number=phone_number)
+    user.set_password(PASSWORD)
+    user.save()
+    return user
+
+
+def count_statements(queries):
+    counts = {'select': 0, 'write': 0, 'transaction': 0}
+    for query in queries.captured_queries:
+        verb = query['sql'].split(None, 1)[0].upper()
+        if verb == 'SELECT':
+            counts['select'] += 1
+        elif verb in ('INSERT', 'UPDATE', 'DELETE'):
+            counts['write'] += 1
+        else:
+            counts['transaction'] += 1
+    return counts
+
+
+def payload(i, prefix='bench'):
+    return {
+        'email': f'{prefix}{i}@example.com',
+        'phone_number': f'+9198{i:08d}',
+        'password': PASSWORD,
+        'password2': PASSWORD,
+        'is_provider': False,
+    }
+
+
+class Command(BaseCommand):
+    help = "Measures signup queries, throughput and duplicate handling under concurrency against a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=40)
+        parser.add_argument('--concurrency', type=int, default=4)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            report = self.run(options['requests'], options['concurrency'])
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, requests, concurrency):
+        report = {'requests': requests, 'concurrency': concurrency}
+
+        with CaptureQueriesContext(connection) as legacy:
+            legacy_signup('legacy-probe@example.com', '+919700000000')
+        with CaptureQueriesContext(connection) as current:
+            Client().post('/api/signup/', payload(0, 'probe'), content_type='application/json')
+        report['queries_per_signup'] = {'legacy': count_statements(legacy), 'current': count_statements(current)}
+
+        latencies, elapsed, errors = run_concurrently(
+            lambda i: legacy_signup(f'legacy{i}@example.com', f'+9197{i + 1:08d}'), requests, concurrency
+        )
+        report['legacy_direct'] = summarize(latencies, elapsed) | {'errors': len(errors)}
+
+        def signup(i):
+            response = Client().post('/api/signup/', payload(i + 1), content_type='application/json')
+            assert response.status_code == 201, response.content
+
+        latencies, elapsed, errors = run_concurrently(signup, requests, concurrency)
+        report['signup'] = summarize(latencies, elapsed) | {'errors': len(errors)}
+
+        # every thread races to claim the same email at once
+        barrier = threading.Barrier(concurrency)
+        statuses = []
+
+        def duplicate(i):
+            data = payload(10_000_000 + i, 'race')
+            data['email'] = 'race@example.com'
+            barrier.wait()
+            statuses.append(Client().post('/api/signup/', data, content_type='application/json').status_code)
+
+        run_concurrently(duplicate, concurrency, concurrency)
+        report['duplicate_race'] = {
+            'attempts': concurrency,
+            'created': statuses.count(201),
+            'rejected': statuses.count(400),
+            'other': len(statuses) - statuses.count(201) - statuses.count(400),
+            'users_without_profile': CustomUser.objects.filter(
+                is_provider=False, customer_profile__isnull=True
+            ).count(),
+        }
+        report['customer_profiles'] = CustomerProfile.objects.count()
+        return report
@@ -0,0 +1,113 @@
+import json
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from Auth.bench import run_concurrently, summarize, throwaway_cache, throwaway_database
+from Auth.models import Booking, CustomUser, ProviderProfile, Service
+
+PROFILES = ('default', 'production')
+
+
+def apply_profile(profile):
+    """
+    points every new connection at the given profile. the settings dict is
+    shared by all threads' connections, so this has to happen between runs
+    """
+    settings_dict = connection.settings_dict
+    connection.close()
+    if profile == 'production':
+        settings_dict['OPTIONS'] = dict(settings.SQLITE_PRODUCTION_OPTIONS)
+        settings_dict['CONN_MAX_AGE'] = 600
+        settings_dict['CONN_HEALTH_CHECKS'] = True
+    else:
+        settings_dict['OPTIONS'] = dict(settings.SQLITE_OPTIONS)
+        settings_dict['CONN_MAX_AGE'] = 0
+        settings_dict['CONN_HEALTH_CHECKS'] = False
+        # the journal mode is stored in the file, and the migrations ran with
+        # whatever profile the settings have
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=DELETE')
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures booking write throughput with several concurrent writers against a throwaway SQLite "
+        "database, once with the default profile (BEGIN IMMEDIATE and a busy timeout) and once with the "
+        "production profile, which adds WAL, synchronous=NORMAL, larger caches and persistent connections."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writes', type=int, default=400, help="bookings to create per profile")
+        parser.add_argument('--workers', type=int, default=8, help="concurrent writer threads")
+        parser.add_argument('--services', type=int, default=20)
+        parser.add_argument('--profile', choices=PROFILES, action='append',
+                            help="run only this profile, may be repeated")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The SQLite profiles only apply to the sqlite3 backend")
+        report = {'writes': options['writes'], 'workers': options['workers'], 'profiles': {}}
+        for profile in options['profile'] or PROFILES:
+            with throwaway_database(), throwaway_cache():
+                apply_profile(profile)
+                report['profiles'][profile] = self.run(options)
+        results = report['profiles']
+        if all(results.get(profile, {}).get('rps') for profile in PROFILES):
+            report['speedup'] = round(results['production']['rps'] / results['default']['rps'], 2)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def populate(self, services, workers):
+        password = make_password(None)
+        provider = CustomUser.objects.create(email='bench-provider@example.com', password=password, is_provider=True)
+        profile = ProviderProfile.objects.get_or_create(user=provider)[0]
+        created = Service.objects.bulk_create(
+            Service(name=f'Service {i}', description='write bench', price=100, provider=profile)
+            for i in range(services)
+        )
+        # signals create the customer profiles
+        customers = [
+            CustomUser.objects.create(email=f'bench-customer{i}@example.com', phone_number=f'+9196{i:08d}', password=password)
+            for i in range(workers)
+        ]
+        tokens = [str(RefreshToken.for_user(user).access_token) for user in customers]
+        return [str(service.pk) for service in created], tokens
+
+    def run(self, options):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        services, tokens = self.populate(options['services'], options['workers'])
+        connection.close()
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        statuses = Counter()
+        lock = threading.Lock()
+
+        def book(i):
+            # a slot of its own for every write, so none is rejected for capacity
+            response = Client(raise_request_exception=False).post('/api/book_service/', {
+                'service': services[i % len(services)],
+                'schedule': (start + timedelta(hours=i // len(services))).isoformat(),
+            }, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {tokens[i % len(tokens)]}')
+            with lock:
+                statuses[response.status_code] += 1
+            if response.status_code != 201:
+                raise RuntimeError(f"book_service returned {response.status_code}")
+
+        latencies, elapsed, errors = run_concurrently(book, options['writes'], options['workers'])
+        return {
+            'journal_mode': journal_mode,
+            **summarize(latencies, elapsed),
+            'errors': len(errors),
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+            'bookings': Booking.objects.count(),
+        }
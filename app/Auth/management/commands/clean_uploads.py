@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Auth.uploads import clean_stale_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Removes resumable document uploads that received no chunk for --max-age seconds, "
+        "and the partial files in UPLOAD_TEMP_DIR no unfinished upload owns. Run it from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=settings.UPLOAD_EXPIRY,
+                            help="seconds since the last chunk after which an upload is abandoned")
+
+    def handle(self, *args, **options):
+        uploads, files = clean_stale_uploads(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {uploads} stale uploads and {files} temporary files"))
@@ -0,0 +1,199 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from Auth.cache import invalidate_catalog
+from Auth.models import Booking, CustomUser, CustomerProfile, ProviderProfile, Service
+from Auth.search import fts_available, rebuild_index
+
+PASSWORD = 'dataset-password-123'
+
+CATEGORIES = [
+    'Plumbing', 'Electrical repair', 'Home cleaning', 'Salon at home', 'Massage', 'Tutoring',
+    'Photography', 'Yoga', 'Pest control', 'Car wash', 'AC repair', 'Painting', 'Carpentry',
+    'Laundry', 'Fitness training', 'Appliance repair',
+]
+KINDS = ['Express', 'Premium', 'Basic', 'Deep', 'Weekend', 'Emergency', 'Family', 'Monthly']
+CITIES = ['Mumbai', 'Delhi', 'Bengaluru', 'Hyderabad', 'Chennai', 'Pune', 'Kolkata', 'Jaipur', 'Kochi', 'Indore']
+FIRST_NAMES = ['Aarav', 'Diya', 'Ishaan', 'Kavya', 'Rohan', 'Ananya', 'Vikram', 'Meera', 'Arjun', 'Priya', 'Kabir', 'Neha']
+LAST_NAMES = ['Sharma', 'Iyer', 'Patel', 'Reddy', 'Khan', 'Das', 'Nair', 'Singh', 'Gupta', 'Menon']
+DURATIONS = ([30, 45, 60, 90, 120], [2, 2, 5, 2, 1])
+CAPACITIES = ([1, 2, 3, 5], [14, 3, 2, 1])
+# (status, weight) for bookings already in the past and still to come
+PAST_STATUSES = (['completed', 'cancelled', 'confirmed'], [80, 15, 5])
+FUTURE_STATUSES = (['pending', 'confirmed', 'cancelled'], [40, 50, 10])
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a deterministic synthetic dataset of providers, customers, services and bookings with "
+        "bulk_create. Provider popularity follows a Zipf distribution and schedules are spread over months "
+        "around today. Signals are bypassed, so profiles, booking stats and the search index are written "
+        "by the command itself."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--providers', type=int, default=1000)
+        parser.add_argument('--customers', type=int, default=50000)
+        parser.add_argument('--services-per-provider', type=int, default=5, help="mean, actual counts vary")
+        parser.add_argument('--bookings', type=int, default=500000)
+        parser.add_argument('--months', type=int, default=12, help="schedules span this many months, centred on today")
+        parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent of provider popularity")
+        parser.add_argument('--batch-size', type=int, default=20000, help="rows per transaction")
+        parser.add_argument('--skip-stats', action='store_true', help="do not rebuild the booking stats rollup")
+
+    def handle(self, *args, **options):
+        if options['providers'] < 1 or options['services_per_provider'] < 1:
+            raise CommandError("At least one provider with one service is needed")
+        if CustomUser.objects.filter(email__endswith='@dataset.example.com').exists():
+            raise CommandError("The database already holds a generated dataset")
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # one hash for every user, with a fixed salt so the seed decides everything
+        self.password = make_password(PASSWORD, salt=f'dataset{options["seed"]}')
+        self.now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        started = time.perf_counter()
+
+        provider_ids = self.create_users('provider', options['providers'], ProviderProfile)
+        customer_ids = self.create_users('customer', options['customers'], CustomerProfile)
+        services = self.create_services(provider_ids, options['services_per_provider'], options['skew'])
+        self.create_bookings(services, customer_ids, options['bookings'], options['months'])
+
+        if not options['skip_stats']:
+            call_command('rebuild_booking_stats', stdout=self.stdout)
+        if fts_available():
+            with transaction.atomic():
+                rebuild_index(connection)
+            self.stdout.write("Rebuilt the service search index")
+        try:
+            invalidate_catalog()
+        except Exception as e:
+            self.stderr.write(f"Could not invalidate the catalog cache: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"Generated the dataset in {time.perf_counter() - started:.1f}s"))
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield range(start, min(start + self.batch_size, total))
+
+    def progress(self, label, done, total, started):
+        rate = done / (time.perf_counter() - started)
+        self.stdout.write(f"{label}: {done}/{total} ({rate:.0f} rows/s)")
+
+    def create_users(self, kind, total, profile_model):
+        """
+        returns the profile ids in creation order
+        """
+        is_provider = kind == 'provider'
+        phone_prefix = '+918' if is_provider else '+919'
+        profile_ids = []
+        started = time.perf_counter()
+        for batch in self.batches(total):
+            users = [
+                CustomUser(
+                    id=self.uuid(),
+                    email=f'{kind}{i}@dataset.example.com',
+                    phone_number=f'{phone_prefix}{i:09d}',
+                    password=self.password,
+                    is_provider=is_provider,
+                    is_verified=True,
+                    date_joined=self.now,
+                )
+                for i in batch
+            ]
+            profiles = [
+                profile_model(
+                    user=user,
+                    first_name=self.rng.choice(FIRST_NAMES),
+                    last_name=self.rng.choice(LAST_NAMES),
+                    address=self.rng.choice(CITIES),
+                )
+                for user in users
+            ]
+            # bulk_create sends no post_save, so create_profile does not run
+            with transaction.atomic():
+                CustomUser.objects.bulk_create(users)
+                profile_model.objects.bulk_create(profiles)
+            profile_ids.extend(profile.pk for profile in profiles)
+            self.progress(f"{kind}s", batch.stop, total, started)
+        return profile_ids
+
+    def create_services(self, provider_ids, per_provider, skew):
+        """
+        returns (ids, durations, cumulative weights). a service's
+        weight is its provider's Zipf weight, so the top providers get most
+        of the bookings
+        """
+        rows = []
+        ranks = list(range(1, len(provider_ids) + 1))
+        self.rng.shuffle(ranks)
+        for provider_id, rank in zip(provider_ids, ranks):
+            weight = 1 / rank ** skew
+            for _ in range(self.rng.randint(1, 2 * per_provider - 1)):
+                category = self.rng.choice(CATEGORIES)
+                city = self.rng.choice(CITIES)
+                rows.append((Service(
+                    id=self.uuid(),
+                    name=f'{self.rng.choice(KINDS)} {category}',
+                    description=f'{category} in {city}, booked by the hour',
+                    price=Decimal(round(self.rng.lognormvariate(6.2, 0.6), -1) or 100),
+                    provider_id=provider_id,
+                    duration=self.rng.choices(*DURATIONS)[0],
+                    capacity=self.rng.choices(*CAPACITIES)[0],
+                ), weight))
+
+        started = time.perf_counter()
+        for batch in self.batches(len(rows)):
+            with transaction.atomic():
+                Service.objects.bulk_create([rows[i][0] for i in batch])
+            self.progress("services", batch.stop, len(rows), started)
+
+        return (
+            [service.pk for service, _ in rows],
+            [service.duration for service, _ in rows],
+            list(accumulate(weight for _, weight in rows)),
+        )
+
+    def create_bookings(self, services, customer_ids, total, months):
+        if not total:
+            return
+        if not customer_ids:
+            raise CommandError("Bookings need at least one customer")
+        service_ids, durations, cum_weights = services
+        indexes = range(len(service_ids))
+        half_span_hours = months * 30 * 24 // 2
+        started = time.perf_counter()
+        for batch in self.batches(total):
+            chosen = self.rng.choices(indexes, cum_weights=cum_weights, k=len(batch))
+            bookings = []
+            for index in chosen:
+                # whole hours during the working day, spread evenly over the span
+                offset = self.rng.randint(-half_span_hours, half_span_hours)
+                schedule = self.now + timedelta(hours=offset)
+                schedule = schedule.replace(hour=8 + schedule.hour % 12)
+                statuses = PAST_STATUSES if schedule < self.now else FUTURE_STATUSES
+                bookings.append(Booking(
+                    id=self.uuid(),
+                    customer_id=self.rng.choice(customer_ids),
+                    service_id=service_ids[index],
+                    schedule=schedule,
+                    schedule_end=schedule + timedelta(minutes=durations[index]),
+                    status=self.rng.choices(*statuses)[0],
+                ))
+            with transaction.atomic():
+                Booking.objects.bulk_create(bookings)
+            self.progress("bookings", batch.stop, total, started)
@@ -0,0 +1,184 @@
+import csv
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from phonenumber_field.phonenumber import to_python
+
+from Auth.models import CustomUser, CustomerProfile, ProviderProfile
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+PROFILE_FIELDS = ('first_name', 'last_name', 'address')
+
+
+def _init_worker():
+    # spawned workers start without Django configured
+    django.setup()
+
+
+def _hash(password):
+    return make_password(password or None)
+
+
+def _as_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+def read_records(path, fmt):
+    """
+    yields one dict per user without loading the file into memory
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports users from a CSV or JSONL file. Passwords are hashed on a process pool and users and "
+        "their profiles are inserted with bulk_create in batches. Progress is checkpointed after every "
+        "batch so an interrupted import can be resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--checkpoint', help="defaults to <path>.checkpoint")
+        parser.add_argument('--restart', action='store_true', help="ignore an existing checkpoint")
+        parser.add_argument('--verified', action='store_true', help="mark users verified when the file does not say")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        checkpoint_path = options['checkpoint'] or f"{path}.checkpoint"
+        self.default_verified = options['verified']
+        self.workers = options['workers']
+
+        state = {'records': 0, 'imported': 0, 'skipped': 0}
+        if os.path.exists(checkpoint_path) and not options['restart']:
+            with open(checkpoint_path) as f:
+                state.update(json.load(f))
+            self.stdout.write(f"Resuming after record {state['records']}")
+
+        records = islice(read_records(path, fmt), state['records'], None)
+        started = time.perf_counter()
+        session = {'imported': 0, 'hashed': 0, 'hash_seconds': 0.0}
+
+        # workers open no database connections, but must not inherit ours
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                imported, skipped, hashed, hash_seconds = self.import_batch(batch, pool)
+                state['records'] += len(batch)
+                state['imported'] += imported
+                state['skipped'] += skipped
+                session['imported'] += imported
+                session['hashed'] += hashed
+                session['hash_seconds'] += hash_seconds
+                self.save_checkpoint(checkpoint_path, state)
+
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{state['records']} records read, {state['imported']} imported, "
+                    f"{state['skipped']} skipped, {session['imported'] / elapsed:.0f} users/s"
+                )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(json.dumps({
+            'records': state['records'],
+            'imported': state['imported'],
+            'skipped': state['skipped'],
+            'elapsed_s': round(elapsed, 2),
+            'users_per_s': round(session['imported'] / elapsed, 1) if elapsed else None,
+            'hashes_per_s': round(session['hashed'] / session['hash_seconds'], 1) if session['hash_seconds'] else None,
+        })))
+
+    def save_checkpoint(self, path, state):
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def import_batch(self, batch, pool):
+        rows = {}
+        phones = set()
+        skipped = 0
+        for record in batch:
+            email = CustomUser.objects.normalize_email((record.get('email') or '').strip()).lower()
+            phone = to_python(record.get('phone_number') or None)
+            if phone is not None and not phone.is_valid():
+                skipped += 1
+                continue
+            phone = phone.as_e164 if phone is not None else None
+            if not email or email in rows or (phone and phone in phones):
+                skipped += 1
+                continue
+            rows[email] = (record, phone)
+            if phone:
+                phones.add(phone)
+
+        existing = set(CustomUser.objects.filter(email__in=rows).values_list('email', flat=True))
+        taken_phones = set(str(p) for p in CustomUser.objects.filter(phone_number__in=phones).values_list('phone_number', flat=True))
+        for email, (record, phone) in list(rows.items()):
+            if email in existing or (phone and phone in taken_phones):
+                del rows[email]
+                skipped += 1
+
+        to_hash = [(email, record.get('password')) for email, (record, _) in rows.items() if not record.get('password_hash')]
+        hash_started = time.perf_counter()
+        hashes = dict(zip(
+            (email for email, _ in to_hash),
+            pool.map(_hash, (password for _, password in to_hash), chunksize=max(1, len(to_hash) // (self.workers * 4))),
+        ))
+        hash_seconds = time.perf_counter() - hash_started
+
+        now = timezone.now()
+        users = []
+        customer_profiles = []
+        provider_profiles = []
+        for email, (record, phone) in rows.items():
+            is_provider = _as_bool(record.get('is_provider'))
+            user = CustomUser(
+                id=uuid.uuid4(),
+                email=email,
+                phone_number=phone,
+                password=record.get('password_hash') or hashes[email],
+                is_provider=is_provider,
+                is_verified=_as_bool(record['is_verified']) if 'is_verified' in record else self.default_verified,
+                date_joined=now,
+            )
+            users.append(user)
+            profile = {field: record.get(field) or None for field in PROFILE_FIELDS}
+            if is_provider:
+                provider_profiles.append(ProviderProfile(user=user, **profile))
+            else:
+                customer_profiles.append(CustomerProfile(user=user, **profile))
+
+        # bulk_create sends no post_save, so the profiles create_profile would
+        # have made are inserted here, in the same transaction as the users
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(users)
+            CustomerProfile.objects.bulk_create(customer_profiles)
+            ProviderProfile.objects.bulk_create(provider_profiles)
+        return len(users), skipped, len(to_hash), hash_seconds
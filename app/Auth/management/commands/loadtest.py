@@ -0,0 +1,198 @@
+import json
+import subprocess
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from time import perf_counter
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from Auth.bench import run_concurrently, summarize, throwaway_cache, throwaway_database
+from Auth.models import CustomUser, ProviderProfile, Service
+from Auth.profiling import record_queries
+
+OTP = '123456'
+PASSWORD = 'loadtest-password-123'
+STEPS = ('signup', 'verify_otp', 'login', 'list_services', 'book_service', 'update_status')
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Recorder:
+    """
+    latency, query count and status of every request, grouped by step
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def request(self, step, client, method, path, expected, **kwargs):
+        with record_queries() as queries:
+            start = perf_counter()
+            response = getattr(client, method)(path, content_type='application/json', **kwargs)
+            took = perf_counter() - start
+        with self._lock:
+            self.latencies[step].append(took)
+            self.queries[step].append(queries.count)
+            self.statuses[step][response.status_code] += 1
+        if response.status_code != expected:
+            detail = response.content[:200].decode(errors='replace') if response.get('Content-Type') == 'application/json' else response.reason_phrase
+            raise StepFailed(f"{step} returned {response.status_code}: {detail}")
+        return response.json()
+
+    def report(self, elapsed):
+        steps = {}
+        for step in STEPS:
+            latencies = self.latencies.get(step)
+            if not latencies:
+                continue
+            queries = self.queries[step]
+            steps[step] = summarize(latencies, elapsed) | {
+                'queries_mean': round(sum(queries) / len(queries), 2),
+                'queries_max': max(queries),
+                'statuses': {str(code): count for code, count in sorted(self.statuses[step].items())},
+            }
+        return steps
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives concurrent user journeys (signup, verify-otp, login, list_services, book_service and the "
+        "provider's status update) against a throwaway database and cache and prints requests/sec, latency "
+        "percentiles and queries per endpoint as JSON. Pass a previous report with --baseline to see "
+        "the change per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help="journeys to run, one new user each")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--providers', type=int, default=10)
+        parser.add_argument('--services', type=int, default=10, help="services per provider")
+        parser.add_argument('--browse', type=int, default=3, help="list_services pages each user reads")
+        parser.add_argument('--fast-hashing', action='store_true',
+                            help="hash passwords with MD5 so the run measures the app rather than PBKDF2")
+        parser.add_argument('--output', help="also write the report to this file")
+        parser.add_argument('--baseline', help="a report from an earlier run to compare against")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline: {e}")
+
+        overrides = {}
+        if options['fast_hashing']:
+            overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+        # send_mock_otp logs every code, one line per journey
+        with override_settings(**overrides), throwaway_database(), throwaway_cache(), \
+                mock.patch('Auth.otp_service.secrets.randbelow', return_value=int(OTP) - 100000), \
+                mock.patch('Auth.otp_service.logger.disabled', True):
+            report = self.run(options)
+
+        if baseline:
+            report['compared_to'] = baseline.get('commit')
+            report['change'] = self.compare(baseline, report)
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def populate(self, providers, services):
+        password = make_password(PASSWORD)
+        users = CustomUser.objects.bulk_create(
+            CustomUser(email=f'loadtest-provider{i}@example.com', password=password, is_provider=True, is_verified=True)
+            for i in range(providers)
+        )
+        profiles = ProviderProfile.objects.bulk_create(ProviderProfile(user=user) for user in users)
+        created = Service.objects.bulk_create(
+            Service(name=f'Service {p}-{s}', description='load test service', price=100 + s, provider=profile)
+            for p, profile in enumerate(profiles) for s in range(services)
+        )
+        tokens = {profile.pk: str(RefreshToken.for_user(profile.user).access_token) for profile in profiles}
+        return [(str(service.pk), tokens[service.provider_id]) for service in created]
+
+    def run(self, options):
+        services = self.populate(options['providers'], options['services'])
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        recorder = Recorder()
+
+        def journey(i):
+            client = Client(raise_request_exception=False)
+            email = f'loadtest{i}@example.com'
+            recorder.request('signup', client, 'post', '/api/signup/', 201, data={
+                'email': email, 'phone_number': f'+9197{i:08d}',
+                'password': PASSWORD, 'password2': PASSWORD,
+            })
+            recorder.request('verify_otp', client, 'post', '/api/verify-otp/', 200, data={'email': email, 'otp': OTP})
+            access = recorder.request('login', client, 'post', '/api/login/', 200, data={
+                'email': email, 'password': PASSWORD,
+            })['data']['access']
+            auth = {'HTTP_AUTHORIZATION': f'Bearer {access}'}
+
+            path = '/api/list_services/'
+            for _ in range(options['browse']):
+                page = recorder.request('list_services', client, 'get', path, 200, **auth)
+                path = page.get('next') or '/api/list_services/'
+
+            # every journey books its own slot, so no request fails on capacity
+            service_id, provider_token = services[i % len(services)]
+            schedule = start + timedelta(hours=i // len(services))
+            booking = recorder.request('book_service', client, 'post', '/api/book_service/', 201, data={
+                'service': service_id, 'schedule': schedule.isoformat(),
+            }, **auth)
+            recorder.request('update_status', client, 'patch', f"/api/{booking['id']}/", 200, data={
+                'status': 'confirmed',
+            }, HTTP_AUTHORIZATION=f'Bearer {provider_token}')
+
+        latencies, elapsed, errors = run_concurrently(journey, options['users'], options['concurrency'])
+        return {
+            'commit': git_commit(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'users': options['users'],
+            'concurrency': options['concurrency'],
+            'journeys': summarize(latencies, elapsed) | {'errors': len(errors)},
+            'endpoints': recorder.report(elapsed),
+            'errors': sorted(set(errors))[:10],
+        }
+
+    def compare(self, baseline, report):
+        """
+        percent change per endpoint, positive rps and negative latency are better
+        """
+        change = {}
+        for step, current in report['endpoints'].items():
+            before = baseline.get('endpoints', {}).get(step)
+            if not before:
+                continue
+            change[step] = {
+                key: round((current[key] - before[key]) / before[key] * 100, 1)
+                for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_mean')
+                if before.get(key) and current.get(key) is not None
+            }
+        return change
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Auth.webhooks import process_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Applies queued payment webhook events to payments and bookings in batches. "
+        "Drains the queue and exits, or keeps polling with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.PAYMENT_WEBHOOK_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="keep polling for new events")
+        parser.add_argument('--interval', type=float, default=1.0, help="seconds to wait when the queue is empty")
+
+    def handle(self, *args, **options):
+        processed = 0
+        try:
+            while True:
+                count = process_batch(options['batch_size'])
+                processed += count
+                if count:
+                    self.stdout.write(f"Applied {count} events")
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} webhook events"))
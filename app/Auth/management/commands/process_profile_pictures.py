@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from Auth.images import is_processed, process_profile_picture
+from Auth.models import CustomerProfile, ProviderProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the resized WebP and JPEG variants of every profile picture that has none yet, for "
+        "pictures uploaded before processing existed or whose background run failed."
+    )
+
+    def handle(self, *args, **options):
+        for model in (ProviderProfile, CustomerProfile):
+            processed = failed = 0
+            profiles = model.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True)
+            for profile in profiles.only('profile_picture', 'picture_variants').iterator():
+                if is_processed(profile):
+                    continue
+                if process_profile_picture(model, profile.pk) is None:
+                    failed += 1
+                else:
+                    processed += 1
+            self.stdout.write(f"{model.__name__}: processed {processed}, failed {failed}")
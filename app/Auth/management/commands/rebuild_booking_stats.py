@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+from Auth.models import Booking, ProviderBookingStats
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per provider, day and status booking rollup from the Booking table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', type=int, help="only rebuild the rows of this provider profile id")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        bookings = Booking.objects.all()
+        stats = ProviderBookingStats.objects.all()
+        if options['provider']:
+            bookings = bookings.filter(service__provider_id=options['provider'])
+            stats = stats.filter(provider_id=options['provider'])
+
+        rows = (
+            bookings
+            .annotate(day=TruncDate('schedule'))
+            .values('service__provider_id', 'day', 'status')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+
+        with transaction.atomic():
+            stats.delete()
+            batch = []
+            written = 0
+            for row in rows.iterator():
+                batch.append(ProviderBookingStats(
+                    provider_id=row['service__provider_id'],
+                    day=row['day'],
+                    status=row['status'],
+                    count=row['total'],
+                ))
+                if len(batch) >= options['batch_size']:
+                    ProviderBookingStats.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            ProviderBookingStats.objects.bulk_create(batch)
+            written += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} booking stats rows"))
@@ -0,0 +1,98 @@
+import base64
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    answers POST /v1/orders like the Razorpay orders API does
+    """
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    failure_rate = 0.0
+    quiet = True
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting, as clients under test are meant to
+            self.close_connection = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.path.rstrip('/') not in ('/v1/orders', '/orders'):
+            return self.send_json(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The requested URL was not found on the server.'}})
+        auth = self.headers.get('Authorization', '')
+        if not auth.startswith('Basic ') or ':' not in base64.b64decode(auth[6:]).decode(errors='ignore'):
+            return self.send_json(401, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Authentication failed'}})
+        if self.failure_rate and random.random() < self.failure_rate:
+            return self.send_json(503, {'error': {'code': 'SERVER_ERROR', 'description': 'Service unavailable'}})
+        try:
+            data = json.loads(raw or b'{}')
+            amount = int(data['amount'])
+        except (ValueError, KeyError, TypeError):
+            return self.send_json(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The amount field is required.'}})
+        if amount < 100:
+            return self.send_json(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Order amount less than minimum amount allowed'}})
+
+        self.send_json(200, {
+            'id': f"order_{uuid.uuid4().hex[:14]}",
+            'entity': 'order',
+            'amount': amount,
+            'amount_paid': 0,
+            'amount_due': amount,
+            'currency': data.get('currency', 'INR'),
+            'receipt': data.get('receipt'),
+            'status': 'created',
+            'attempts': 0,
+            'created_at': int(time.time()),
+        })
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a local Razorpay compatible orders API for offline load tests. "
+        "Start it and set RAZORPAY_API_BASE=http://127.0.0.1:<port>/v1"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.05, help="seconds added to every response")
+        parser.add_argument('--failure-rate', type=float, default=0.0, help="share of orders answered with a 503")
+        parser.add_argument('--verbose-requests', action='store_true')
+
+    def handle(self, *args, **options):
+        handler = type('Handler', (StubHandler,), {
+            'latency': options['latency'],
+            'failure_rate': options['failure_rate'],
+            'quiet': not options['verbose_requests'],
+        })
+        server = ThreadingHTTPServer((options['host'], options['port']), handler)
+        server.daemon_threads = True
+        self.stdout.write(f"Payment stub listening on http://{options['host']}:{options['port']}/v1")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
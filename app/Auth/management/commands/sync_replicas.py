@@ -0,0 +1,49 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the SQLite primary into every replica in DATABASE_REPLICAS with the online backup API, "
+        "standing in for replication when testing the primary/replica router locally. With --loop the "
+        "copy repeats every --interval seconds, which is the replication lag the router has to hide."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="keep copying")
+        parser.add_argument('--interval', type=float, default=2.0, help="seconds between copies")
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured, set DATABASE_REPLICAS")
+        primary = connections['default'].settings_dict
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError("Only SQLite replicas can be copied, other backends replicate themselves")
+
+        try:
+            while True:
+                started = time.perf_counter()
+                for alias in settings.DATABASE_REPLICAS:
+                    self.copy(primary['NAME'], connections[alias].settings_dict['NAME'])
+                self.stdout.write(
+                    f"Copied the primary to {len(settings.DATABASE_REPLICAS)} replicas in {time.perf_counter() - started:.2f}s"
+                )
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def copy(self, source, target):
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(target)
+        try:
+            # a consistent snapshot even while the primary takes writes
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
@@ -0,0 +1,198 @@
+"""
+serves MEDIA_ROOT. files are streamed in chunks through FileResponse, which
+the WSGI server can turn into sendfile(), with strong validators so clients
+revalidate with a 304 and byte ranges so documents can be resumed or read in
+parts. with settings.MEDIA_ACCEL_REDIRECT set the file itself is left to a
+fronting nginx through X-Accel-Redirect.
+
+pictures are public. provider documents are only served to the provider they
+belong to and to staff, never cached by shared caches, and everything else
+under MEDIA_ROOT is not served at all
+"""
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedJWTAuthentication
+from .models import ProviderProfile
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# content hash names never change, see Auth/images.py
+IMMUTABLE_PREFIXES = ('images/',)
+PUBLIC_PREFIXES = ('images/', 'provider_pictures/', 'customer_pictures/')
+DOCUMENT_PREFIXES = ('provider_documents/',)
+PRIVATE_CACHE_CONTROL = 'private, no-store'
+
+authenticator = CachedJWTAuthentication()
+
+
+def etag_for(st):
+    # changes whenever the file is replaced or rewritten
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single byte range, end inclusive. None for a header to
+    ignore, which is answered with the whole file, and ValueError for a range
+    outside the file
+    """
+    match = _RANGE.match(header.replace(' ', ''))
+    if not match:
+        # several ranges at once, or another unit
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # the last N bytes
+        length = int(last)
+        if not length:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def if_range_matches(request, etag, mtime):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    modified = parse_http_date_safe(if_range)
+    return modified is not None and int(mtime) <= modified
+
+
+def read_range(path, start, length, chunk_size):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def media_user(request):
+    """
+    the session user, for staff in the admin, or the user of a bearer token
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    try:
+        result = authenticator.authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def can_read_document(request, path):
+    user = media_user(request)
+    if user is None:
+        return False
+    if user.is_staff:
+        return True
+    # the stored name is the path, for chunked uploads and older ones alike
+    return ProviderProfile.objects.filter(user=user, documents=path).exists()
+
+
+@require_safe
+def serve_media(request, path):
+    # images/../provider_documents/ is a document
+    path = posixpath.normpath(path)
+    if path.startswith(PUBLIC_PREFIXES):
+        cache_control = (
+            'public, max-age=31536000, immutable' if path.startswith(IMMUTABLE_PREFIXES)
+            else getattr(settings, 'MEDIA_CACHE_CONTROL', 'public, max-age=3600')
+        )
+    elif path.startswith(DOCUMENT_PREFIXES) and can_read_document(request, path):
+        cache_control = PRIVATE_CACHE_CONTROL
+    else:
+        # whether a private file exists is not given away either
+        raise Http404("File not found")
+    return send_file(request, path, cache_control)
+
+
+def send_file(request, path, cache_control):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        st = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404("File not found")
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404("File not found")
+
+    etag = etag_for(st)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(st.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': cache_control,
+    }
+    # 304 for a matching If-None-Match/If-Modified-Since, 412 for a failed If-Match
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    if encoding or not content_type:
+        # a .gz is sent as is, a Content-Encoding would have clients unpack it
+        content_type = 'application/octet-stream'
+
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT', '')
+    if accel_prefix:
+        # nginx answers ranges and sends the file from an internal location,
+        # documents get here only once the check above passed
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(path)
+        return response
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header and if_range_matches(request, etag, st.st_mtime):
+        try:
+            byte_range = parse_range(range_header, st.st_size)
+        except ValueError:
+            response = HttpResponse(status=416, headers=headers)
+            response['Content-Range'] = f'bytes */{st.st_size}'
+            return response
+
+    chunk_size = getattr(settings, 'MEDIA_CHUNK_SIZE', 64 * 1024)
+    if byte_range is None:
+        status, start, length = 200, 0, st.st_size
+    else:
+        status, start, length = 206, byte_range[0], byte_range[1] - byte_range[0] + 1
+        headers['Content-Range'] = f'bytes {byte_range[0]}-{byte_range[1]}/{st.st_size}'
+
+    if request.method == 'HEAD':
+        response = HttpResponse(status=status, content_type=content_type, headers=headers)
+    elif status == 200:
+        # a real file object, so the server's wsgi.file_wrapper can sendfile() it
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type, headers=headers)
+        response.block_size = chunk_size
+    else:
+        response = StreamingHttpResponse(
+            read_range(full_path, start, length, chunk_size), status=status, content_type=content_type, headers=headers,
+        )
+    response['Content-Length'] = str(length)
+    return response
@@ -0,0 +1,156 @@
+"""
+in process request metrics, rendered in the Prometheus text format by the
+/metrics view. every worker process keeps its own counts, Prometheus is
+expected to scrape each worker and sum them.
+
+the view answers staff sessions and requests with the METRICS_TOKEN bearer
+token, which is what a scraper is configured with
+"""
+import bisect
+import hmac
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+from .log import QueuedFileHandler
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RouteHistogram:
+    """
+    cumulative histogram of request durations, one per method and route
+    """
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, size):
+        # one slot per bucket plus +Inf
+        self.counts = [0] * (size + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def quantile(self, q, buckets):
+        """
+        estimated like PromQL's histogram_quantile: linear within the bucket
+        the rank falls in
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(buckets):
+                    # +Inf bucket, the best answer is the largest finite bound
+                    return buckets[-1]
+                lower = buckets[i - 1] if i else 0.0
+                return lower + (buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return buckets[-1]
+
+
+class RequestMetrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.histograms = {}
+        self.statuses = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def observe(self, method, route, status, duration):
+        index = bisect.bisect_left(self.buckets, duration)
+        with self._lock:
+            histogram = self.histograms.get((method, route))
+            if histogram is None:
+                histogram = self.histograms[(method, route)] = RouteHistogram(len(self.buckets))
+            histogram.counts[index] += 1
+            histogram.sum += duration
+            histogram.count += 1
+            self.statuses[(method, route, status)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {
+                key: (list(h.counts), h.sum, h.count, {q: h.quantile(q, self.buckets) for q in QUANTILES})
+                for key, h in self.histograms.items()
+            }
+            return histograms, dict(self.statuses)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.statuses.clear()
+
+    def render(self):
+        histograms, statuses = self.snapshot()
+        lines = [
+            '# HELP http_requests_total Requests handled, by method, route and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (method, route, status), count in sorted(statuses.items()):
+            lines.append(f'http_requests_total{{{_labels(method=method, route=route, status=status)}}} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Request latency, by method and route.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (method, route), (counts, total, count, _) in sorted(histograms.items()):
+            labels = _labels(method=method, route=route)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {total:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {count}')
+
+        lines += [
+            '# HELP http_request_duration_quantile_seconds p50, p95 and p99 latency estimated from the histogram.',
+            '# TYPE http_request_duration_quantile_seconds gauge',
+        ]
+        for (method, route), (_, _, _, quantiles) in sorted(histograms.items()):
+            labels = _labels(method=method, route=route)
+            for q, value in quantiles.items():
+                lines.append(f'http_request_duration_quantile_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+
+        lines += [
+            '# HELP log_records_dropped_total Log records dropped because the log queue was full.',
+            '# TYPE log_records_dropped_total counter',
+            f'log_records_dropped_total {dropped_log_records()}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def dropped_log_records():
+    handlers = {handler for name in ('', 'api_logger', 'django') for handler in logging.getLogger(name).handlers}
+    return sum(handler.dropped for handler in handlers if isinstance(handler, QueuedFileHandler))
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = RequestMetrics(getattr(settings, 'METRICS_LATENCY_BUCKETS', DEFAULT_BUCKETS))
+    return _metrics
+
+
+def can_read_metrics(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return True
+    return request.user.is_staff
@@ -1,25 +1,68 @@
 import logging
 import time
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import SimpleLazyObject, empty
+
+from .metrics import get_metrics
+
 logger = logging.getLogger('api_logger')
 
 class APILoggingMiddleware:
+    # async capable so ASGI requests to async views stay on the event loop
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        start_time = time.time()
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start_time = time.perf_counter()
 
         response = self.get_response(request)
 
-        duration = time.time() - start_time
-        user = getattr(request, 'user', None)
-        username = user.username if user and user.is_authenticated else 'Anonymous'
-
-        logger.info(
-            f'{request.method} {request.get_full_path()} '
-            f'Status: {response.status_code} '
-            f'User: {username} '
-            f'Duration: {duration:.3f}s'
-        )
+        self.log(request, response, time.perf_counter() - start_time)
         return response
+
+    async def __acall__(self, request):
+        start_time = time.perf_counter()
+
+        response = await self.get_response(request)
+
+        duration = time.perf_counter() - start_time
+        self.log(request, response, duration, await self.auser(request))
+        return response
+
+    @staticmethod
+    async def auser(request):
+        user = getattr(request, 'user', None)
+        # the lazy session user queries when first touched, which the event
+        # loop must not do. a user set by the view is already resolved
+        if isinstance(user, SimpleLazyObject) and user._wrapped is empty and hasattr(request, 'auser'):
+            return await request.auser()
+        return user
+
+    def log(self, request, response, duration, user=None):
+        # the route pattern rather than the path keeps the label set bounded
+        match = request.resolver_match
+        route = match.route if match else 'unmatched'
+        get_metrics().observe(request.method, route, response.status_code, duration)
+
+        if user is None:
+            user = getattr(request, 'user', None)
+        # CustomUser has no username, accounts are logged by their id
+        user_id = str(user.pk) if user and user.is_authenticated else 'Anonymous'
+
+        # written as JSON by the queued file handler in settings.LOGGING
+        logger.info('request', extra={
+            'method': request.method,
+            'path': request.get_full_path(),
+            'route': route,
+            'status': response.status_code,
+            'user': user_id,
+            'duration_ms': round(duration * 1000, 3),
+        })
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:37
+
+from django.db import migrations, models
+
+from Auth.search import create_index, drop_index, fts_available
+
+
+def create_fts_index(apps, schema_editor):
+    if fts_available(schema_editor.connection):
+        create_index(schema_editor.connection)
+
+
+def drop_fts_index(apps, schema_editor):
+    if fts_available(schema_editor.connection):
+        drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Auth', '0005_service_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['price'], name='service_price_idx'),
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_schedule_end(apps, schema_editor):
+    Booking = apps.get_model('Auth', 'Booking')
+    bookings = Booking.objects.select_related('service').filter(schedule_end__isnull=True)
+    for booking in bookings.iterator():
+        booking.schedule_end = booking.schedule + timedelta(minutes=booking.service.duration)
+        booking.save(update_fields=['schedule_end'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Auth', '0006_service_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='duration',
+            field=models.PositiveIntegerField(default=60, verbose_name='duration in minutes'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='capacity',
+            field=models.PositiveIntegerField(default=1, verbose_name='bookings per slot'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='schedule_end',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(backfill_schedule_end, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='booking',
+            name='schedule_end',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['service', 'schedule', 'schedule_end'], name='booking_service_slot_idx'),
+        ),
+    ]
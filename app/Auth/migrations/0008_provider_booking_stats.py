@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_stats(apps, schema_editor):
+    # the receivers only count changes from here on, existing bookings are
+    # counted once now. a status change of an uncounted booking would
+    # otherwise decrement a row that was never there
+    Booking = apps.get_model('Auth', 'Booking')
+    ProviderBookingStats = apps.get_model('Auth', 'ProviderBookingStats')
+    rows = (
+        Booking.objects
+        .annotate(day=TruncDate('schedule'))
+        .values('service__provider_id', 'day', 'status')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    ProviderBookingStats.objects.bulk_create(
+        (ProviderBookingStats(provider_id=row['service__provider_id'], day=row['day'], status=row['status'], count=row['total'])
+         for row in rows.iterator()),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Auth', '0007_service_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderBookingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('cancelled', 'Cancelled'), ('completed', 'Completed')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_stats', to='Auth.providerprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('provider', 'day', 'status'), name='unique_provider_day_status')],
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:43
+
+import phonenumber_field.modelfields
+from django.db import migrations
+from django.db.models import Count
+
+
+def check_duplicate_phone_numbers(apps, schema_editor):
+    # the unique index cannot be built over duplicates. which account keeps a
+    # shared number is for whoever runs the migration to decide, nothing is
+    # cleared here
+    CustomUser = apps.get_model('Auth', 'CustomUser')
+    # blank numbers would collide as well, they mean no number
+    CustomUser.objects.filter(phone_number='').update(phone_number=None)
+    duplicates = (
+        CustomUser.objects.exclude(phone_number=None)
+        .values('phone_number').annotate(total=Count('id')).filter(total__gt=1)
+        .order_by('phone_number').values_list('phone_number', flat=True)
+    )
+    lines = []
+    for phone_number in duplicates:
+        emails = CustomUser.objects.filter(phone_number=phone_number).order_by('email').values_list('email', flat=True)
+        lines.append(f"  {phone_number}: {', '.join(emails)}")
+    if lines:
+        raise RuntimeError(
+            "Phone numbers must be unique before this migration can run. Change or clear the number "
+            "of all but one account for each of these and run it again:\n" + '\n'.join(lines)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Auth', '0008_provider_booking_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_phone_numbers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='customuser',
+            name='phone_number',
+            field=phonenumber_field.modelfields.PhoneNumberField(blank=True, max_length=128, null=True, region=None, unique=True, verbose_name='phone number'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Auth', '0011_payment_webhooks'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['customer', 'schedule'], name='booking_customer_schedule_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['service', 'status', 'schedule'], name='booking_service_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['provider', 'created_at'], name='service_provider_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Auth', '0012_booking_access_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerprofile',
+            name='picture_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='picture variants'),
+        ),
+        migrations.AddField(
+            model_name='providerprofile',
+            name='picture_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='picture variants'),
+        ),
+    ]
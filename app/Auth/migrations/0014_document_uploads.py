@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:08
+
+import Auth.models
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Auth', '0013_profile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='providerprofile',
+            name='documents',
+            field=models.FileField(blank=True, max_length=255, null=True, upload_to='provider_documents/', validators=[Auth.models.validate_document_size], verbose_name='documents'),
+        ),
+        migrations.CreateModel(
+            name='DocumentUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField(verbose_name='size in bytes')),
+                ('checksum', models.CharField(blank=True, default='', max_length=64)),
+                ('offset', models.PositiveBigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('uploading', 'Uploading'), ('complete', 'Complete'), ('failed', 'Failed')], default='uploading', max_length=20)),
+                ('error', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='Auth.providerprofile')),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:27
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def fix_zero_values(apps, schema_editor):
+    # rows written before the validators existed would fail the constraints.
+    # they get the field defaults, a zero duration hung the slot listing
+    Service = apps.get_model('Auth', 'Service')
+    Service.objects.filter(duration=0).update(duration=60)
+    Service.objects.filter(capacity=0).update(capacity=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Auth', '0014_document_uploads'),
+    ]
+
+    operations = [
+        migrations.RunPython(fix_zero_values, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='service',
+            name='capacity',
+            field=models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)], verbose_name='bookings per slot'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='duration',
+            field=models.PositiveIntegerField(default=60, validators=[django.core.validators.MinValueValidator(1)], verbose_name='duration in minutes'),
+        ),
+        migrations.AddConstraint(
+            model_name='service',
+            constraint=models.CheckConstraint(condition=models.Q(('duration__gte', 1)), name='service_duration_positive'),
+        ),
+        migrations.AddConstraint(
+            model_name='service',
+            constraint=models.CheckConstraint(condition=models.Q(('capacity__gte', 1)), name='service_capacity_positive'),
+        ),
+    ]
@@ -2,18 +2,36 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from phonenumber_field.modelfields import PhoneNumberField
 from django.utils.translation import gettext_lazy as _
+import logging
 import uuid
+from datetime import timedelta
 from django.contrib.auth.models import BaseUserManager
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction, IntegrityError
+from django.db.models import F
+from collections import Counter
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
 from django.utils import timezone
+from django.conf import settings
+from .cache import invalidate_catalog, invalidate_cached_user
+from .search import index_service, unindex_service
+from .images import is_processed, schedule_processing
+
+logger = logging.getLogger(__name__)
 
 def validate_file_size(value):
         limit = 2 * 1024 * 1024  # 2 MB
         if value.size > limit:
             raise ValidationError('File too large. Size should not exceed 2 MiB.')
 
+def validate_document_size(value):
+    # documents arrive through the chunked upload API, see Auth/uploads.py
+    limit = settings.UPLOAD_MAX_SIZE
+    if value.size > limit:
+        raise ValidationError(f'File too large. Size should not exceed {limit // (1024 * 1024)} MiB.')
+
 # Create your models here.
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, phone_number, password=None, **extra_fields):
@@ -44,7 +62,7 @@ class CustomUser(AbstractUser):
     username = None
     id = models.UUIDField(_("id"), primary_key = True, editable=False, unique=True, default=uuid.uuid4)
     email = models.EmailField(_("email address"), unique=True)
-    phone_number = PhoneNumberField(_("phone number"), null=True, blank=True)
+    phone_number = PhoneNumberField(_("phone number"), null=True, blank=True, unique=True)
     is_provider = models.BooleanField(_("is verified"), default=False)
     is_verified = models.BooleanField(_("is verified"), default=False)
     created_at = models.DateTimeField(_("created at"), auto_now_add=True)
@@ -76,7 +94,9 @@ class ProviderProfile(models.Model):
     last_name = models.CharField(_("last name"), max_length=30, blank=True, null=True)
     address = models.CharField(_("address"), max_length=255, blank=True, null=True)
     profile_picture = models.ImageField(_("profile picture"), upload_to='provider_pictures/', blank=True, null=True, validators=[validate_file_size])
-    documents = models.FileField(_("documents"), upload_to='provider_documents/', blank=True, null=True, validators=[validate_file_size])
+    # resized WebP and JPEG copies of the picture, written by Auth/images.py
+    picture_variants = models.JSONField(_("picture variants"), default=dict, blank=True, editable=False)
+    documents = models.FileField(_("documents"), upload_to='provider_documents/', max_length=255, blank=True, null=True, validators=[validate_document_size])
 
     def __str__(self):
         return f"{self.user.email} - Provider Profile"
@@ -91,6 +111,7 @@ class CustomerProfile(models.Model):
     last_name = models.CharField(_("last name"), max_length=30, blank=True, null=True)
     address = models.CharField(_("address"), max_length=255, blank=True, null=True)
     profile_picture = models.ImageField(_("profile picture"), upload_to='customer_pictures/', blank=True, null=True, validators=[validate_file_size])
+    picture_variants = models.JSONField(_("picture variants"), default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.user.email} - Customer Profile"
@@ -112,13 +133,33 @@ class Service(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     provider = models.ForeignKey(ProviderProfile, on_delete=models.CASCADE, related_name='services')
+    # a zero length slot would never end the slot listing loop in slots.py
+    duration = models.PositiveIntegerField(_("duration in minutes"), default=60, validators=[MinValueValidator(1)])
+    capacity = models.PositiveIntegerField(_("bookings per slot"), default=1, validators=[MinValueValidator(1)])
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # backs the keyset pagination of the service catalog
+            models.Index(fields=['-created_at', '-id'], name='service_created_id_idx'),
+            models.Index(fields=['price'], name='service_price_idx'),
+            # a provider's services, newest first, and the join from a provider to its bookings
+            models.Index(fields=['provider', 'created_at'], name='service_provider_created_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(duration__gte=1), name='service_duration_positive'),
+            models.CheckConstraint(condition=models.Q(capacity__gte=1), name='service_capacity_positive'),
+        ]
+
 
     def __str__(self):
         return f"{self.name} - {self.provider.first_name}"
 
+    @property
+    def slot_length(self):
+        return timedelta(minutes=self.duration)
+
 
 
 class Booking(models.Model):
@@ -128,15 +169,40 @@ class Booking(models.Model):
         ('cancelled', 'Cancelled'),
         ('completed', 'Completed'),
     ]
+    # statuses that hold a slot
+    ACTIVE_STATUSES = ('pending', 'confirmed')
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     customer = models.ForeignKey(CustomerProfile, on_delete=models.CASCADE, related_name='bookings')
     service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='bookings')
     schedule = models.DateTimeField()
+    schedule_end = models.DateTimeField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # interval lookups: service = ? AND schedule < end AND schedule_end > start
+            models.Index(fields=['service', 'schedule', 'schedule_end'], name='booking_service_slot_idx'),
+            # a customer's bookings in schedule order
+            models.Index(fields=['customer', 'schedule'], name='booking_customer_schedule_idx'),
+            # a service's bookings in one status, e.g. the pending ones in a date range
+            models.Index(fields=['service', 'status', 'schedule'], name='booking_service_status_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so the stats rollup can tell what a save changed
+        instance._loaded_state = (instance.__dict__.get('status'), instance.__dict__.get('schedule'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.schedule_end is None:
+            self.schedule_end = self.schedule + self.service.slot_length
+        super().save(*args, **kwargs)
+
     def clean(self):
         if self.schedule < timezone.now():
             raise ValidationError("Booking time must be in the future.")
@@ -145,3 +211,195 @@ class Booking(models.Model):
     def __str__(self):
         return f"Booking by {self.customer.first_name} for {self.service.name}"
 
+
+class ProviderBookingStats(models.Model):
+    """
+    number of bookings per provider, day of schedule and status, kept up to
+    date as bookings are created and change status
+    """
+    provider = models.ForeignKey(ProviderProfile, on_delete=models.CASCADE, related_name='booking_stats')
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'day', 'status'], name='unique_provider_day_status'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider_id} {self.day} {self.status}: {self.count}"
+
+    @staticmethod
+    def day_of(schedule):
+        return timezone.localtime(schedule).date()
+
+    @classmethod
+    def bump(cls, provider_id, day, status, delta):
+        """
+        moves a count by delta. a decrement that finds no row or would take
+        the count below zero means the rollup has drifted from the bookings,
+        it is dropped and logged, rebuild_booking_stats recounts
+        """
+        rows = cls.objects.filter(provider_id=provider_id, day=day, status=status)
+        if delta < 0:
+            if not rows.filter(count__gte=-delta).update(count=F('count') + delta):
+                logger.warning(
+                    "Booking stats of provider %s on %s are short of %d %s bookings, run rebuild_booking_stats",
+                    provider_id, day, -delta, status,
+                )
+            return
+        if rows.update(count=F('count') + delta) or not delta:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(provider_id=provider_id, day=day, status=status, count=delta)
+        except IntegrityError:
+            # another writer created the row first
+            rows.update(count=F('count') + delta)
+
+    @classmethod
+    def record_bookings(cls, bookings, delta=1):
+        """
+        counts bookings written without signals, e.g. with bulk_create. each
+        booking must have its service loaded
+        """
+        counts = Counter(
+            (booking.service.provider_id, cls.day_of(booking.schedule), booking.status)
+            for booking in bookings
+        )
+        for (provider_id, day, status), count in counts.items():
+            cls.bump(provider_id, day, status, count * delta)
+
+
+class Payment(models.Model):
+    """
+    a gateway order and what happened to it. created with the order, moved
+    forward by webhook events
+    """
+    STATUS_CHOICES = [
+        ('created', 'Created'),
+        ('authorized', 'Authorized'),
+        ('captured', 'Captured'),
+        ('failed', 'Failed'),
+        ('refunded', 'Refunded'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    order_id = models.CharField(max_length=64, unique=True)
+    payment_id = models.CharField(max_length=64, blank=True, null=True)
+    booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, blank=True, null=True, related_name='payments')
+    amount = models.PositiveIntegerField(_("amount in paise"))
+    currency = models.CharField(max_length=3, default='INR')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='created')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.order_id} {self.status}"
+
+
+class DocumentUpload(models.Model):
+    """
+    a resumable upload of a provider's documents. chunks are appended to a
+    partial file at `offset` until it reaches `size`, then the file is moved
+    into place and set as the provider's documents
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    provider = models.ForeignKey(ProviderProfile, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(_("size in bytes"))
+    # SHA-256 of the whole file, checked before it is moved into place
+    checksum = models.CharField(max_length=64, blank=True, default='')
+    offset = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    error = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} {self.offset}/{self.size}"
+
+
+class PaymentWebhookEvent(models.Model):
+    """
+    webhook deliveries waiting to be applied. the gateway retries deliveries,
+    event_id makes the retries no-ops
+    """
+    event_id = models.CharField(max_length=64, unique=True)
+    event = models.CharField(max_length=64)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    error = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # the worker only ever scans the unprocessed tail of the queue
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='webhook_event_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_id} {self.event}"
+
+
+
+
+@receiver([post_save, post_delete], sender=Service)
+@receiver([post_save, post_delete], sender=ProviderProfile)
+def invalidate_service_catalog(sender, instance, **kwargs):
+    # provider details are nested in every cached service, so both invalidate
+    transaction.on_commit(invalidate_catalog)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+@receiver([post_save, post_delete], sender=CustomerProfile)
+@receiver([post_save, post_delete], sender=ProviderProfile)
+def invalidate_authenticated_user(sender, instance, **kwargs):
+    user_id = instance.pk if sender is CustomUser else instance.user_id
+    transaction.on_commit(lambda: invalidate_cached_user(user_id))
+
+
+@receiver(post_save, sender=CustomerProfile)
+@receiver(post_save, sender=ProviderProfile)
+def process_profile_picture_upload(sender, instance, raw=False, **kwargs):
+    # a new upload still has its uploaded name, processing renames it
+    if raw or not instance.profile_picture or is_processed(instance):
+        return
+    schedule_processing(sender, instance.pk)
+
+
+@receiver(post_save, sender=Service)
+def update_search_index(sender, instance, **kwargs):
+    index_service(instance)
+
+
+@receiver(post_delete, sender=Service)
+def remove_from_search_index(sender, instance, **kwargs):
+    unindex_service(instance)
+
+
+@receiver(post_save, sender=Booking)
+def update_booking_stats(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    status, schedule = getattr(instance, '_loaded_state', (None, None))
+    if not created and (status, schedule) == (instance.status, instance.schedule):
+        return
+    provider_id = instance.service.provider_id
+    if not created and status is not None:
+        ProviderBookingStats.bump(provider_id, ProviderBookingStats.day_of(schedule), status, -1)
+    ProviderBookingStats.bump(provider_id, ProviderBookingStats.day_of(instance.schedule), instance.status, 1)
+    instance._loaded_state = (instance.status, instance.schedule)
+
+
+@receiver(post_delete, sender=Booking)
+def remove_booking_stats(sender, instance, **kwargs):
+    status, schedule = getattr(instance, '_loaded_state', (instance.status, instance.schedule))
+    ProviderBookingStats.bump(instance.service.provider_id, ProviderBookingStats.day_of(schedule), status, -1)
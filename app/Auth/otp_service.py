@@ -1,12 +1,118 @@
-from random import randint
+import hmac
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class CacheOTPStore:
+    """
+    keeps OTPs in the configured cache so every worker sees the same codes.
+    entries expire after the TTL and are dropped after too many wrong attempts
+    """
+
+    def __init__(self, alias='default', ttl=300, max_attempts=5):
+        self.alias = alias
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _keys(self, email):
+        email = email.lower()
+        return f"otp:{email}", f"otp:attempts:{email}"
+
+    def put(self, email, otp):
+        otp_key, attempts_key = self._keys(email)
+        self.cache.set_many({otp_key: otp, attempts_key: 0}, timeout=self.ttl)
+
+    def verify(self, email, otp):
+        otp_key, attempts_key = self._keys(email)
+        expected = self.cache.get(otp_key)
+        if expected is None:
+            return False
+        if hmac.compare_digest(str(expected), str(otp)):
+            self.cache.delete_many([otp_key, attempts_key])
+            return True
+        try:
+            attempts = self.cache.incr(attempts_key)
+        except ValueError:
+            attempts = self.max_attempts
+        if attempts >= self.max_attempts:
+            self.cache.delete_many([otp_key, attempts_key])
+        return False
+
+
+class MemoryOTPStore:
+    """
+    process local LRU store for single process deployments and tests. holds
+    at most max_entries codes, evicting the least recently issued first
+    """
+
+    def __init__(self, ttl=300, max_attempts=5, max_entries=10000):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, email, otp):
+        with self._lock:
+            self._entries[email.lower()] = [otp, time.monotonic() + self.ttl, 0]
+            self._entries.move_to_end(email.lower())
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def verify(self, email, otp):
+        email = email.lower()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return False
+            expected, expires_at, attempts = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[email]
+                return False
+            if hmac.compare_digest(str(expected), str(otp)):
+                del self._entries[email]
+                return True
+            entry[2] = attempts + 1
+            if entry[2] >= self.max_attempts:
+                del self._entries[email]
+            return False
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_otp_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                ttl = getattr(settings, 'OTP_TTL', 300)
+                max_attempts = getattr(settings, 'OTP_MAX_ATTEMPTS', 5)
+                if getattr(settings, 'OTP_STORE', 'cache') == 'memory':
+                    _store = MemoryOTPStore(ttl, max_attempts, getattr(settings, 'OTP_MEMORY_MAX_ENTRIES', 10000))
+                else:
+                    _store = CacheOTPStore(getattr(settings, 'OTP_CACHE_ALIAS', 'default'), ttl, max_attempts)
+    return _store
 
-OTP_STORE = {}
 
 def send_mock_otp(email):
-    otp = str(randint(100000, 999999))
-    OTP_STORE[email] = otp
-    print(f"Mock OTP for {email} is {otp}")
+    otp = f"{secrets.randbelow(900000) + 100000}"
+    get_otp_store().put(email, otp)
+    logger.info("Mock OTP for %s is %s", email, otp)
     return otp
 
 def verify_mock_otp(email, otp):
-    return OTP_STORE.get(email) == otp
\ No newline at end of file
+    return get_otp_store().verify(email, otp)
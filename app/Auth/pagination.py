@@ -0,0 +1,175 @@
+import base64
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(created_at, pk, reverse=False):
+    """
+    encodes a (created_at, id) position into an opaque url-safe cursor
+    """
+    raw = f"{'p' if reverse else 'n'}|{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    decodes a cursor back into (reverse, created_at, id)
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        direction, created_at, pk = raw.split('|', 2)
+        created_at = parse_datetime(created_at)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise NotFound("Invalid cursor")
+    if direction not in ('n', 'p') or created_at is None:
+        raise NotFound("Invalid cursor")
+    return direction == 'p', created_at, pk
+
+
+def keyset_slice(queryset, cursor=None, page_size=20):
+    """
+    narrows a queryset to the page after (or before) cursor, newest first on
+    (created_at, id). returns the sliced queryset and whether it walks
+    backwards. only page_size + 1 rows are fetched, so the cost does not
+    depend on how deep the client has paged
+    """
+    reverse = False
+    if cursor:
+        reverse, created_at, pk = decode_cursor(cursor)
+        # the redundant created_at bound is what lets the database seek the
+        # index to the cursor, it cannot seek on the OR alone
+        try:
+            if reverse:
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk),
+                    created_at__gte=created_at,
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk),
+                    created_at__lte=created_at,
+                )
+        except ValidationError:
+            raise NotFound("Invalid cursor")
+
+    ordering = ('created_at', 'id') if reverse else ('-created_at', '-id')
+    return queryset.order_by(*ordering)[:page_size + 1], reverse
+
+
+def _position(row):
+    # model instances, or values() rows from Auth/fast_serializers.py
+    if isinstance(row, dict):
+        return row['created_at'], row['id']
+    return row.created_at, row.pk
+
+
+def keyset_result(rows, reverse, cursor, page_size):
+    """
+    turns the rows fetched from keyset_slice into (rows, next_position,
+    previous_position). positions are (created_at, id) tuples or None
+    """
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if reverse:
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+
+    first = _position(rows[0])
+    last = _position(rows[-1])
+    if reverse:
+        return rows, last, first if has_more else None
+    return rows, last if has_more else None, first if cursor else None
+
+
+def keyset_page(queryset, cursor=None, page_size=20):
+    sliced, reverse = keyset_slice(queryset, cursor, page_size)
+    return keyset_result(list(sliced), reverse, cursor, page_size)
+
+
+async def akeyset_page(queryset, cursor=None, page_size=20):
+    sliced, reverse = keyset_slice(queryset, cursor, page_size)
+    return keyset_result([row async for row in sliced], reverse, cursor, page_size)
+
+
+def cursor_link(base_url, position, reverse, param='cursor'):
+    if position is None:
+        return None
+    return replace_query_param(base_url, param, encode_cursor(*position, reverse=reverse))
+
+
+class KeysetPagination(BasePagination):
+    """
+    cursor pagination on (created_at, id), newest first.
+
+    unlike offset pagination the page is located with an indexed range filter,
+    so latency stays flat however large the table grows. cursors are stable
+    under concurrent inserts since they point at a row position, not an offset.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+
+    def get_page_size(self, request):
+        # plain Django requests, as seen by the async views, have no query_params
+        params = getattr(request, 'query_params', request.GET)
+        try:
+            size = int(params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        cursor = request.query_params.get(self.cursor_query_param)
+        rows, self.next_position, self.previous_position = keyset_page(
+            queryset, cursor, self.get_page_size(request)
+        )
+        return rows
+
+    def _link(self, position, reverse):
+        return cursor_link(self.base_url, position, reverse, self.cursor_query_param)
+
+    def get_next_link(self):
+        return self._link(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        return self._link(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class SearchPagination(PageNumberPagination):
+    """
+    search results are ordered by relevance or price, which keyset pagination
+    on (created_at, id) cannot follow, so they are paged by number instead
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
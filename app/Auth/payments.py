@@ -0,0 +1,411 @@
+import asyncio
+import hashlib
+import hmac
+import random
+import threading
+import time
+import uuid
+import weakref
+from decimal import Decimal
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from .models import Booking, Payment
+
+
+class PaymentGatewayError(Exception):
+    pass
+
+
+class GatewayUnavailable(PaymentGatewayError):
+    """
+    the circuit breaker is open, the gateway is not being called at all
+    """
+
+
+def payment_signature(order_id, payment_id):
+    body = f"{order_id}|{payment_id}"
+    return hmac.new(
+        bytes(settings.RAZORPAY_KEY_SECRET, 'utf-8'),
+        bytes(body, 'utf-8'),
+        hashlib.sha256
+    ).hexdigest()
+
+
+def verify_payment_signature(order_id, payment_id, signature):
+    return hmac.compare_digest(payment_signature(order_id, payment_id), str(signature))
+
+
+def verify_webhook_signature(body, signature):
+    """
+    webhooks are signed over the raw request body with the webhook secret,
+    which is separate from the API key secret
+    """
+    secret = getattr(settings, 'RAZORPAY_WEBHOOK_SECRET', '')
+    if not secret or not signature:
+        return False
+    expected = hmac.new(bytes(secret, 'utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, str(signature))
+
+
+def order_data(amount):
+    """
+    razorpay takes amounts in paise
+    """
+    return {
+        'amount': int(Decimal(amount) * 100),
+        'currency': 'INR',
+        'payment_capture': '1',
+    }
+
+
+def _payable_bookings(user, booking_id):
+    """
+    the user's own pending booking, with its service for the price. the
+    amount is always taken from the service, never from the client
+    """
+    customer = getattr(user, 'customer_profile', None)
+    if customer is None or not booking_id:
+        return Booking.objects.none()
+    try:
+        return Booking.objects.select_related('service').filter(pk=booking_id, customer_id=customer.pk, status='pending')
+    except ValidationError:
+        return Booking.objects.none()
+
+
+def payable_booking(user, booking_id):
+    return _payable_bookings(user, booking_id).first()
+
+
+async def apayable_booking(user, booking_id):
+    return await _payable_bookings(user, booking_id).afirst()
+
+
+def _payment(gateway_order, order, booking_id):
+    return Payment(
+        order_id=gateway_order['id'],
+        booking_id=booking_id,
+        amount=order['amount'],
+        currency=order['currency'],
+    )
+
+
+def record_order(gateway_order, order, booking_id):
+    """
+    the Payment row webhook events for this order are applied to
+    """
+    payment = _payment(gateway_order, order, booking_id)
+    payment.save()
+    return payment
+
+
+async def arecord_order(gateway_order, order, booking_id):
+    payment = _payment(gateway_order, order, booking_id)
+    await payment.asave()
+    return payment
+
+
+class CircuitBreaker:
+    """
+    stops calling a failing gateway for reset_timeout seconds after
+    failure_threshold consecutive failures, then lets a single trial call
+    through to decide whether to close again
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        """
+        True when this call is the half-open trial, which the caller has to
+        end with end_trial() whatever happens
+        """
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self._trial_running):
+                raise GatewayUnavailable("Payment gateway is unavailable, try again later")
+            if state == 'half-open':
+                self._trial_running = True
+                return True
+            return False
+
+    def end_trial(self):
+        # a trial that ended without record_success/record_failure, e.g. it
+        # was cancelled, lets the next call be the trial
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class RetryableError(PaymentGatewayError):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# answers saying the request was turned away before it was acted on
+UNPROCESSED_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+def _never_sent(error):
+    """
+    True for failures to connect, the gateway cannot have seen the request
+    """
+    if isinstance(error, (requests.ConnectTimeout, httpx.ConnectError, httpx.ConnectTimeout)):
+        return True
+    if isinstance(error, requests.ConnectionError):
+        # a refused connection, as opposed to one dropped after sending
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+def _can_retry(method, error):
+    """
+    a POST is only sent again when the gateway cannot have acted on it. a
+    POST /orders repeated after a read timeout or a 500 could create a second
+    order for the same booking
+    """
+    if method in IDEMPOTENT_METHODS:
+        return True
+    if isinstance(error, RetryableError):
+        return error.status_code in UNPROCESSED_STATUSES
+    return _never_sent(error)
+
+
+class RazorpayGateway:
+    """
+    Razorpay orders API over a pooled HTTP session.
+
+    every call has an overall deadline of `timeout` seconds that covers all of
+    its attempts. failed attempts are retried up to `retries` times with full
+    jitter exponential backoff: for POST only a failure to connect, 429 and
+    503, which the gateway cannot have acted on, for other methods any request
+    that fails without a response (a timeout, a body cut off) and any 5xx as
+    well. other 4xx responses, and a success without an entity in its body,
+    are returned to the caller as errors right away. consecutive failed calls
+    open the circuit breaker, which then fails fast
+    """
+
+    def __init__(self, base_url, key_id, key_secret, timeout=10.0, connect_timeout=3.0,
+                 retries=2, backoff=0.2, pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.auth = (key_id, key_secret)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _delay(self, attempt, deadline):
+        delay = random.uniform(0, self.backoff * (2 ** attempt))
+        return min(delay, max(0.0, deadline - time.monotonic()))
+
+    def _check(self, status_code, payload):
+        if status_code in RETRY_STATUSES:
+            raise RetryableError(f"Payment gateway returned {status_code}", status_code)
+        if status_code >= 400:
+            description = payload.get('error', {}).get('description') if isinstance(payload, dict) else None
+            raise PaymentGatewayError(description or f"Payment gateway returned {status_code}")
+        # every Razorpay entity carries its id
+        if not isinstance(payload, dict) or 'id' not in payload:
+            raise PaymentGatewayError(f"Payment gateway returned {status_code} without an entity")
+        return payload
+
+    def create_order(self, data):
+        return self._call('POST', '/orders', data)
+
+    def _call(self, method, path, data):
+        trial = self.breaker.before_call()
+        try:
+            return self._call_with_retries(method, path, data)
+        finally:
+            if trial:
+                self.breaker.end_trial()
+
+    def _call_with_retries(self, method, path, data):
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise RetryableError("Payment gateway deadline exceeded")
+                response = self.session.request(
+                    method, f"{self.base_url}{path}", json=data,
+                    timeout=(min(self.connect_timeout, remaining), remaining),
+                )
+                try:
+                    payload = response.json()
+                except ValueError:
+                    payload = None
+                result = self._check(response.status_code, payload)
+            # any failure to get a whole response, e.g. a body cut off mid-stream
+            except (requests.RequestException, RetryableError) as e:
+                if attempt >= self.retries or deadline - time.monotonic() <= 0 or not _can_retry(method, e):
+                    self.breaker.record_failure()
+                    raise PaymentGatewayError(str(e)) from e
+                time.sleep(self._delay(attempt, deadline))
+                attempt += 1
+                continue
+            except PaymentGatewayError:
+                # the gateway answered, the request itself was refused
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def _async_client(self):
+        # an AsyncClient is bound to the event loop it was first used on
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                auth=self.auth,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def acreate_order(self, data):
+        return await self._acall('POST', '/orders', data)
+
+    async def _acall(self, method, path, data):
+        trial = self.breaker.before_call()
+        try:
+            return await self._acall_with_retries(method, path, data)
+        finally:
+            if trial:
+                self.breaker.end_trial()
+
+    async def _acall_with_retries(self, method, path, data):
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise RetryableError("Payment gateway deadline exceeded")
+                response = await self._async_client().request(
+                    method, f"{self.base_url}{path}", json=data,
+                    timeout=httpx.Timeout(remaining, connect=min(self.connect_timeout, remaining)),
+                )
+                try:
+                    payload = response.json()
+                except ValueError:
+                    payload = None
+                result = self._check(response.status_code, payload)
+            except (httpx.HTTPError, RetryableError) as e:
+                if attempt >= self.retries or deadline - time.monotonic() <= 0 or not _can_retry(method, e):
+                    self.breaker.record_failure()
+                    raise PaymentGatewayError(str(e)) from e
+                await asyncio.sleep(self._delay(attempt, deadline))
+                attempt += 1
+                continue
+            except PaymentGatewayError:
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return result
+
+
+class StubGateway:
+    """
+    in-process gateway that never leaves the machine, for tests and offline
+    load tests. latency simulates the round trip to the gateway
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def _order(self, data):
+        return {
+            'id': f"order_{uuid.uuid4().hex[:14]}",
+            'entity': 'order',
+            'amount': data['amount'],
+            'currency': data.get('currency', 'INR'),
+            'status': 'created',
+            'created_at': int(time.time()),
+        }
+
+    def create_order(self, data):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._order(data)
+
+    async def acreate_order(self, data):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._order(data)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """
+    the process wide gateway selected by settings.PAYMENT_GATEWAY, built once
+    so its connection pool and circuit breaker are shared by all requests
+    """
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                if getattr(settings, 'PAYMENT_GATEWAY', 'razorpay') == 'stub':
+                    _gateway = StubGateway(latency=getattr(settings, 'PAYMENT_STUB_LATENCY', 0.0))
+                else:
+                    _gateway = RazorpayGateway(
+                        settings.RAZORPAY_API_BASE,
+                        settings.RAZORPAY_KEY_ID,
+                        settings.RAZORPAY_KEY_SECRET,
+                        timeout=settings.PAYMENT_GATEWAY_TIMEOUT,
+                        connect_timeout=settings.PAYMENT_GATEWAY_CONNECT_TIMEOUT,
+                        retries=settings.PAYMENT_GATEWAY_RETRIES,
+                        pool_size=settings.PAYMENT_GATEWAY_POOL_SIZE,
+                        breaker=CircuitBreaker(
+                            settings.PAYMENT_BREAKER_THRESHOLD,
+                            settings.PAYMENT_BREAKER_RESET_TIMEOUT,
+                        ),
+                    )
+    return _gateway
@@ -0,0 +1,199 @@
+"""
+opt in SQL profiling. QueryRecorder is installed as an execute wrapper on
+every database connection for the length of a request (or a test block) and
+records each query under a fingerprint with its literals removed, so the same
+statement run in a loop stands out
+"""
+import logging
+import os
+import re
+import time
+import traceback
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('sql_profiler')
+
+PROFILE_HEADER = 'X-SQL-Profile'
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \((?:\s*(?:%s|\?)\s*,?)+\)", re.IGNORECASE)
+_SAVEPOINT = re.compile(r'"s\d+_x\d+"')
+_SPACE = re.compile(r"\s+")
+_PROJECT_DIR = str(settings.BASE_DIR)
+
+
+def fingerprint(sql):
+    """
+    the statement with literals, placeholders and IN lists collapsed. two
+    queries with the same fingerprint differ only in their parameters
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _SAVEPOINT.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _origin():
+    # the innermost frame of project code, which is where a loop would be
+    for frame in reversed(traceback.extract_stack()[:-3]):
+        if frame.filename.startswith(_PROJECT_DIR) and 'site-packages' not in frame.filename \
+                and not frame.filename.endswith(os.sep + 'profiling.py'):
+            return f"{os.path.relpath(frame.filename, _PROJECT_DIR)}:{frame.lineno} in {frame.name}"
+    return None
+
+
+class QueryRecorder:
+    def __init__(self, n_plus_one_threshold=None):
+        self.n_plus_one_threshold = n_plus_one_threshold or getattr(settings, 'SQL_N_PLUS_ONE_THRESHOLD', 3)
+        self.count = 0
+        self.total_time = 0.0
+        self.fingerprints = defaultdict(lambda: {'count': 0, 'time': 0.0, 'origin': None, 'sql': None})
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.total_time += duration
+            entry = self.fingerprints[fingerprint(sql)]
+            entry['count'] += 1
+            entry['time'] += duration
+            if entry['sql'] is None:
+                entry['sql'] = sql
+                entry['origin'] = _origin()
+
+    @property
+    def repeated(self):
+        return {fp: entry for fp, entry in self.fingerprints.items() if entry['count'] > 1}
+
+    @property
+    def n_plus_one(self):
+        """
+        SELECTs run at least n_plus_one_threshold times with different
+        parameters, almost always a relation loaded inside a loop
+        """
+        return {
+            fp: entry for fp, entry in self.fingerprints.items()
+            if entry['count'] >= self.n_plus_one_threshold and fp.upper().startswith('SELECT')
+        }
+
+    def report(self):
+        return {
+            'queries': self.count,
+            'time_ms': round(self.total_time * 1000, 3),
+            'repeated': sum(entry['count'] - 1 for entry in self.repeated.values()),
+            'n_plus_one': [
+                {'sql': fp, 'count': entry['count'], 'time_ms': round(entry['time'] * 1000, 3), 'origin': entry['origin']}
+                for fp, entry in sorted(self.n_plus_one.items(), key=lambda item: -item[1]['count'])
+            ],
+        }
+
+
+def _install(recorder):
+    for connection in connections.all():
+        connection.execute_wrappers.append(recorder)
+
+
+def _uninstall(recorder):
+    for connection in connections.all():
+        if recorder in connection.execute_wrappers:
+            connection.execute_wrappers.remove(recorder)
+
+
+@contextmanager
+def record_queries(n_plus_one_threshold=None):
+    recorder = QueryRecorder(n_plus_one_threshold)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+@contextmanager
+def query_budget(budget, n_plus_one_threshold=None, allow_n_plus_one=False):
+    """
+    test helper, fails when the block runs more than budget queries or, unless
+    allowed, repeats a SELECT in a loop:
+
+        with query_budget(3):
+            self.client.get('/api/list_services/')
+    """
+    with record_queries(n_plus_one_threshold) as recorder:
+        yield recorder
+    report = recorder.report()
+    problems = []
+    if report['queries'] > budget:
+        problems.append(f"{report['queries']} queries run, the budget is {budget}")
+    if report['n_plus_one'] and not allow_n_plus_one:
+        problems.append("likely N+1 queries")
+    if problems:
+        lines = [', '.join(problems) + ':']
+        lines += [f"  {entry['count']}x {fp}  ({entry['origin']})" for fp, entry in recorder.fingerprints.items()]
+        raise AssertionError('\n'.join(lines))
+
+
+class SQLProfilingMiddleware:
+    """
+    profiles every request when settings.SQL_PROFILING is on, or those sending
+    X-SQL-Profile: 1 when settings.SQL_PROFILING_ALLOW_HEADER is on. results
+    are added as X-SQL-* response headers and logged to sql_profiler, at
+    WARNING level when an N+1 pattern is found
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.always = getattr(settings, 'SQL_PROFILING', False)
+        self.allow_header = getattr(settings, 'SQL_PROFILING_ALLOW_HEADER', False)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def enabled(self, request):
+        return self.always or (self.allow_header and request.headers.get(PROFILE_HEADER) == '1')
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled(request):
+            return self.get_response(request)
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        return self.finish(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not self.enabled(request):
+            return await self.get_response(request)
+        # connections are per thread. async ORM calls run in the request's
+        # thread sensitive sync_to_async thread, so the wrapper goes there
+        recorder = QueryRecorder()
+        await sync_to_async(_install)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_uninstall)(recorder)
+        return self.finish(request, response, recorder)
+
+    def finish(self, request, response, recorder):
+        report = recorder.report()
+        response['X-SQL-Queries'] = str(report['queries'])
+        response['X-SQL-Time-Ms'] = str(report['time_ms'])
+        response['X-SQL-Repeated'] = str(report['repeated'])
+        response['X-SQL-N-Plus-One'] = str(len(report['n_plus_one']))
+        level = logging.WARNING if report['n_plus_one'] else logging.INFO
+        logger.log(level, 'sql profile', extra={
+            'method': request.method,
+            'path': request.get_full_path(),
+            **report,
+        })
+        return response
@@ -0,0 +1,152 @@
+"""
+primary/replica routing. writes always go to the primary ('default'). reads
+go to a replica only inside replica_reads(), which the list views enter, and
+only while the user has not written recently: after a write the user's reads
+stick to the primary for settings.READ_AFTER_WRITE_WINDOW seconds, so a
+lagging replica never hides their own booking or status change. the cached
+service catalog is always built from the primary, a stale page would outlive
+the lag by the cache timeout.
+
+replicas are listed in settings.DATABASE_REPLICAS. locally two SQLite files
+stand in for primary and replica, the sync_replicas command copies one into
+the other
+"""
+import math
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .cache import get_cache
+
+_request_state = ContextVar('db_request_state', default=None)
+_replica_ok = ContextVar('db_replica_ok', default=False)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pin_key(user_id):
+    return f"db:pinned:{user_id}"
+
+
+class RequestState:
+    def __init__(self, request):
+        self.request = request
+        self.wrote = False
+        self._pinned = None
+
+    def user_id(self):
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.pk
+        return None
+
+    @property
+    def pinned(self):
+        # looked up on the first replica read, after the view authenticated
+        if self._pinned is None:
+            user_id = self.user_id()
+            self._pinned = user_id is not None and get_cache().get(pin_key(user_id)) is not None
+        return self._pinned
+
+
+@contextmanager
+def replica_reads():
+    """
+    reads in the block may be served by a replica. only for read only code
+    that tolerates a little replication lag
+    """
+    token = _replica_ok.set(True)
+    try:
+        yield
+    finally:
+        _replica_ok.reset(token)
+
+
+class ReplicaReadMixin:
+    """
+    list views whose queries may be served by a replica
+    """
+
+    def list(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().list(request, *args, **kwargs)  #type: ignore
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or not _replica_ok.get():
+            return DEFAULT_DB_ALIAS
+        state = _request_state.get()
+        if state is not None and (state.wrote or state.pinned):
+            return DEFAULT_DB_ALIAS
+        # a read inside a transaction on the primary has to see its writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary
+        return db not in replicas()
+
+
+class ReplicaRoutingMiddleware:
+    """
+    tracks writes made while handling a request. once the response is ready
+    the user is pinned to the primary for READ_AFTER_WRITE_WINDOW seconds
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestState(request)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if state.wrote:
+            self.pin(state)
+        return response
+
+    async def __acall__(self, request):
+        state = RequestState(request)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if state.wrote:
+            # request.user may still be the lazy session user, which queries
+            await sync_to_async(self.pin)(state)
+        return response
+
+    def pin(self, state):
+        window = getattr(settings, 'READ_AFTER_WRITE_WINDOW', 5)
+        user_id = state.user_id()
+        if not replicas() or window <= 0 or user_id is None:
+            return
+        get_cache().set(pin_key(user_id), 1, timeout=math.ceil(window))
@@ -0,0 +1,132 @@
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+
+FTS_TABLE = 'Auth_service_fts'
+FTS_IDS_TABLE = 'Auth_service_fts_ids'
+
+# bm25 column weights for (name, description), a name hit counts for more
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def fts_available(conn=None):
+    return (conn or connection).vendor == 'sqlite'
+
+
+def create_index(conn, populate=True):
+    """
+    creates the FTS5 shadow table of Service. FTS5 rows are keyed by an
+    integer rowid and services by a uuid, so FTS_IDS_TABLE hands out the
+    rowid of each service and maps it back. writes look the rowid up through
+    its unique index and delete from the FTS table by rowid, neither reads
+    the whole index. the implicit rowid of Auth_service is not used, a
+    migration that remakes the table on SQLite is free to renumber it
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {FTS_IDS_TABLE} "
+            f"(id integer NOT NULL PRIMARY KEY, service_id char(32) NOT NULL UNIQUE)"
+        )
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(name, description, tokenize='porter unicode61')"
+        )
+        if populate:
+            _populate(cursor)
+
+
+def _populate(cursor):
+    cursor.execute(f"INSERT INTO {FTS_IDS_TABLE}(service_id) SELECT id FROM Auth_service")
+    cursor.execute(
+        f"INSERT INTO {FTS_TABLE}(rowid, name, description) "
+        f"SELECT ids.id, s.name, s.description FROM Auth_service s "
+        f"JOIN {FTS_IDS_TABLE} ids ON ids.service_id = s.id"
+    )
+
+
+def rebuild_index(conn):
+    """
+    repopulates the index from Auth_service
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(f"DELETE FROM {FTS_IDS_TABLE}")
+        _populate(cursor)
+
+
+def drop_index(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_IDS_TABLE}")
+
+
+def index_service(service):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT OR IGNORE INTO {FTS_IDS_TABLE}(service_id) VALUES (%s)", [service.id.hex])
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = (SELECT id FROM {FTS_IDS_TABLE} WHERE service_id = %s)",
+            [service.id.hex],
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, description) "
+            f"SELECT ids.id, s.name, s.description FROM Auth_service s "
+            f"JOIN {FTS_IDS_TABLE} ids ON ids.service_id = s.id WHERE s.id = %s",
+            [service.id.hex],
+        )
+
+
+def unindex_service(service):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = (SELECT id FROM {FTS_IDS_TABLE} WHERE service_id = %s)",
+            [service.id.hex],
+        )
+        cursor.execute(f"DELETE FROM {FTS_IDS_TABLE} WHERE service_id = %s", [service.id.hex])
+
+
+def to_match_expression(text):
+    """
+    turns free text into a safe FTS5 query: every word must match, the last one
+    as a prefix so results show up while the user is still typing
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_services(queryset, text):
+    """
+    restricts a Service queryset to rows matching text and annotates a
+    `relevance` score, higher is better
+    """
+    expression = to_match_expression(text)
+    if expression is None:
+        # still annotated, the filter orders matches by relevance
+        return queryset.none().annotate(relevance=Value(0.0, output_field=FloatField()))
+
+    if not fts_available():
+        return queryset.filter(
+            Q(name__icontains=text) | Q(description__icontains=text)
+        ).annotate(relevance=Value(0.0, output_field=FloatField()))
+
+    # bm25() is lower-is-better, negate it so relevance sorts like price does
+    return queryset.extra(
+        tables=[FTS_TABLE, FTS_IDS_TABLE],
+        where=[
+            f"{FTS_TABLE} MATCH %s",
+            f"{FTS_IDS_TABLE}.id = {FTS_TABLE}.rowid",
+            f"{FTS_IDS_TABLE}.service_id = Auth_service.id",
+        ],
+        params=[expression],
+        select={'relevance': f"-bm25({FTS_TABLE}, %s, %s)"},
+        select_params=[NAME_WEIGHT, DESCRIPTION_WEIGHT],
+    )
@@ -1,6 +1,17 @@
 from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
 from django.core.validators import EmailValidator
-from .models import Booking,CustomUser,Service,ProviderProfile
+from django.db import IntegrityError, transaction
+from phonenumber_field.validators import validate_international_phonenumber
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from datetime import timedelta
+from .models import Booking,CustomUser,Service,ProviderProfile,DocumentUpload
+from .slots import MAX_SLOT_WINDOW
+from .login import LoginError, authenticate_credentials
+from .images import picture_urls
+from .uploads import MAX_FILENAME_LENGTH
 
 
 class SignUpserializer(serializers.ModelSerializer):
@@ -13,8 +24,9 @@ class SignUpserializer(serializers.ModelSerializer):
         fields = ('id', 'email', 'phone_number', 'password', 'password2','is_provider', 'is_verified', 'created_at', 'updated_at')
         read_only_fields = ('id', 'created_at', 'updated_at')
         extra_kwargs = {
-            'email': {'required': True, 'allow_blank': False},
-            'phone_number': {'required': True, 'allow_blank': False},
+            # uniqueness is enforced by the database constraints, see create()
+            'email': {'required': True, 'allow_blank': False, 'validators': []},
+            'phone_number': {'required': True, 'allow_blank': False, 'validators': [validate_international_phonenumber]},
             'password': {'write_only': True, 'min_length': 8},
         }
 
@@ -30,27 +42,33 @@ class SignUpserializer(serializers.ModelSerializer):
             EmailValidator()(attrs['email'])
         except serializers.ValidationError:
             raise serializers.ValidationError({"email": "Invalid email address."})
-            
-        if CustomUser.objects.filter(email=attrs['email']).exists():
-            raise serializers.ValidationError({"email": "Email already exists."})
-            
-        if CustomUser.objects.filter(phone_number=attrs['phone_number']).exists():
-            raise serializers.ValidationError({"phone_number": "Phone number already exists."})
         return attrs
     
     def create(self, validated_data):
         """
-        creates a new user
+        creates a new user and its profile in one transaction. duplicates are
+        caught by the unique constraints instead of being looked up first, which
+        saves two queries per signup and closes the race between check and insert
         """
         validated_data.pop('password2')
         user = CustomUser(
             email = validated_data['email'],
             phone_number = validated_data['phone_number'],
-            is_provider = validated_data['is_provider'],
+            is_provider = validated_data.get('is_provider', False),
             is_verified = validated_data.get('is_verified', False)
         )
         user.set_password(validated_data['password'])
-        user.save()
+        try:
+            with transaction.atomic():
+                # the profile is created by the create_profile post_save receiver
+                user.save()
+        except IntegrityError:
+            # only the failure path pays for finding out which field collided
+            if CustomUser.objects.filter(email=user.email).exists():
+                raise serializers.ValidationError({"email": ["Email already exists."]})
+            if CustomUser.objects.filter(phone_number=user.phone_number).exists():
+                raise serializers.ValidationError({"phone_number": ["Phone number already exists."]})
+            raise
         return user
     
 
@@ -61,30 +79,30 @@ class OTPVerifySerializer(serializers.Serializer):
 
 
 
-class LoginSerializer(serializers.Serializer):
+class LoginCredentialsSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField()
 
-    def validate(self, attrs):
-        try:
-            user = CustomUser.objects.get(email=attrs['email'])
-        except CustomUser.DoesNotExist:
-            raise serializers.ValidationError("User not found")
-
-        if not user.is_verified:
-            raise serializers.ValidationError("User not verified")
 
-        if not user.check_password(attrs['password']):
-            raise serializers.ValidationError("Invalid credentials")
+class LoginSerializer(LoginCredentialsSerializer):
 
-        attrs['user'] = user
+    def validate(self, attrs):
+        try:
+            attrs['user'] = authenticate_credentials(attrs['email'], attrs['password'])
+        except LoginError as e:
+            raise serializers.ValidationError(str(e))
         return attrs
     
 
 class ProviderSerializer(serializers.ModelSerializer):
+    profile_picture = serializers.SerializerMethodField()
+
     class Meta:
         model = ProviderProfile
-        fields = ['first_name', 'last_name', 'address']
+        fields = ['first_name', 'last_name', 'address', 'profile_picture']
+
+    def get_profile_picture(self, obj):
+        return picture_urls(obj)
 
 
 class ServiceSerializer(serializers.ModelSerializer):
@@ -92,19 +110,88 @@ class ServiceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Service
-        fields = ['id', 'name', 'description', 'price', 'provider']
+        fields = ['id', 'name', 'description', 'price', 'duration', 'provider']
 
 
 
 class BookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
-        fields = ['id', 'customer', 'service', 'schedule', 'status']
-        read_only_fields = ['id', 'customer', 'status']
+        fields = ['id', 'customer', 'service', 'schedule', 'schedule_end', 'status']
+        read_only_fields = ['id', 'customer', 'schedule_end', 'status']
+
+    def validate_schedule(self, value):
+        if value < timezone.now():
+            raise serializers.ValidationError("Booking time must be in the future.")
+        return value
+
+
+class BulkBookingItemSerializer(serializers.Serializer):
+    """
+    one item of a bulk booking request. the service is kept as a bare id so the
+    whole batch can be resolved with a single query
+    """
+    service = serializers.UUIDField()
+    schedule = serializers.DateTimeField()
+
+    def validate_schedule(self, value):
+        if value < timezone.now():
+            raise serializers.ValidationError("Booking time must be in the future.")
+        return value
+
+
+class BookingStatsQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        end = attrs.get('end') or timezone.localdate()
+        start = attrs.get('start') or end - timedelta(days=30)
+        if end < start:
+            raise serializers.ValidationError({"end": "End must not be before start."})
+        return {'start': start, 'end': end}
+
+
+class SlotQuerySerializer(serializers.Serializer):
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+
+    def validate(self, attrs):
+        if attrs['end'] <= attrs['start']:
+            raise serializers.ValidationError({"end": "End must be after start."})
+        if attrs['end'] - attrs['start'] > MAX_SLOT_WINDOW:
+            raise serializers.ValidationError({"end": f"Window cannot exceed {MAX_SLOT_WINDOW.days} days."})
+        return attrs
+
+
+class DocumentUploadSerializer(serializers.ModelSerializer):
+    checksum = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True,
+                                      error_messages={'invalid': "Expected a hex SHA-256."})
+
+    class Meta:
+        model = DocumentUpload
+        fields = ['id', 'filename', 'size', 'checksum', 'offset', 'status', 'error', 'created_at']
+        read_only_fields = ['id', 'offset', 'status', 'error', 'created_at']
+
+    def validate_filename(self, value):
+        try:
+            value = get_valid_filename(value)
+        except SuspiciousFileOperation:
+            raise serializers.ValidationError("Not a valid filename.")
+        if len(value) > MAX_FILENAME_LENGTH:
+            raise serializers.ValidationError(f"Filenames cannot exceed {MAX_FILENAME_LENGTH} characters.")
+        return value
+
+    def validate_size(self, value):
+        if not value:
+            raise serializers.ValidationError("The file is empty.")
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Files cannot exceed {settings.UPLOAD_MAX_SIZE} bytes.")
+        return value
 
 
 #for admin
 class ServiceSerializerAdmin(serializers.ModelSerializer):
     class Meta:
         model = Service
-        fields = ['id', 'name', 'description', 'price', 'provider']
+        fields = ['id', 'name', 'description', 'price', 'provider', 'duration', 'capacity']
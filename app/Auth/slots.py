@@ -0,0 +1,145 @@
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import OperationalError, transaction
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from .models import Booking, ProviderBookingStats, Service
+
+# upper bound on the window a single availability query may span
+MAX_SLOT_WINDOW = timedelta(days=31)
+
+
+class BookingBusy(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Too many bookings are being made right now, try again."
+    default_code = 'busy'
+
+
+@contextmanager
+def write_lock():
+    """
+    turns SQLite giving up on the write lock after the busy timeout into a
+    409 the client can retry, instead of a 500
+    """
+    try:
+        yield
+    except OperationalError as e:
+        if 'locked' not in str(e):
+            raise
+        raise BookingBusy()
+
+
+def overlapping_bookings(service_id, start, end):
+    """
+    active bookings of a service whose interval intersects [start, end),
+    answered from the (service, status, schedule) index
+    """
+    return Booking.objects.filter(
+        service_id=service_id,
+        schedule__lt=end,
+        schedule_end__gt=start,
+        status__in=Booking.ACTIVE_STATUSES,
+    )
+
+
+def free_slots(service, start, end):
+    """
+    lists the slots of service between start and end, one every
+    service.duration minutes starting at start, with the capacity left in each.
+    bookings in the window are fetched with a single query
+    """
+    length = service.slot_length
+    intervals = list(overlapping_bookings(service.pk, start, end).values_list('schedule', 'schedule_end'))
+
+    slots = []
+    slot_start = start
+    while slot_start + length <= end:
+        slot_end = slot_start + length
+        taken = sum(1 for b_start, b_end in intervals if b_start < slot_end and b_end > slot_start)
+        if taken < service.capacity:
+            slots.append({
+                'start': slot_start,
+                'end': slot_end,
+                'available': service.capacity - taken,
+            })
+        slot_start = slot_end
+    return slots
+
+
+def reserve_slot(serializer, customer):
+    """
+    saves a booking serializer after checking the slot still has capacity.
+
+    the service row is locked for the duration of the check and insert, so
+    parallel requests for the same service are serialized and cannot both take
+    the last place. SQLite has no row locks and ignores select_for_update,
+    there every profile opens the transaction with BEGIN IMMEDIATE (see
+    SQLITE_OPTIONS in settings), which takes the database write lock before
+    the check. a request that does not get it within the busy timeout is
+    answered with a 409.
+    """
+    service = serializer.validated_data['service']
+    schedule = serializer.validated_data['schedule']
+    with write_lock(), transaction.atomic():
+        service = Service.objects.select_for_update().get(pk=service.pk)
+        schedule_end = schedule + service.slot_length
+        if overlapping_bookings(service.pk, schedule, schedule_end).count() >= service.capacity:
+            raise serializers.ValidationError({"schedule": ["This slot is fully booked."]})
+        return serializer.save(customer=customer, service=service, schedule_end=schedule_end)
+
+
+def reserve_slots(customer, items):
+    """
+    books many (index, service_id, schedule) items for one customer.
+
+    the referenced services are fetched and locked with one query, every
+    existing booking that could conflict with the batch with another, and the
+    accepted bookings are written with a single bulk_create. returns
+    (bookings, errors) where errors maps an item index to its error messages.
+    the locking is reserve_slot's, on SQLite the BEGIN IMMEDIATE write lock,
+    and a batch that cannot get it fails as a whole with a 409.
+    """
+    errors = {}
+    bookings = []
+    if not items:
+        return bookings, errors
+
+    with write_lock(), transaction.atomic():
+        services = Service.objects.select_for_update().in_bulk({service_id for _, service_id, _ in items})
+        candidates = []
+        for index, service_id, schedule in items:
+            service = services.get(service_id)
+            if service is None:
+                errors[index] = {"service": ["Service not found."]}
+                continue
+            candidates.append((index, service, schedule, schedule + service.slot_length))
+
+        if candidates:
+            window_start = min(c[2] for c in candidates)
+            window_end = max(c[3] for c in candidates)
+            taken = {}
+            existing = Booking.objects.filter(
+                service_id__in=[c[1].pk for c in candidates],
+                schedule__lt=window_end,
+                schedule_end__gt=window_start,
+                status__in=Booking.ACTIVE_STATUSES,
+            ).values_list('service_id', 'schedule', 'schedule_end')
+            for service_id, start, end in existing:
+                taken.setdefault(service_id, []).append((start, end))
+
+            for index, service, start, end in candidates:
+                intervals = taken.setdefault(service.pk, [])
+                overlaps = sum(1 for b_start, b_end in intervals if b_start < end and b_end > start)
+                if overlaps >= service.capacity:
+                    errors[index] = {"schedule": ["This slot is fully booked."]}
+                    continue
+                # later items in the same batch compete for the same capacity
+                intervals.append((start, end))
+                bookings.append(Booking(customer=customer, service=service, schedule=start, schedule_end=end))
+
+            Booking.objects.bulk_create(bookings)
+            # bulk_create skips post_save, so the rollup is updated here
+            ProviderBookingStats.record_bookings(bookings)
+    return bookings, errors
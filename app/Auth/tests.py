@@ -1,3 +1,1947 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password as hash_check
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+import httpx
+import requests
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from . import uploads
+from .cache import catalog_cache_stats, get_cache, user_cache_key
+from .fast_serializers import BookingValuesSerializer, ServiceValuesSerializer
+from .filters import ServiceFilter
+from .images import process_profile_picture
+from .log import JSONFormatter, QueuedFileHandler, SamplingFilter
+from .management.commands.import_users import Command as ImportUsersCommand
+from .metrics import RequestMetrics, get_metrics
+from .models import Booking, CustomerProfile, CustomUser, DocumentUpload, Payment, PaymentWebhookEvent, ProviderBookingStats, ProviderProfile, Service
+from .otp_service import CacheOTPStore, MemoryOTPStore, get_otp_store, send_mock_otp
+from .pagination import KeysetPagination, encode_cursor, keyset_slice
+from .payments import CircuitBreaker, GatewayUnavailable, PaymentGatewayError, RazorpayGateway, StubGateway, get_gateway
+from .profiling import SQLProfilingMiddleware, fingerprint, query_budget
+from .renderers import ORJSONRenderer
+from .routers import PrimaryReplicaRouter, ReplicaRoutingMiddleware, replica_reads
+from .search import FTS_TABLE, fts_available, to_match_expression
+from .serializers import BookingSerializer, ProviderSerializer, ServiceSerializer
+from .slots import overlapping_bookings
+from .views import CustomerBookingListView, ProviderBookingListView
+from .webhooks import enqueue_event, process_batch
+
+
+def auth_header(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw', is_verified=True)
+        cls.providers = [
+            CustomUser.objects.create_user(f'provider{i}@example.com', f'+91900000010{i}', 'pw', is_provider=True, is_verified=True)
+            for i in range(3)
+        ]
+        for provider in cls.providers:
+            for i in range(3):
+                Service.objects.create(name=f'Service {i}', description='d', price=500, provider=provider.provider_profile)
+        cls.booking = Booking.objects.create(
+            customer=cls.customer.customer_profile,
+            service=cls.providers[0].provider_profile.services.first(),
+            schedule=timezone.now() + timedelta(days=1),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_budget_catches_n_plus_one(self):
+        with self.assertRaisesMessage(AssertionError, 'likely N+1 queries'):
+            with query_budget(100):
+                ServiceSerializer(Service.objects.all(), many=True).data
+
+    def test_service_list(self):
+        # user, then one page of services joined with their providers
+        with query_budget(2):
+            response = self.client.get('/api/list_services/', **auth_header(self.customer))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 9)
+
+    def test_booking_status_update(self):
+        # user, booking with its service, the update and the stats rollup
+        with query_budget(8):
+            response = self.client.patch(
+                f'/api/{self.booking.id}/', {'status': 'confirmed'},
+                content_type='application/json', **auth_header(self.providers[0]),
+            )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(DEBUG=True)
+    def test_profile_header_is_opt_in(self):
+        response = self.client.get('/api/list_services/', HTTP_X_SQL_PROFILE='1', **auth_header(self.customer))
+        self.assertNotIn('X-SQL-Queries', response)
+        with override_settings(SQL_PROFILING_ALLOW_HEADER=True):
+            self.client = self.client_class()
+            response = self.client.get('/api/list_services/', HTTP_X_SQL_PROFILE='1', **auth_header(self.customer))
+        self.assertIn('X-SQL-Queries', response)
+
+
+class SQLProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            provider = CustomUser.objects.create_user(f'provider{i}@example.com', f'+91900000010{i}', 'pw', is_provider=True)
+            Service.objects.create(name=f'Service {i}', description='d', price=500, provider=provider.provider_profile)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT "a" FROM "t" WHERE "b" = \'x\'\'y\' AND "c" IN (%s, %s, %s) LIMIT 21'),
+            'SELECT "a" FROM "t" WHERE "b" = ? AND "c" IN (...) LIMIT ?',
+        )
+        self.assertEqual(fingerprint('SAVEPOINT "s140_x12"'), fingerprint('SAVEPOINT "s7_x3"'))
+
+    def n_plus_one(self, request):
+        names = []
+        for service in Service.objects.all():
+            names.append(service.provider.user.email)
+        return HttpResponse(len(names))
+
+    @override_settings(SQL_PROFILING=True)
+    def test_middleware_reports_n_plus_one(self):
+        middleware = SQLProfilingMiddleware(self.n_plus_one)
+        with self.assertLogs('sql_profiler', 'WARNING') as logs:
+            response = middleware(RequestFactory().get('/x/'))
+        self.assertEqual(response['X-SQL-Queries'], '7')
+        self.assertEqual(response['X-SQL-N-Plus-One'], '2')
+        report = logs.records[0].n_plus_one
+        self.assertEqual([entry['count'] for entry in report], [3, 3])
+        self.assertTrue(report[0]['origin'].startswith('Auth/tests.py:'))
+        self.assertTrue(report[0]['origin'].endswith(' in n_plus_one'))
+
+    @override_settings(SQL_PROFILING=True)
+    async def test_async_requests_are_profiled(self):
+        async def view(request):
+            return HttpResponse(await Service.objects.acount())
+        with self.assertLogs('sql_profiler', 'INFO'):
+            response = await SQLProfilingMiddleware(view)(RequestFactory().get('/x/'))
+        self.assertEqual(response['X-SQL-Queries'], '1')
+        self.assertEqual(response['X-SQL-N-Plus-One'], '0')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "reads SQLite EXPLAIN QUERY PLAN output")
+class QueryPlanTests(TestCase):
+    """
+    every access path has to be answered from an index. a plan line that
+    scans a table means a missing or unusable index
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw').customer_profile
+        cls.provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True).provider_profile
+        cls.service = Service.objects.create(name='Service', description='d', price=500, provider=cls.provider)
+        cls.now = timezone.now()
+        Booking.objects.create(customer=cls.customer, service=cls.service, schedule=cls.now + timedelta(days=1))
+
+    def assertIndexed(self, queryset, ordered_index_scan=False):
+        """
+        ordered_index_scan allows walking an index in order, which a LIMITed
+        first page does instead of seeking
+        """
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            if ' SCAN ' not in f' {line} ':
+                continue
+            if ordered_index_scan and ' USING INDEX ' in line:
+                continue
+            self.fail(f"Full scan in the plan of\n{queryset.query}\n{plan}")
+
+    def test_customer_bookings(self):
+        view = CustomerBookingListView(request=SimpleNamespace(user=self.customer.user))
+        self.assertIn('booking_customer_schedule_idx', view.get_queryset().explain())
+        self.assertIndexed(view.get_queryset())
+
+    def test_provider_bookings(self):
+        view = ProviderBookingListView(request=SimpleNamespace(user=self.provider.user))
+        self.assertIn('service_provider_created_idx', view.get_queryset().explain())
+        self.assertIndexed(view.get_queryset())
+
+    def test_service_catalog(self):
+        queryset = Service.objects.select_related('provider')
+        self.assertIndexed(keyset_slice(queryset)[0], ordered_index_scan=True)
+        # later pages seek to the cursor instead of walking from the top
+        self.assertIndexed(keyset_slice(queryset, encode_cursor(self.now, self.service.pk))[0])
+        self.assertIndexed(keyset_slice(queryset, encode_cursor(self.now, self.service.pk, reverse=True))[0])
+
+    def test_services_of_provider(self):
+        queryset = ServiceFilter({'provider': self.provider.pk}, queryset=Service.objects.select_related('provider')).qs
+        self.assertIndexed(queryset)
+
+    def test_slot_overlaps(self):
+        self.assertIndexed(overlapping_bookings(self.service.pk, self.now, self.now + timedelta(hours=1)))
+
+    def test_bookings_by_status(self):
+        queryset = Booking.objects.filter(service=self.service, status='pending', schedule__gte=self.now)
+        self.assertIn('booking_service_status_idx', queryset.explain())
+        self.assertIndexed(queryset)
+
+    def test_provider_stats(self):
+        today = self.now.date()
+        queryset = ProviderBookingStats.objects.filter(provider=self.provider, day__range=(today, today)).order_by('day', 'status')
+        self.assertIndexed(queryset)
+
+
+class CatalogPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw')
+        provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True).provider_profile
+        Service.objects.bulk_create(
+            Service(name=f'Service {i}', description='d', price=500, provider=provider) for i in range(25)
+        )
+        # a shared created_at across the first page break leaves the order to the id
+        Service.objects.filter(name__in=[f'Service {i}' for i in range(15)]).update(created_at=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url):
+        response = self.client.get(url, **auth_header(self.customer))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_cover_the_catalog_once(self):
+        expected = [str(pk) for pk in Service.objects.order_by('-created_at', '-id').values_list('pk', flat=True)]
+        pages = [self.get('/api/list_services/?page_size=10')]
+        while pages[-1]['next']:
+            # a deep page costs what the first one does
+            with query_budget(2):
+                pages.append(self.get(pages[-1]['next']))
+        self.assertEqual([len(page['results']) for page in pages], [10, 10, 5])
+        self.assertEqual([item['id'] for page in pages for item in page['results']], expected)
+        self.assertIsNone(pages[0]['previous'])
+
+        # walking back returns the same pages
+        self.assertEqual(self.get(pages[2]['previous'])['results'], pages[1]['results'])
+        first = self.get(pages[1]['previous'])
+        self.assertEqual(first['results'], pages[0]['results'])
+        self.assertIsNone(first['previous'])
+
+    def test_page_size_is_capped(self):
+        self.assertEqual(KeysetPagination().get_page_size(RequestFactory().get('/', {'page_size': 10 ** 6})), 100)
+
+    def test_invalid_cursor(self):
+        for cursor in ('nonsense', encode_cursor(timezone.now(), 'not-a-uuid')):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/list_services/', {'cursor': cursor}, **auth_header(self.customer))
+                self.assertEqual(response.status_code, 404)
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw')
+        cls.provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True).provider_profile
+        cls.service = Service.objects.create(name='Haircut', description='d', price=500, provider=cls.provider)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url):
+        response = self.client.get(url, **auth_header(self.customer))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_reads_are_cached(self):
+        self.get('/api/list_services/')
+        self.get(f'/api/services/{self.service.pk}/')
+        # the user is cached as well, a warm read runs no query at all
+        with self.assertNumQueries(0):
+            self.get('/api/list_services/')
+            self.get(f'/api/services/{self.service.pk}/')
+        stats = catalog_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+
+    def test_service_changes_invalidate(self):
+        self.get('/api/list_services/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.name = 'Beard trim'
+            self.service.save()
+        self.assertEqual(self.get('/api/list_services/')['results'][0]['name'], 'Beard trim')
+        self.assertEqual(self.get(f'/api/services/{self.service.pk}/')['name'], 'Beard trim')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.delete()
+        self.assertEqual(self.get('/api/list_services/')['results'], [])
+
+    def test_provider_changes_invalidate(self):
+        self.get(f'/api/services/{self.service.pk}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.provider.first_name = 'Asha'
+            self.provider.save()
+        self.assertEqual(self.get(f'/api/services/{self.service.pk}/')['provider']['first_name'], 'Asha')
+
+
+class SignUpTests(TestCase):
+    payload = {'email': 'new@example.com', 'phone_number': '+919000000001', 'password': 'password1', 'password2': 'password1'}
+
+    def signup(self, **changes):
+        with mock.patch('Auth.views.send_mock_otp'):
+            return self.client.post('/api/signup/', {**self.payload, **changes}, content_type='application/json')
+
+    def test_user_and_profile(self):
+        self.assertEqual(self.signup().status_code, 201)
+        user = CustomUser.objects.get(email='new@example.com')
+        self.assertTrue(hasattr(user, 'customer_profile'))
+
+    def test_duplicates(self):
+        self.signup()
+        response = self.signup(email='NEW@example.com', phone_number='+919000000002')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'email': ['Email already exists.']})
+        response = self.signup(email='other@example.com')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'phone_number': ['Phone number already exists.']})
+        # neither failed signup left a user or a profile behind
+        self.assertEqual(CustomUser.objects.count(), 1)
+
+    def test_two_inserts_and_no_lookups(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.signup(is_provider=True).status_code, 201)
+        statements = [query['sql'].split(None, 1)[0].upper() for query in queries.captured_queries]
+        self.assertEqual([verb for verb in statements if verb in ('SELECT', 'INSERT', 'UPDATE')], ['INSERT', 'INSERT'])
+        self.assertTrue(CustomUser.objects.get(email='new@example.com').provider_profile)
+
+    def test_failed_profile_leaves_no_user(self):
+        with mock.patch('Auth.models.CustomerProfile.objects.create', side_effect=IntegrityError('profile')):
+            with self.assertRaises(IntegrityError), self.assertLogs('django.request', 'ERROR'):
+                self.signup()
+        self.assertFalse(CustomUser.objects.exists())
+
+    def test_code_is_sent_to_the_new_account(self):
+        with mock.patch('Auth.views.send_mock_otp') as send:
+            self.client.post('/api/signup/', {**self.payload, 'email': 'New@Example.com'}, content_type='application/json')
+        send.assert_called_once_with(CustomUser.objects.get().email)
+        self.signup(password2='password2')
+        self.assertEqual(CustomUser.objects.count(), 1)
+
+
+class OTPTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('user@example.com', '+919000000001', 'pw')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_codes_expire(self):
+        store = MemoryOTPStore(ttl=60)
+        with mock.patch('Auth.otp_service.time.monotonic', return_value=1000):
+            store.put('user@example.com', '123456')
+        with mock.patch('Auth.otp_service.time.monotonic', return_value=1060):
+            self.assertFalse(store.verify('user@example.com', '123456'))
+
+    def test_attempts_are_limited(self):
+        for store in (CacheOTPStore(max_attempts=3), MemoryOTPStore(max_attempts=3)):
+            with self.subTest(store=type(store).__name__):
+                store.put('User@example.com', '123456')
+                for _ in range(3):
+                    self.assertFalse(store.verify('user@example.com', '000000'))
+                # the code is gone after the last wrong attempt
+                self.assertFalse(store.verify('user@example.com', '123456'))
+
+    def test_codes_are_shared_and_single_use(self):
+        CacheOTPStore().put('user@example.com', '123456')
+        # another worker has its own store object over the same cache
+        store = CacheOTPStore()
+        self.assertTrue(store.verify('user@example.com', '123456'))
+        self.assertFalse(store.verify('user@example.com', '123456'))
+
+    def test_memory_store_evicts_the_oldest(self):
+        store = MemoryOTPStore(max_entries=2)
+        for i in range(3):
+            store.put(f'user{i}@example.com', '123456')
+        self.assertFalse(store.verify('user0@example.com', '123456'))
+        self.assertTrue(store.verify('user2@example.com', '123456'))
+
+    def test_signup_code_verifies_the_account(self):
+        with mock.patch('Auth.otp_service.secrets.randbelow', return_value=23456), self.assertLogs('Auth.otp_service', 'INFO'):
+            response = self.client.post('/api/signup/', {
+                'email': 'new@example.com', 'phone_number': '+919000000002', 'password': 'password1', 'password2': 'password1',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        def verify(otp):
+            return self.client.post('/api/verify-otp/', {'email': 'new@example.com', 'otp': otp}, content_type='application/json')
+        self.assertEqual(verify('000000').status_code, 400)
+        self.assertEqual(verify('123456').status_code, 200)
+        self.assertTrue(CustomUser.objects.get(email='new@example.com').is_verified)
+        # used up
+        self.assertEqual(verify('123456').status_code, 400)
+
+    @override_settings(OTP_STORE='memory', OTP_TTL=60, OTP_MAX_ATTEMPTS=2, OTP_MEMORY_MAX_ENTRIES=5)
+    def test_store_from_settings(self):
+        self.enterContext(mock.patch('Auth.otp_service._store', None))
+        store = get_otp_store()
+        self.assertIsInstance(store, MemoryOTPStore)
+        self.assertEqual((store.ttl, store.max_attempts, store.max_entries), (60, 2, 5))
+        self.assertIs(get_otp_store(), store)
+
+    def test_a_new_code_replaces_the_old_one(self):
+        for store in (CacheOTPStore(), MemoryOTPStore()):
+            with self.subTest(store=type(store).__name__):
+                store.put('user@example.com', '111111')
+                store.put('user@example.com', '222222')
+                self.assertFalse(store.verify('user@example.com', '111111'))
+                self.assertTrue(store.verify('user@example.com', '222222'))
+
+    def test_verification_drops_the_cached_user(self):
+        self.client.get('/api/my/', **auth_header(self.user))
+        self.assertFalse(get_cache().get(user_cache_key(self.user.pk)).is_verified)
+        with mock.patch('Auth.views.verify_mock_otp', return_value=True), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/verify-otp/', {'email': 'USER@example.com', 'otp': '123456'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(get_cache().get(user_cache_key(self.user.pk)))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_verified)
+
+    def verify(self, email):
+        with mock.patch('Auth.views.verify_mock_otp', return_value=True), self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post('/api/verify-otp/', {'email': email, 'otp': '123456'}, content_type='application/json')
+        return response, callbacks
+
+    def test_verification_updates_by_email(self):
+        with self.assertNumQueries(2):
+            response, callbacks = self.verify('user@example.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(callbacks), 1)
+        # already verified, nothing changed and nothing is invalidated
+        response, callbacks = self.verify('user@example.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(callbacks, [])
+        response, callbacks = self.verify('nobody@example.com')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(callbacks, [])
+
+    def test_mock_codes_are_logged(self):
+        with self.assertLogs('Auth.otp_service', 'INFO') as logs:
+            otp = send_mock_otp('user@example.com')
+        self.assertEqual(logs.output, [f'INFO:Auth.otp_service:Mock OTP for user@example.com is {otp}'])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginTests(TestCase):
+    """
+    a login reads the user once and checks the password hash at most once
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('user@example.com', '+919000000001', 'password1', is_verified=True)
+        CustomUser.objects.create_user('unverified@example.com', '+919000000002', 'password1')
+
+    def setUp(self):
+        self.hashes = []
+
+        def check_password(*args, **kwargs):
+            self.hashes.append(threading.current_thread().name)
+            return hash_check(*args, **kwargs)
+        self.enterContext(mock.patch('django.contrib.auth.base_user.check_password', check_password))
+
+    def test_single_pass(self):
+        cases = [
+            ('USER@example.com', 'password1', 200, 1),
+            ('user@example.com', 'wrong-password', 400, 1),
+            ('unverified@example.com', 'password1', 400, 0),
+            ('nobody@example.com', 'password1', 400, 0),
+        ]
+        for email, password, status_code, hashes in cases:
+            with self.subTest(email=email, password=password):
+                self.hashes.clear()
+                with self.assertNumQueries(1):
+                    response = self.client.post('/api/login/', {'email': email, 'password': password}, content_type='application/json')
+                self.assertEqual(response.status_code, status_code)
+                self.assertEqual(len(self.hashes), hashes)
+        self.assertEqual(response.json(), {'non_field_errors': ['User not found']})
+
+    async def test_async_login_hashes_off_the_event_loop(self):
+        response = await self.async_client.post('/api/async/login/', {'email': 'user@example.com', 'password': 'password1'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['user']['email'], 'user@example.com')
+        self.assertEqual(len(self.hashes), 1)
+        self.assertTrue(self.hashes[0].startswith('password-hashing'))
+
+        self.hashes.clear()
+        response = await self.async_client.post('/api/async/login/', {'email': 'unverified@example.com', 'password': 'password1'}, content_type='application/json')
+        self.assertEqual(response.json(), {'non_field_errors': ['User not verified']})
+        self.assertEqual(self.hashes, [])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+@mock.patch('Auth.management.commands.import_users.ProcessPoolExecutor', ThreadPoolExecutor)
+@mock.patch('Auth.management.commands.import_users._init_worker', lambda: None)
+class ImportUsersTests(TestCase):
+    """
+    the hashing pool runs on threads here, so the test settings reach it.
+    they share the configured Django, django.setup() would reset the logging
+    """
+    header = 'email,phone_number,password,is_provider,first_name\n'
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        CustomUser.objects.create_user('existing@example.com', '+919100000000', 'pw')
+
+    def write(self, rows, name='users.csv'):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write(self.header + ''.join(f'{row}\n' for row in rows))
+        return path
+
+    def run_import(self, path, **options):
+        call_command('import_users', path, workers=2, stdout=io.StringIO(), **options)
+        with open(f'{path}.checkpoint') as f:
+            return json.load(f)
+
+    def test_import(self):
+        path = self.write([
+            'Asha@Example.com,+919100000001,secret-1,yes,Asha',
+            'ravi@example.com,+919100000002,secret-2,no,Ravi',
+            # the same email again, an invalid number, a taken email and number, no email
+            'asha@example.com,+919100000003,secret,no,',
+            'bad@example.com,12,secret,no,',
+            'existing@example.com,+919100000004,secret,no,',
+            'taken@example.com,+919100000000,secret,no,',
+            ',+919100000005,secret,no,',
+        ])
+        state = self.run_import(path, batch_size=3)
+        self.assertEqual(state, {'records': 7, 'imported': 2, 'skipped': 5})
+
+        asha = CustomUser.objects.get(email='asha@example.com')
+        self.assertTrue(asha.check_password('secret-1'))
+        self.assertEqual(str(asha.phone_number), '+919100000001')
+        self.assertEqual(asha.provider_profile.first_name, 'Asha')
+        self.assertFalse(hasattr(asha, 'customer_profile'))
+        ravi = CustomUser.objects.get(email='ravi@example.com')
+        self.assertEqual(ravi.customer_profile.first_name, 'Ravi')
+        self.assertFalse(ravi.is_verified)
+
+    def test_batches_are_checkpointed_and_resumed(self):
+        path = self.write([f'user{i}@example.com,+9191000001{i:02d},secret,no,' for i in range(5)])
+        import_batch = ImportUsersCommand.import_batch
+        batches = []
+
+        def fail_third(command, batch, pool):
+            batches.append(len(batch))
+            if len(batches) == 3:
+                raise RuntimeError("interrupted")
+            return import_batch(command, batch, pool)
+
+        with mock.patch.object(ImportUsersCommand, 'import_batch', fail_third), self.assertRaises(RuntimeError):
+            self.run_import(path, batch_size=2)
+        self.assertEqual(batches, [2, 2, 1])
+        # the checkpoint holds the two batches that made it
+        with open(f'{path}.checkpoint') as f:
+            self.assertEqual(json.load(f), {'records': 4, 'imported': 4, 'skipped': 0})
+
+        state = self.run_import(path, batch_size=2, verified=True)
+        self.assertEqual(state, {'records': 5, 'imported': 5, 'skipped': 0})
+        self.assertEqual(CustomUser.objects.filter(email__startswith='user').count(), 5)
+        # only the resumed record took the flag
+        self.assertEqual(list(CustomUser.objects.filter(is_verified=True).values_list('email', flat=True)), ['user4@example.com'])
+
+        # --restart reads the file from the top, every record is a duplicate now
+        self.assertEqual(self.run_import(path, batch_size=2, restart=True), {'records': 5, 'imported': 0, 'skipped': 5})
+
+    def test_jsonl(self):
+        path = os.path.join(self.dir, 'users.jsonl')
+        with open(path, 'w') as f:
+            f.write(json.dumps({'email': 'pro@example.com', 'password_hash': 'md5$salt$hash', 'is_provider': True, 'is_verified': True}) + '\n\n')
+        self.assertEqual(self.run_import(path), {'records': 1, 'imported': 1, 'skipped': 0})
+        user = CustomUser.objects.get(email='pro@example.com')
+        self.assertEqual(user.password, 'md5$salt$hash')
+        self.assertTrue(user.is_verified)
+        self.assertIsNone(user.phone_number)
+        self.assertTrue(ProviderProfile.objects.filter(user=user).exists())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class GenerateDatasetTests(TestCase):
+    options = {'providers': 3, 'customers': 5, 'services_per_provider': 2, 'bookings': 40, 'batch_size': 7}
+
+    def setUp(self):
+        cache.clear()
+        # the schedules are spread around the current hour
+        now = timezone.now()
+        self.enterContext(mock.patch('Auth.management.commands.generate_dataset.timezone.now', return_value=now))
+
+    def generate(self, seed):
+        call_command('generate_dataset', seed=seed, stdout=io.StringIO(), **self.options)
+        return (
+            list(CustomUser.objects.order_by('email').values_list('id', 'email', 'phone_number', 'password')),
+            # profiles get autoincrement keys, compare them through their users
+            list(Service.objects.order_by('id').values_list('id', 'name', 'price', 'provider__user_id', 'duration', 'capacity')),
+            list(Booking.objects.order_by('id').values_list('id', 'customer__user_id', 'service_id', 'schedule', 'status')),
+        )
+
+    def remove(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.filter(email__endswith='@dataset.example.com').delete()
+        ProviderBookingStats.objects.all().delete()
+
+    def test_rows_profiles_stats_and_index(self):
+        users, services, bookings = self.generate(seed=7)
+        self.assertEqual(len(users), 8)
+        self.assertEqual(ProviderProfile.objects.count(), 3)
+        self.assertEqual(CustomerProfile.objects.count(), 5)
+        self.assertTrue(3 <= len(services) <= 9)
+        self.assertEqual(len(bookings), 40)
+        for booking in Booking.objects.select_related('service'):
+            self.assertEqual(booking.schedule_end - booking.schedule, timedelta(minutes=booking.service.duration))
+
+        # the rollup counts every booking under its provider, day and status
+        expected = Counter(
+            (provider_id, timezone.localtime(schedule).date(), status)
+            for provider_id, schedule, status in Booking.objects.values_list('service__provider_id', 'schedule', 'status')
+        )
+        stats = {(row.provider_id, row.day, row.status): row.count for row in ProviderBookingStats.objects.all()}
+        self.assertEqual(stats, dict(expected))
+
+        if fts_available():
+            service = Service.objects.first()
+            found = ServiceFilter({'q': service.name}, queryset=Service.objects.all()).qs
+            self.assertIn(service, found)
+
+        response = self.client.post('/api/login/', {'email': 'customer0@dataset.example.com', 'password': 'dataset-password-123'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_seed_decides_the_output(self):
+        first = self.generate(seed=7)
+        with self.assertRaisesMessage(CommandError, 'already holds a generated dataset'):
+            self.generate(seed=7)
+        self.remove()
+        self.assertEqual(self.generate(seed=7), first)
+        self.remove()
+        self.assertNotEqual(self.generate(seed=8), first)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "the FTS5 index only exists on SQLite")
+class ServiceSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True).provider_profile
+        cls.plumbing = Service.objects.create(name='Plumbing', description='pipes and taps', price=500, provider=cls.provider)
+        cls.painting = Service.objects.create(name='Painting', description='walls, plumbing not included', price=900, provider=cls.provider)
+
+    def search(self, text):
+        return list(ServiceFilter({'q': text}, queryset=Service.objects.all()).qs)
+
+    def search_names(self, **params):
+        cache.clear()
+        response = self.client.get('/api/services/search/', params, **auth_header(self.provider.user))
+        self.assertEqual(response.status_code, 200)
+        return [service['name'] for service in response.json()['results']]
+
+    def test_facets(self):
+        other = CustomUser.objects.create_user('other@example.com', '+919000000003', 'pw', is_provider=True).provider_profile
+        Service.objects.create(name='Plumbing repair', description='leaks', price=300, provider=other)
+        # every service matches, which leaves bm25 nothing to tell them apart by
+        self.assertCountEqual(self.search_names(q='plumbing'), ['Plumbing', 'Plumbing repair', 'Painting'])
+        self.assertEqual(self.search_names(q='plumbing', ordering='price'), ['Plumbing repair', 'Plumbing', 'Painting'])
+        self.assertEqual(self.search_names(q='plumbing', ordering='-price'), ['Painting', 'Plumbing', 'Plumbing repair'])
+        self.assertEqual(self.search_names(q='plumbing', min_price=400, max_price=600), ['Plumbing'])
+        self.assertEqual(self.search_names(q='plumbing', provider=other.pk), ['Plumbing repair'])
+        # no text, newest first
+        self.assertEqual(self.search_names(), ['Plumbing repair', 'Painting', 'Plumbing'])
+
+    def test_query_syntax_is_not_passed_through(self):
+        self.assertEqual(to_match_expression('plumb* OR "walls'), '"plumb" "OR" "walls"*')
+        self.assertIsNone(to_match_expression('"*'))
+        self.assertEqual(self.search('NEAR(pipes'), [])
+        self.assertEqual(self.search('"*'), [])
+        self.assertEqual(self.search_names(q='"*'), [])
+
+    def test_name_hits_rank_first(self):
+        self.assertEqual(self.search('plumb'), [self.plumbing, self.painting])
+        self.assertEqual(self.search('walls'), [self.painting])
+
+    def test_rowids_do_not_matter(self):
+        # what remaking the table in a SQLite migration may do
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE Auth_service SET rowid = -rowid")
+        self.assertEqual(self.search('pipes'), [self.plumbing])
+
+    def test_index_follows_changes(self):
+        self.plumbing.name = 'Drains'
+        self.plumbing.save()
+        self.assertEqual(self.search('drains'), [self.plumbing])
+        self.assertEqual(self.search('plumbing'), [self.painting])
+        self.painting.delete()
+        self.assertEqual(self.search('plumbing'), [])
+
+    def test_index_writes_seek_by_rowid(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.plumbing.save()
+            self.painting.delete()
+        statements = [query['sql'] for query in queries.captured_queries if FTS_TABLE in query['sql']]
+        self.assertTrue(statements)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+                # FTS5 describes a rowid seek as "INDEX 0:=" and a full read as a bare "INDEX 0:"
+                for line in plan.splitlines():
+                    if line.startswith('SCAN ') and not line.endswith('VIRTUAL TABLE INDEX 0:='):
+                        self.fail(f"Full scan in the plan of\n{sql}\n{plan}")
+
+
+class SlotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw')
+        cls.other = CustomUser.objects.create_user('other@example.com', '+919000000003', 'pw')
+        cls.provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True)
+        cls.admin = CustomUser.objects.create_user('admin@example.com', '+919000000004', 'pw', is_staff=True)
+        cls.service = Service.objects.create(name='Service', description='d', price=500, duration=30, capacity=2,
+                                             provider=cls.provider.provider_profile)
+        cls.start = (timezone.now() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+
+    def setUp(self):
+        cache.clear()
+
+    def book(self, user, schedule):
+        return self.client.post('/api/book_service/', {'service': str(self.service.pk), 'schedule': schedule.isoformat()},
+                                content_type='application/json', **auth_header(user))
+
+    def slots(self):
+        response = self.client.get(f'/api/services/{self.service.pk}/slots/', {
+            'start': self.start.isoformat(), 'end': (self.start + timedelta(hours=1)).isoformat(),
+        }, **auth_header(self.customer))
+        self.assertEqual(response.status_code, 200)
+        return [slot['available'] for slot in response.json()['slots']]
+
+    def test_capacity(self):
+        self.assertEqual(self.slots(), [2, 2])
+        self.assertEqual(self.book(self.customer, self.start).status_code, 201)
+        self.assertEqual(self.slots(), [1, 2])
+        self.assertEqual(self.book(self.other, self.start).status_code, 201)
+        # a full slot is no longer listed
+        self.assertEqual(self.slots(), [2])
+        response = self.book(self.customer, self.start)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'schedule': ['This slot is fully booked.']})
+
+    def test_overlaps_count(self):
+        self.book(self.customer, self.start + timedelta(minutes=15))
+        self.book(self.other, self.start + timedelta(minutes=15))
+        # overlaps both half hour slots
+        self.assertEqual(self.slots(), [])
+        self.assertEqual(self.book(self.customer, self.start).status_code, 400)
+        Booking.objects.filter(customer=self.other.customer_profile).update(status='cancelled')
+        self.assertEqual(self.slots(), [1, 1])
+
+    def test_back_to_back_bookings_do_not_overlap(self):
+        # duration 30: a booking ending at 12:30 leaves the 12:30 slot whole
+        self.assertEqual(self.book(self.customer, self.start).status_code, 201)
+        self.assertEqual(self.book(self.other, self.start).status_code, 201)
+        response = self.book(self.customer, self.start + timedelta(minutes=30))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(datetime.fromisoformat(response.json()['schedule_end']), self.start + timedelta(hours=1))
+        self.assertEqual(overlapping_bookings(self.service.pk, self.start + timedelta(minutes=30), self.start + timedelta(hours=1)).count(), 1)
+
+    def test_past_and_bad_windows(self):
+        self.assertEqual(self.book(self.customer, timezone.now() - timedelta(hours=1)).status_code, 400)
+        path = f'/api/services/{self.service.pk}/slots/'
+        for start, end in [(self.start, self.start), (self.start, self.start - timedelta(hours=1)), (self.start, self.start + timedelta(days=400))]:
+            response = self.client.get(path, {'start': start.isoformat(), 'end': end.isoformat()}, **auth_header(self.customer))
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('end', response.json())
+        response = self.client.get(f'/api/services/{uuid.uuid4()}/slots/', {
+            'start': self.start.isoformat(), 'end': (self.start + timedelta(hours=1)).isoformat(),
+        }, **auth_header(self.customer))
+        self.assertEqual(response.status_code, 404)
+
+    def test_duration_and_capacity_must_be_positive(self):
+        for field in ['duration', 'capacity']:
+            response = self.client.post('/api/admin/services/', {
+                'name': 'Bad', 'description': 'd', 'price': '1.00', 'provider': self.provider.provider_profile.pk, field: 0,
+            }, content_type='application/json', **auth_header(self.admin))
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(field, response.json())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Service.objects.filter(pk=self.service.pk).update(duration=0)
+
+    def test_lock_timeout_is_a_conflict(self):
+        with mock.patch('Auth.slots.Service.objects.select_for_update', side_effect=OperationalError('database is locked')):
+            response = self.book(self.customer, self.start)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Booking.objects.exists())
+        # the booking transactions take the write lock up front
+        self.assertEqual(connection.settings_dict['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+
+
+class BulkBookingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw')
+        cls.provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True)
+        cls.service = Service.objects.create(name='Service', description='d', price=500, provider=cls.provider.provider_profile)
+        cls.start = (timezone.now() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+
+    def setUp(self):
+        cache.clear()
+
+    def book(self, items, user=None):
+        return self.client.post('/api/book_service/bulk/', items, content_type='application/json', **auth_header(user or self.customer))
+
+    def item(self, hours=0, service=None):
+        return {'service': str(service or self.service.pk), 'schedule': (self.start + timedelta(hours=hours)).isoformat()}
+
+    def test_results_per_item(self):
+        response = self.book([
+            self.item(),
+            # the slot taken by the first item
+            self.item(),
+            self.item(hours=1),
+            self.item(service=uuid.uuid4()),
+            self.item(hours=-48),
+            {'service': 'nope'},
+        ])
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (2, 4))
+        self.assertEqual([result['status'] for result in body['results']], ['created', 'error', 'created', 'error', 'error', 'error'])
+        self.assertEqual(body['results'][1]['errors'], {'schedule': ['This slot is fully booked.']})
+        self.assertEqual(body['results'][3]['errors'], {'service': ['Service not found.']})
+        self.assertIn('schedule', body['results'][4]['errors'])
+        self.assertEqual(Booking.objects.filter(service=self.service).count(), 2)
+        self.assertEqual(ProviderBookingStats.objects.get(day=self.start.date(), status='pending').count, 2)
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        service = Service.objects.create(name='Class', description='d', price=500, capacity=100, provider=self.provider.provider_profile)
+        # warms the cached user and creates the stats row
+        self.assertEqual(self.book([self.item(service=service.pk)]).status_code, 201)
+        # services, conflicting bookings, the insert and the stats rollup, in a savepoint
+        with self.assertNumQueries(6):
+            self.assertEqual(self.book([self.item(service=service.pk)] * 2).status_code, 201)
+        with self.assertNumQueries(6):
+            self.assertEqual(self.book([self.item(service=service.pk)] * 50).status_code, 201)
+
+    def test_lock_timeout_fails_the_batch(self):
+        with mock.patch('Auth.slots.Service.objects.select_for_update', side_effect=OperationalError('database is locked')):
+            response = self.book([self.item(), self.item(hours=1)])
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_rejected_requests(self):
+        self.assertEqual(self.book([self.item(hours=-48)]).status_code, 400)
+        self.assertEqual(self.book([]).status_code, 400)
+        self.assertEqual(self.book(self.item()).status_code, 400)
+        self.assertEqual(self.book([self.item(hours=i) for i in range(101)]).status_code, 400)
+        self.assertEqual(self.book([self.item()], user=self.provider).status_code, 403)
+        self.assertFalse(Booking.objects.exists())
+
+
+class BookingStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw').customer_profile
+        cls.provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True)
+        cls.service = Service.objects.create(name='Service', description='d', price=500, provider=cls.provider.provider_profile)
+        cls.schedule = timezone.now() + timedelta(days=1)
+
+    def counts(self):
+        return dict(ProviderBookingStats.objects.values_list('status', 'count'))
+
+    def test_rollup_follows_bookings(self):
+        booking = Booking.objects.create(customer=self.customer, service=self.service, schedule=self.schedule)
+        Booking.objects.create(customer=self.customer, service=self.service, schedule=self.schedule)
+        self.assertEqual(self.counts(), {'pending': 2})
+        booking.status = 'confirmed'
+        booking.save()
+        self.assertEqual(self.counts(), {'pending': 1, 'confirmed': 1})
+        booking.delete()
+        self.assertEqual(self.counts(), {'pending': 1, 'confirmed': 0})
+
+        day = self.schedule.date().isoformat()
+        response = self.client.get('/api/provider/stats/', {'start': day, 'end': day}, **auth_header(self.provider))
+        self.assertEqual(response.json()['days'][0]['counts'], {'pending': 1})
+
+    def test_stats_per_day(self):
+        tomorrow = self.schedule + timedelta(days=1)
+        for schedule, booking_status in [(self.schedule, 'pending'), (self.schedule, 'confirmed'), (tomorrow, 'confirmed')]:
+            Booking.objects.create(customer=self.customer, service=self.service, schedule=schedule, status=booking_status)
+        day, next_day = ProviderBookingStats.day_of(self.schedule), ProviderBookingStats.day_of(tomorrow)
+        response = self.client.get('/api/provider/stats/', {'start': day, 'end': next_day}, **auth_header(self.provider))
+        self.assertEqual(response.json()['days'], [
+            {'day': day.isoformat(), 'counts': {'confirmed': 1, 'pending': 1}, 'total': 2},
+            {'day': next_day.isoformat(), 'counts': {'confirmed': 1}, 'total': 1},
+        ])
+        response = self.client.get('/api/provider/stats/', {'start': next_day, 'end': day}, **auth_header(self.provider))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/provider/stats/', **auth_header(self.customer.user)).status_code, 403)
+
+    def test_rebuild(self):
+        other = CustomUser.objects.create_user('other@example.com', '+919000000003', 'pw', is_provider=True).provider_profile
+        other_service = Service.objects.create(name='Other', description='d', price=500, provider=other)
+        Booking.objects.create(customer=self.customer, service=self.service, schedule=self.schedule)
+        Booking.objects.create(customer=self.customer, service=other_service, schedule=self.schedule)
+        ProviderBookingStats.objects.update(count=7)
+
+        call_command('rebuild_booking_stats', provider=other.pk, stdout=io.StringIO())
+        self.assertEqual(dict(ProviderBookingStats.objects.values_list('provider_id', 'count')),
+                         {self.provider.provider_profile.pk: 7, other.pk: 1})
+        out = io.StringIO()
+        call_command('rebuild_booking_stats', stdout=out)
+        self.assertEqual(dict(ProviderBookingStats.objects.values_list('provider_id', 'count')),
+                         {self.provider.provider_profile.pk: 1, other.pk: 1})
+        self.assertIn('Rebuilt 2 booking stats rows', out.getvalue())
+
+    def test_drift_is_logged_not_applied(self):
+        booking = Booking.objects.create(customer=self.customer, service=self.service, schedule=self.schedule)
+        # a rollup that lost its rows
+        ProviderBookingStats.objects.all().delete()
+        booking.status = 'cancelled'
+        with self.assertLogs('Auth.models', 'WARNING') as logs:
+            booking.save()
+        self.assertIn('short of 1 pending bookings', logs.output[0])
+        self.assertEqual(self.counts(), {'cancelled': 1})
+        booking.delete()
+        self.assertEqual(self.counts(), {'cancelled': 0})
+        with self.assertLogs('Auth.models', 'WARNING'):
+            ProviderBookingStats.bump(self.provider.provider_profile.pk, self.schedule.date(), 'cancelled', -5)
+        self.assertEqual(self.counts(), {'cancelled': 0})
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], READ_AFTER_WRITE_WINDOW=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    """
+    not a TestCase, its transaction would keep every read on the primary
+    """
+    databases = {'default'}
+    user = SimpleNamespace(pk=1, is_authenticated=True)
+    other = SimpleNamespace(pk=2, is_authenticated=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def handle(self, user, write=False):
+        """
+        runs a request through the middleware and returns where a list view
+        read would go
+        """
+        def view(request):
+            # the view authenticates, as DRF does
+            request.user = user
+            if write:
+                router.db_for_write(Booking)
+            with replica_reads():
+                return HttpResponse(router.db_for_read(Booking))
+
+        return ReplicaRoutingMiddleware(view)(RequestFactory().get('/')).content.decode()
+
+    def test_reads_outside_list_views_use_primary(self):
+        self.assertEqual(router.db_for_read(Booking), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Booking), 'replica1')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Booking), 'default')
+
+    def test_writes_use_primary(self):
+        with replica_reads():
+            self.assertEqual(router.db_for_write(Booking), 'default')
+
+    def test_read_after_write_sticks_to_primary(self):
+        self.assertEqual(self.handle(self.user), 'replica1')
+        self.assertEqual(self.handle(self.user, write=True), 'default')
+        self.assertEqual(self.handle(self.user), 'default')
+        # only the user who wrote is pinned
+        self.assertEqual(self.handle(self.other), 'replica1')
+
+    @override_settings(READ_AFTER_WRITE_WINDOW=0)
+    def test_no_window(self):
+        self.handle(self.user, write=True)
+        self.assertEqual(self.handle(self.user), 'replica1')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], READ_AFTER_WRITE_WINDOW=0)
+class CatalogReplicaTests(TransactionTestCase):
+    """
+    the catalog cache must never hold a page read from a replica. a
+    TransactionTestCase, inside a transaction every read stays on the primary
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw')
+        provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True)
+        Service.objects.create(name='Haircut', description='d', price=500, provider=provider.provider_profile)
+        self.reads = []
+        route = PrimaryReplicaRouter.db_for_read
+
+        def db_for_read(router, model, **hints):
+            # records where a read would go, and serves it from the test database
+            self.reads.append(route(router, model, **hints))
+            return 'default'
+        self.enterContext(mock.patch.object(PrimaryReplicaRouter, 'db_for_read', db_for_read))
+
+    def test_cached_pages_are_built_from_the_primary(self):
+        for path in ('/api/list_services/', '/api/async/list_services/'):
+            with self.subTest(path=path):
+                self.reads.clear()
+                response = self.client.get(path, **auth_header(self.user))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), 1)
+                self.assertTrue(self.reads)
+                self.assertNotIn('replica1', self.reads)
+
+    def test_uncached_lists_still_use_the_replica(self):
+        response = self.client.get('/api/services/search/', **auth_header(self.user))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('replica1', self.reads)
+
+
+class ProfilePictureTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root, IMAGE_VARIANT_SIZES=[64, 128]))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.providers = [
+            CustomUser.objects.create_user(f'provider{i}@example.com', f'+91900000010{i}', 'pw', is_provider=True).provider_profile
+            for i in range(2)
+        ]
+
+    def upload(self, profile, color='red'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), color).save(buffer, 'PNG')
+        profile.profile_picture = SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png')
+        # processing is left to the on_commit hook, which TestCase never runs
+        profile.save()
+        self.uploaded = profile.profile_picture.name
+        return process_profile_picture(ProviderProfile, profile.pk)
+
+    def test_variants(self):
+        variants = self.upload(self.providers[0])
+        self.assertEqual(set(variants['sizes']), {'64', '128'})
+        with default_storage.open(variants['sizes']['128']['webp']) as f, Image.open(f) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (128, 128)))
+        with default_storage.open(variants['sizes']['64']['jpg']) as f, Image.open(f) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (64, 64)))
+
+        profile = ProviderProfile.objects.get(pk=self.providers[0].pk)
+        # the upload was moved to its content hash name
+        self.assertEqual(profile.profile_picture.name, variants['original'])
+        self.assertFalse(default_storage.exists(self.uploaded))
+        urls = ProviderSerializer(profile).data['profile_picture']
+        self.assertEqual(urls['sizes']['64']['webp'], default_storage.url(variants['sizes']['64']['webp']))
+
+    def test_duplicates_share_files(self):
+        first = self.upload(self.providers[0])
+        self.assertEqual(self.upload(self.providers[1]), first)
+        self.assertNotEqual(self.upload(self.providers[1], 'blue')['original'], first['original'])
+
+    def test_unprocessed_picture(self):
+        profile = self.providers[0]
+        profile.profile_picture = SimpleUploadedFile('avatar.png', b'not an image')
+        profile.save()
+        with self.assertLogs('Auth.images', 'WARNING'):
+            self.assertIsNone(process_profile_picture(ProviderProfile, profile.pk))
+        urls = ProviderSerializer(profile).data['profile_picture']
+        self.assertEqual(urls, {'original': profile.profile_picture.url, 'sizes': {}})
+
+
+class MediaServingTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root, MEDIA_ACCEL_REDIRECT=''))
+        cls.body = bytes(range(256)) * 40
+        default_storage.save('provider_pictures/avatar.png', io.BytesIO(cls.body))
+
+    def get(self, path='/media/provider_pictures/avatar.png', **headers):
+        return self.client.get(path, headers=headers)
+
+    def test_full_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertEqual(response['Content-Length'], str(len(self.body)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+    def test_conditional_get(self):
+        first = self.get()
+        self.assertEqual(self.get(**{'If-None-Match': first['ETag']}).status_code, 304)
+        self.assertEqual(self.get(**{'If-Modified-Since': first['Last-Modified']}).status_code, 304)
+        self.assertEqual(self.get(**{'If-None-Match': '"stale"'}).status_code, 200)
+
+    def test_ranges(self):
+        response = self.get(Range='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.body[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.body)}')
+        self.assertEqual(response['Content-Length'], '100')
+
+        response = self.get(Range='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.body[-10:])
+        response = self.get(Range=f'bytes={len(self.body) - 5}-')
+        self.assertEqual(b''.join(response.streaming_content), self.body[-5:])
+
+        response = self.get(Range=f'bytes={len(self.body)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.body)}')
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(Range='bytes=0-9', **{'If-Range': etag}).status_code, 206)
+        # the file changed since the client's partial copy, so it gets all of it
+        self.assertEqual(self.get(Range='bytes=0-9', **{'If-Range': '"stale"'}).status_code, 200)
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.get('/media/provider_pictures/missing.png').status_code, 404)
+        self.assertEqual(self.get('/media/provider_pictures').status_code, 404)
+        self.assertEqual(self.get('/media/../settings.py').status_code, 404)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_accel_redirect(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/provider_pictures/avatar.png')
+        self.assertEqual(response.content, b'')
+
+
+class PrivateMediaTests(TestCase):
+    """
+    provider documents are for their provider and staff only
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root, MEDIA_ACCEL_REDIRECT=''))
+        default_storage.save('provider_documents/upload/kyc.pdf', io.BytesIO(b'kyc'))
+        default_storage.save('other/secret.txt', io.BytesIO(b'secret'))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True)
+        ProviderProfile.objects.filter(user=cls.provider).update(documents='provider_documents/upload/kyc.pdf')
+        cls.other = CustomUser.objects.create_user('other@example.com', '+919000000003', 'pw', is_provider=True)
+        cls.staff = CustomUser.objects.create_user('staff@example.com', '+919000000004', 'pw', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, path='/media/provider_documents/upload/kyc.pdf', user=None):
+        return self.client.get(path, **(auth_header(user) if user else {}))
+
+    def test_owner(self):
+        response = self.get(user=self.provider)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'kyc')
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+
+    def test_others_get_nothing(self):
+        self.assertEqual(self.get().status_code, 404)
+        self.assertEqual(self.get(user=self.other).status_code, 404)
+        self.assertEqual(self.get('/media/images/../provider_documents/upload/kyc.pdf').status_code, 404)
+        # not under a known prefix, so not served to anyone
+        self.assertEqual(self.get('/media/other/secret.txt', user=self.staff).status_code, 404)
+
+    def test_staff(self):
+        self.assertEqual(self.get(user=self.staff).status_code, 200)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.get().status_code, 200)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_accel_redirect_after_the_check(self):
+        self.assertEqual(self.get(user=self.other).status_code, 404)
+        response = self.get(user=self.provider)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/provider_documents/upload/kyc.pdf')
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+
+
+class DocumentUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(
+            MEDIA_ROOT=cls.media_root, UPLOAD_CHUNK_MAX_SIZE=1000,
+        ))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True)
+        cls.customer = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw')
+        cls.body = bytes(range(256)) * 10
+
+    def setUp(self):
+        cache.clear()
+        # each test sees only its own partial files
+        self.partial_dir = tempfile.mkdtemp(dir=self.media_root)
+        self.enterContext(override_settings(UPLOAD_TEMP_DIR=self.partial_dir))
+
+    def start(self, **data):
+        data = {'filename': 'kyc bundle.zip', 'size': len(self.body), 'checksum': hashlib.sha256(self.body).hexdigest()} | data
+        response = self.client.post('/api/uploads/', data, content_type='application/json', **auth_header(self.provider))
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def send(self, upload_id, offset, chunk, checksum=None):
+        return self.client.patch(
+            f'/api/uploads/{upload_id}/', chunk, content_type='application/octet-stream',
+            headers={'Upload-Offset': str(offset), 'Upload-Checksum': checksum or hashlib.sha256(chunk).hexdigest()},
+            **auth_header(self.provider),
+        )
+
+    def test_chunked_upload(self):
+        upload_id = self.start()
+        for offset in range(0, len(self.body), 1000):
+            response = self.send(upload_id, offset, self.body[offset:offset + 1000])
+            self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['status'], 'complete')
+
+        documents = ProviderProfile.objects.get(user=self.provider).documents
+        self.assertEqual(documents.name, f'provider_documents/{upload_id}/kyc_bundle.zip')
+        with documents.open('rb') as f:
+            self.assertEqual(f.read(), self.body)
+
+    def test_resume_after_bad_chunk(self):
+        upload_id = self.start()
+        self.assertEqual(self.send(upload_id, 0, self.body[:1000]).status_code, 200)
+        # corrupted in transit
+        response = self.send(upload_id, 1000, b'x' * 1000, hashlib.sha256(self.body[1000:2000]).hexdigest())
+        self.assertEqual(response.status_code, 400)
+        # a chunk sent twice, or out of order
+        response = self.send(upload_id, 0, self.body[:1000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '1000')
+
+        response = self.client.get(f'/api/uploads/{upload_id}/', **auth_header(self.provider))
+        self.assertEqual(response.json()['offset'], 1000)
+        for offset in range(1000, len(self.body), 1000):
+            self.assertEqual(self.send(upload_id, offset, self.body[offset:offset + 1000]).status_code, 200)
+        with ProviderProfile.objects.get(user=self.provider).documents.open('rb') as f:
+            self.assertEqual(f.read(), self.body)
+
+    def test_limits(self):
+        upload_id = self.start()
+        self.assertEqual(self.send(upload_id, 0, self.body[:1001]).status_code, 413)
+        response = self.client.post('/api/uploads/', {'filename': 'a', 'size': 10, 'checksum': 'nope'},
+                                    content_type='application/json', **auth_header(self.provider))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/uploads/', {'filename': 'a', 'size': 10},
+                                    content_type='application/json', **auth_header(self.customer))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(f'/api/uploads/{upload_id}/', **auth_header(self.customer))
+        self.assertEqual(response.status_code, 403)
+
+    def test_whole_file_checksum(self):
+        upload_id = self.start(checksum='0' * 64)
+        for offset in range(0, len(self.body), 1000):
+            response = self.send(upload_id, offset, self.body[offset:offset + 1000])
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(DocumentUpload.objects.get(pk=upload_id).status, 'failed')
+        self.assertFalse(ProviderProfile.objects.get(user=self.provider).documents)
+
+    def test_filenames(self):
+        for filename in ['..', '', 'a' * 200]:
+            response = self.client.post('/api/uploads/', {'filename': filename, 'size': 10},
+                                        content_type='application/json', **auth_header(self.provider))
+            self.assertEqual(response.status_code, 400, filename)
+        upload_id = self.start(filename='a' * 195 + '.zip')
+        for offset in range(0, len(self.body), 1000):
+            response = self.send(upload_id, offset, self.body[offset:offset + 1000])
+        self.assertEqual(response.json()['status'], 'complete')
+
+    def test_failed_completion_is_retried(self):
+        upload_id = self.start()
+        for offset in range(0, 2000, 1000):
+            self.send(upload_id, offset, self.body[offset:offset + 1000])
+        with mock.patch('Auth.uploads._move_into_place', side_effect=OSError("disk full")):
+            response = self.send(upload_id, 2000, self.body[2000:])
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Upload-Offset'], '2000')
+        upload = DocumentUpload.objects.get(pk=upload_id)
+        self.assertEqual((upload.offset, upload.status), (2000, 'uploading'))
+
+        response = self.send(upload_id, 2000, self.body[2000:])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['status'], 'complete')
+        with ProviderProfile.objects.get(user=self.provider).documents.open('rb') as f:
+            self.assertEqual(f.read(), self.body)
+
+    def test_file_work_runs_outside_transactions(self):
+        upload_id = self.start()
+        for offset in range(0, 2000, 1000):
+            self.send(upload_id, offset, self.body[offset:offset + 1000])
+        # the test case's own transactions
+        depth = len(connection.atomic_blocks)
+        depths = []
+
+        def record(function):
+            def wrapper(*args):
+                depths.append(len(connection.atomic_blocks))
+                return function(*args)
+            return wrapper
+
+        with mock.patch('Auth.uploads.os.fsync', record(os.fsync)), \
+                mock.patch('Auth.uploads.file_checksum', record(uploads.file_checksum)), \
+                mock.patch('Auth.uploads._move_into_place', record(uploads._move_into_place)):
+            self.assertEqual(self.send(upload_id, 2000, self.body[2000:]).status_code, 200)
+        self.assertEqual(depths, [depth] * 3)
+
+    def test_failed_copy_releases_the_claim(self):
+        upload_id = self.start()
+        with mock.patch('Auth.uploads.os.fsync', side_effect=OSError("I/O error")):
+            response = self.send(upload_id, 0, self.body[:1000])
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Upload-Offset'], '0')
+        self.assertEqual(DocumentUpload.objects.get(pk=upload_id).offset, 0)
+        self.assertEqual(self.send(upload_id, 0, self.body[:1000]).status_code, 200)
+
+    def test_failed_commit_puts_the_file_back(self):
+        upload_id = self.start()
+        for offset in range(0, 2000, 1000):
+            self.send(upload_id, offset, self.body[offset:offset + 1000])
+        upload = DocumentUpload.objects.get(pk=upload_id)
+        chunk = self.body[2000:]
+        with mock.patch('Auth.uploads.ProviderProfile.objects.select_for_update', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                uploads.write_chunk(upload, io.BytesIO(chunk), 2000, len(chunk), hashlib.sha256(chunk).hexdigest())
+        self.assertEqual(DocumentUpload.objects.get(pk=upload_id).offset, 2000)
+        self.assertEqual(os.listdir(self.media_root + f'/provider_documents/{upload_id}'), [])
+        response = self.send(upload_id, 2000, chunk)
+        self.assertEqual(response.json()['status'], 'complete')
+        with ProviderProfile.objects.get(user=self.provider).documents.open('rb') as f:
+            self.assertEqual(f.read(), self.body)
+
+    def test_slow_chunk_loses_the_race(self):
+        upload_id = self.start()
+        upload = DocumentUpload.objects.get(pk=upload_id)
+        stage = uploads._stage_chunk
+        raced = []
+
+        def slow_stage(*args):
+            path = stage(*args)
+            if not raced:
+                raced.append(True)
+                # the lock expired while this chunk arrived and the same range came again
+                cache.clear()
+                self.assertEqual(self.send(upload_id, 0, self.body[:1000]).status_code, 200)
+            return path
+
+        with mock.patch('Auth.uploads._stage_chunk', slow_stage):
+            with self.assertRaises(uploads.UploadError) as raised:
+                uploads.write_chunk(upload, io.BytesIO(b'x' * 1000), 0, 1000, hashlib.sha256(b'x' * 1000).hexdigest())
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(DocumentUpload.objects.get(pk=upload_id).offset, 1000)
+        with open(uploads.partial_path(upload), 'rb') as f:
+            self.assertEqual(f.read(), self.body[:1000])
+        # only the partial file is left, the staged chunks are gone
+        self.assertEqual(os.listdir(self.partial_dir), [f'{upload_id}.part'])
+
+    def test_clean_stale_uploads(self):
+        stale = self.start()
+        self.send(stale, 0, self.body[:1000])
+        fresh = self.start()
+        DocumentUpload.objects.filter(pk=stale).update(updated_at=timezone.now() - timedelta(days=2))
+        orphan = f'{self.partial_dir}/{uuid.uuid4()}.part'
+        open(orphan, 'wb').close()
+        old = (timezone.now() - timedelta(days=2)).timestamp()
+        for name in [orphan, f'{self.partial_dir}/{stale}.part']:
+            os.utime(name, (old, old))
+
+        call_command('clean_uploads', max_age=24 * 3600, stdout=io.StringIO())
+        self.assertEqual(list(DocumentUpload.objects.values_list('pk', flat=True)), [uuid.UUID(fresh)])
+        self.assertEqual(os.listdir(self.partial_dir), [f'{fresh}.part'])
+
+    def test_abort(self):
+        upload_id = self.start()
+        self.send(upload_id, 0, self.body[:1000])
+        response = self.client.delete(f'/api/uploads/{upload_id}/', **auth_header(self.provider))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(DocumentUpload.objects.filter(pk=upload_id).exists())
+        self.assertEqual(os.listdir(self.partial_dir), [])
+
+
+class AsyncViewTests(TestCase):
+    """
+    the async views answer what their sync counterparts answer
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw')
+        cls.other = CustomUser.objects.create_user('other@example.com', '+919000000003', 'pw')
+        cls.provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True)
+        services = [
+            Service.objects.create(name=f'Service {i}', description='d', price=100 + i, provider=cls.provider.provider_profile)
+            for i in range(5)
+        ]
+        start = (timezone.now() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+        cls.bookings = [
+            Booking.objects.create(customer=cls.customer.customer_profile, service=service, schedule=start + timedelta(hours=i))
+            for i, service in enumerate(services[:3])
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, path, user=None, **params):
+        return self.client.get(path, params, **(auth_header(user) if user else {}))
+
+    def walk(self, path, user):
+        results = []
+        response = self.get(path, user, page_size=2)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            results += response.json()['results']
+            if not response.json()['next']:
+                return results
+            response = self.get(response.json()['next'], user)
+
+    def test_service_pages(self):
+        pages = self.walk('/api/async/list_services/', self.customer)
+        self.assertEqual(len(pages), 5)
+        self.assertEqual(pages, self.walk('/api/list_services/', self.customer))
+
+    def test_customer_bookings(self):
+        response = self.get('/api/async/my/', self.customer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.get('/api/my/', self.customer).json())
+        self.assertEqual([row['id'] for row in response.json()], [str(booking.pk) for booking in self.bookings])
+        # a provider has no bookings of their own
+        self.assertEqual(self.get('/api/async/my/', self.provider).json(), [])
+
+    def test_booking_detail(self):
+        path = f'/api/async/bookings/{self.bookings[0].pk}/'
+        for user in (self.customer, self.provider):
+            response = self.get(path, user)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['id'], str(self.bookings[0].pk))
+        self.assertEqual(self.get(path, self.other).status_code, 403)
+        self.assertEqual(self.get(path).status_code, 401)
+        self.assertEqual(self.get(f'/api/async/bookings/{uuid.uuid4()}/', self.customer).status_code, 404)
+
+    def test_bad_token(self):
+        response = self.client.get('/api/async/my/', HTTP_AUTHORIZATION='Bearer nonsense')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+
+
+class AsyncMiddlewareTests(TestCase):
+    async def test_session_user_is_resolved_off_the_event_loop(self):
+        user = await CustomUser.objects.acreate(email='customer@example.com', phone_number='+919000000001')
+        await self.async_client.aforce_login(user)
+        with self.assertLogs('api_logger') as logs:
+            response = await self.async_client.get('/api/async/my/')
+        # the async views take bearer tokens only, the session is just logged
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(logs.records[0].route, 'api/async/my/')
+        self.assertEqual(logs.records[0].user, str(user.pk))
+
+
+class RequestLoggingTests(TestCase):
+    def test_user_is_logged_by_id(self):
+        user = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw')
+        with self.assertLogs('api_logger') as logs:
+            self.client.get('/api/list_services/', **auth_header(user))
+            self.client.get('/api/list_services/')
+        self.assertEqual([record.user for record in logs.records], [str(user.pk), 'Anonymous'])
+
+
+class RequestMetricsTests(SimpleTestCase):
+    def test_histogram_and_quantiles(self):
+        metrics = RequestMetrics(buckets=(0.1, 1.0))
+        for duration in [0.05] * 8 + [0.5, 5.0]:
+            metrics.observe('GET', 'api/x/', 200, duration)
+        metrics.observe('GET', 'api/x/', 500, 0.05)
+        histograms, statuses = metrics.snapshot()
+        counts, total, count, quantiles = histograms[('GET', 'api/x/')]
+        self.assertEqual(counts, [9, 1, 1])
+        self.assertEqual(count, 11)
+        self.assertAlmostEqual(total, 5.95)
+        self.assertEqual(statuses, {('GET', 'api/x/', 200): 10, ('GET', 'api/x/', 500): 1})
+        # the median is interpolated inside the first bucket, p99 falls in +Inf
+        self.assertAlmostEqual(quantiles[0.5], 0.1 * 5.5 / 9)
+        self.assertEqual(quantiles[0.99], 1.0)
+
+    def test_render(self):
+        metrics = RequestMetrics(buckets=(0.1, 1.0))
+        metrics.observe('GET', 'api/"x"/', 200, 0.5)
+        text = metrics.render()
+        self.assertIn('http_requests_total{method="GET",route="api/\\"x\\"/",status="200"} 1\n', text)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="api/\\"x\\"/",le="0.1"} 0\n', text)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="api/\\"x\\"/",le="1.0"} 1\n', text)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="api/\\"x\\"/",le="+Inf"} 1\n', text)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="api/\\"x\\"/"} 1\n', text)
+        self.assertIn('log_records_dropped_total 0\n', text)
+
+    def test_requests_are_observed_by_route(self):
+        get_metrics().reset()
+        self.addCleanup(get_metrics().reset)
+        self.client.get(f'/api/services/{uuid.uuid4()}/slots/')
+        _, statuses = get_metrics().snapshot()
+        self.assertEqual(statuses, {('GET', 'api/services/<uuid:pk>/slots/', 401): 1})
+
+
+class LogHandlingTests(SimpleTestCase):
+    def record(self, status=200, duration_ms=1.0, level=logging.INFO):
+        record = logging.LogRecord('api_logger', level, __file__, 1, 'request %s', ('x',), None)
+        record.status = status
+        record.duration_ms = duration_ms
+        return record
+
+    def test_json_formatter(self):
+        record = self.record()
+        record.user = uuid.UUID(int=1)
+        data = json.loads(JSONFormatter().format(record))
+        self.assertEqual(data['message'], 'request x')
+        self.assertEqual(data['status'], 200)
+        self.assertEqual(data['user'], str(uuid.UUID(int=1)))
+        self.assertNotIn('args', data)
+
+    def test_sampling_keeps_errors_and_slow_requests(self):
+        sampling = SamplingFilter(rate=0.0, slow_threshold=1.0)
+        self.assertFalse(sampling.filter(self.record()))
+        self.assertTrue(sampling.filter(self.record(status=500)))
+        self.assertTrue(sampling.filter(self.record(duration_ms=1500)))
+        self.assertTrue(sampling.filter(self.record(level=logging.WARNING)))
+
+    def test_full_queue_drops_records(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'api.log')
+        handler = QueuedFileHandler(path, maxsize=1)
+        handler.setFormatter(JSONFormatter())
+        # nothing drains the queue while the listener is stopped
+        handler.listener.stop()
+        for _ in range(3):
+            handler.handle(self.record())
+        self.assertEqual(handler.dropped, 2)
+        handler.listener.start()
+        handler.close()
+        with open(path) as f:
+            self.assertEqual(json.loads(f.read())['message'], 'request x')
+
+
+def gateway_response(status_code, payload=None):
+    return SimpleNamespace(status_code=status_code, json=lambda: payload)
+
+
+def refused():
+    # what requests raises when nothing listens on the gateway's port
+    return requests.ConnectionError(MaxRetryError(None, '/orders', NewConnectionError(None, 'Connection refused')))
+
+
+@override_settings(METRICS_TOKEN='scrape-token')
+class MetricsAccessTests(TestCase):
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+    def test_staff_only(self):
+        user = CustomUser.objects.create_user('user@example.com', '+919000000001', 'pw')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_no_token_configured(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+
+class PaymentGatewayTests(SimpleTestCase):
+    def gateway(self, responses, threshold=2, reset_timeout=60):
+        gateway = RazorpayGateway('http://gateway.test', 'key', 'secret', retries=1, backoff=0,
+                                  breaker=CircuitBreaker(threshold, reset_timeout))
+        gateway.session.request = mock.Mock(side_effect=responses)
+        return gateway
+
+    def test_retries_then_succeeds(self):
+        gateway = self.gateway([gateway_response(503), gateway_response(200, {'id': 'order_1'})])
+        self.assertEqual(gateway.create_order({'amount': 100}), {'id': 'order_1'})
+        self.assertEqual(gateway.session.request.call_count, 2)
+        self.assertEqual(gateway.breaker.state, 'closed')
+
+    def test_client_errors_are_not_retried(self):
+        gateway = self.gateway([gateway_response(400, {'error': {'description': 'Bad amount'}})])
+        with self.assertRaisesMessage(PaymentGatewayError, 'Bad amount'):
+            gateway.create_order({'amount': 1})
+        self.assertEqual(gateway.session.request.call_count, 1)
+        self.assertEqual(gateway.breaker.failures, 0)
+
+    def test_breaker_opens_and_recovers(self):
+        gateway = self.gateway([refused()] * 4 + [gateway_response(200, {'id': 'order_1'})])
+        for _ in range(2):
+            with self.assertRaises(PaymentGatewayError):
+                gateway.create_order({'amount': 100})
+        self.assertEqual(gateway.breaker.state, 'open')
+        with self.assertRaises(GatewayUnavailable):
+            gateway.create_order({'amount': 100})
+        self.assertEqual(gateway.session.request.call_count, 4)
+
+        gateway.breaker.reset_timeout = 0
+        self.assertEqual(gateway.breaker.state, 'half-open')
+        self.assertEqual(gateway.create_order({'amount': 100}), {'id': 'order_1'})
+        self.assertEqual(gateway.breaker.state, 'closed')
+
+    def test_half_open_trial_always_ends(self):
+        gateway = self.gateway([
+            requests.exceptions.ChunkedEncodingError(),
+            RuntimeError("bug"),
+            gateway_response(200, {'id': 'order_1'}),
+        ], threshold=1, reset_timeout=0)
+        gateway.breaker.opened_at = 0.0
+        # a truncated body is a gateway failure like any other
+        with self.assertRaises(PaymentGatewayError):
+            gateway.create_order({'amount': 100})
+        # anything else still lets the next call be the trial
+        with self.assertRaises(RuntimeError):
+            gateway.create_order({'amount': 100})
+        self.assertEqual(gateway.create_order({'amount': 100}), {'id': 'order_1'})
+
+    def test_orders_are_resent_only_when_never_acted_on(self):
+        order = gateway_response(200, {'id': 'order_1'})
+        for failure in [refused(), requests.ConnectTimeout(), gateway_response(429), gateway_response(503)]:
+            with self.subTest(failure=failure):
+                gateway = self.gateway([failure, order])
+                self.assertEqual(gateway.create_order({'amount': 100}), {'id': 'order_1'})
+        # the gateway may have created the order before these
+        for failure in [requests.ReadTimeout(), requests.ConnectionError(), gateway_response(500), gateway_response(502)]:
+            with self.subTest(failure=failure):
+                gateway = self.gateway([failure, order])
+                with self.assertRaises(PaymentGatewayError):
+                    gateway.create_order({'amount': 100})
+                self.assertEqual(gateway.session.request.call_count, 1)
+
+    def test_async_orders_are_resent_only_when_never_acted_on(self):
+        order = gateway_response(200, {'id': 'order_1'})
+        for failure, resent in [(httpx.ConnectError('refused'), True), (httpx.ReadTimeout('slow'), False)]:
+            with self.subTest(failure=failure):
+                gateway = self.gateway([])
+                client = mock.Mock(request=mock.AsyncMock(side_effect=[failure, order]))
+                with mock.patch.object(gateway, '_async_client', return_value=client):
+                    if resent:
+                        self.assertEqual(asyncio.run(gateway.acreate_order({'amount': 100})), {'id': 'order_1'})
+                    else:
+                        with self.assertRaises(PaymentGatewayError):
+                            asyncio.run(gateway.acreate_order({'amount': 100}))
+                self.assertEqual(client.request.call_count, 2 if resent else 1)
+
+    def test_success_without_an_order(self):
+        unreadable = SimpleNamespace(status_code=200, json=mock.Mock(side_effect=ValueError))
+        for response in [unreadable, gateway_response(200, []), gateway_response(201, {'status': 'created'})]:
+            with self.subTest(response=response):
+                gateway = self.gateway([response])
+                with self.assertRaisesMessage(PaymentGatewayError, 'without an entity'):
+                    gateway.create_order({'amount': 100})
+                self.assertEqual(gateway.session.request.call_count, 1)
+
+    def test_one_deadline_for_all_attempts(self):
+        gateway = self.gateway([gateway_response(503)] * 3)
+        gateway.timeout, gateway.connect_timeout = 5.0, 3.0
+        with mock.patch('Auth.payments.time.monotonic', side_effect=[100.0, 100.0, 103.0, 104.0, 104.0, 106.0, 106.0]):
+            with self.assertRaisesMessage(PaymentGatewayError, 'Payment gateway returned 503'):
+                gateway.create_order({'amount': 100})
+        # the second attempt only gets what the first left over
+        timeouts = [call.kwargs['timeout'] for call in gateway.session.request.call_args_list]
+        self.assertEqual(timeouts, [(3.0, 5.0), (1.0, 1.0)])
+
+    @override_settings(PAYMENT_GATEWAY='razorpay', RAZORPAY_API_BASE='http://gateway.test/v1/', PAYMENT_GATEWAY_TIMEOUT=4.0,
+                       PAYMENT_GATEWAY_RETRIES=1, PAYMENT_BREAKER_THRESHOLD=3)
+    def test_gateway_from_settings(self):
+        self.enterContext(mock.patch('Auth.payments._gateway', None))
+        gateway = get_gateway()
+        self.assertIsInstance(gateway, RazorpayGateway)
+        self.assertEqual((gateway.base_url, gateway.timeout, gateway.retries, gateway.breaker.failure_threshold),
+                         ('http://gateway.test/v1', 4.0, 1, 3))
+        # one per process, its pool and breaker are shared
+        self.assertIs(get_gateway(), gateway)
+        with mock.patch('Auth.payments._gateway', None), override_settings(PAYMENT_GATEWAY='stub'):
+            self.assertIsInstance(get_gateway(), StubGateway)
+
+    def test_cancelled_async_trial(self):
+        gateway = self.gateway([], threshold=1, reset_timeout=0)
+        gateway.breaker.opened_at = 0.0
+        client = mock.Mock(request=mock.AsyncMock(side_effect=[asyncio.CancelledError(), gateway_response(200, {'id': 'order_1'})]))
+        with mock.patch.object(gateway, '_async_client', return_value=client):
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(gateway.acreate_order({'amount': 100}))
+            self.assertEqual(asyncio.run(gateway.acreate_order({'amount': 100})), {'id': 'order_1'})
+
+
+@mock.patch('Auth.views.get_gateway', StubGateway)
+class PaymentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw')
+        cls.other = CustomUser.objects.create_user('other@example.com', '+919000000003', 'pw')
+        provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True).provider_profile
+        service = Service.objects.create(name='Service', description='d', price='499.50', provider=provider)
+        cls.booking = Booking.objects.create(
+            customer=cls.customer.customer_profile, service=service, schedule=timezone.now() + timedelta(days=1),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def create_order(self, user=None, **data):
+        headers = auth_header(user) if user else {}
+        return self.client.post('/api/payment/create/', {'booking': str(self.booking.pk), **data},
+                                content_type='application/json', **headers)
+
+    def webhook(self, event, order_id, amount=49950, currency='INR', event_id=None):
+        body = {'event': event, 'payload': {'payment': {'entity': {
+            'id': 'pay_1', 'order_id': order_id, 'amount': amount, 'currency': currency,
+        }}}}
+        return enqueue_event(JSONRenderer().render(body), event_id)
+
+    def test_amount_comes_from_the_service(self):
+        response = self.create_order(self.customer, amount=1)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['amount'], 49950)
+        payment = Payment.objects.get(order_id=response.json()['order_id'])
+        self.assertEqual((payment.amount, payment.booking_id), (49950, self.booking.pk))
+
+    def test_only_the_customer_pays_for_a_booking(self):
+        self.assertEqual(self.create_order().status_code, 401)
+        self.assertEqual(self.create_order(self.other).status_code, 400)
+        self.assertEqual(self.create_order(self.customer, booking='not-a-uuid').status_code, 400)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_gateway_failures(self):
+        for error, status_code in [(GatewayUnavailable('open'), 503), (PaymentGatewayError('Bad amount'), 502)]:
+            with self.subTest(error=error), mock.patch('Auth.views.get_gateway') as get:
+                get.return_value.create_order.side_effect = error
+                with self.assertLogs('django.request', 'ERROR'):
+                    response = self.create_order(self.customer)
+                self.assertEqual(response.status_code, status_code)
+                self.assertEqual(response.json(), {'error': str(error)})
+        self.assertFalse(Payment.objects.exists())
+
+    async def test_async_view_checks_the_booking(self):
+        async def create_order(user=None):
+            # the async client takes headers by name, not as WSGI environ keys
+            headers = {'Authorization': auth_header(user)['HTTP_AUTHORIZATION']} if user else {}
+            return await self.async_client.post('/api/async/payment/create/', {'booking': str(self.booking.pk)},
+                                                content_type='application/json', headers=headers)
+        self.assertEqual((await create_order()).status_code, 401)
+        self.assertEqual((await create_order(self.other)).status_code, 400)
+        with mock.patch('Auth.async_views.get_gateway', StubGateway):
+            response = await create_order(self.customer)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['amount'], 49950)
+
+    async def test_async_views_want_a_json_object(self):
+        headers = {'Authorization': auth_header(self.customer)['HTTP_AUTHORIZATION']}
+        for body in ['[]', '1', '"booking"', 'null', '{']:
+            with self.subTest(body=body):
+                response = await self.async_client.post('/api/async/payment/create/', body,
+                                                        content_type='application/json', headers=headers)
+                self.assertEqual(response.status_code, 400)
+                response = await self.async_client.post('/api/async/payment/verify/', body, content_type='application/json')
+                self.assertEqual(response.json(), {'error': 'Invalid data'})
+
+    def test_capture_confirms_the_booking(self):
+        order_id = self.create_order(self.customer).json()['order_id']
+        self.webhook('payment.authorized', order_id, event_id='evt_1')
+        self.webhook('payment.captured', order_id, event_id='evt_2')
+        # a redelivery is dropped on enqueue
+        self.webhook('payment.captured', order_id, event_id='evt_2')
+        self.assertEqual(process_batch(), 2)
+        self.assertEqual(Payment.objects.get(order_id=order_id).status, 'captured')
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'confirmed')
+        self.assertEqual(ProviderBookingStats.objects.get(status='confirmed').count, 1)
+        self.assertEqual(ProviderBookingStats.objects.get(status='pending').count, 0)
+
+    def test_events_apply_in_rank_order(self):
+        order_id = self.create_order(self.customer).json()['order_id']
+        # captured arrives before the authorization it follows
+        self.webhook('payment.captured', order_id, event_id='evt_1')
+        self.webhook('payment.authorized', order_id, event_id='evt_2')
+        process_batch()
+        self.webhook('payment.failed', order_id, event_id='evt_3')
+        process_batch()
+        self.assertEqual(Payment.objects.get(order_id=order_id).status, 'captured')
+
+    def test_wrong_amount_does_not_confirm(self):
+        order_id = self.create_order(self.customer).json()['order_id']
+        self.webhook('payment.captured', order_id, amount=100, event_id='evt_1')
+        self.webhook('payment.captured', order_id, currency='USD', event_id='evt_2')
+        self.webhook('payment.captured', 'order_unknown', event_id='evt_3')
+        self.assertEqual(process_batch(), 3)
+        self.assertEqual(Payment.objects.get(order_id=order_id).status, 'created')
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'pending')
+        errors = dict(PaymentWebhookEvent.objects.values_list('event_id', 'error'))
+        self.assertIn('the order is for 49950 INR', errors['evt_1'])
+        self.assertIn('the order is for 49950 INR', errors['evt_2'])
+        self.assertEqual(errors['evt_3'], 'Unknown order')
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET='whsec')
+class PaymentWebhookTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw').customer_profile
+        provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True).provider_profile
+        service = Service.objects.create(name='Service', description='d', price=500, provider=provider)
+        schedule = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        cls.orders = []
+        for i in range(3):
+            booking = Booking.objects.create(customer=customer, service=service, schedule=schedule + timedelta(hours=i))
+            cls.orders.append(Payment.objects.create(order_id=f'order_{i}', booking=booking, amount=50000).order_id)
+
+    def body(self, event, order_id, payment_id='pay_1'):
+        return json.dumps({'event': event, 'payload': {'payment': {'entity': {
+            'id': payment_id, 'order_id': order_id, 'amount': 50000, 'currency': 'INR',
+        }}}}).encode()
+
+    def deliver(self, body, signature=None, event_id=None):
+        headers = {'HTTP_X_RAZORPAY_SIGNATURE': signature or hmac.new(b'whsec', body, hashlib.sha256).hexdigest()}
+        if event_id:
+            headers['HTTP_X_RAZORPAY_EVENT_ID'] = event_id
+        return self.client.post('/api/payment/webhook/', body, content_type='application/json', **headers)
+
+    def test_endpoint_verifies_and_queues(self):
+        body = self.body('payment.captured', 'order_0')
+        self.assertEqual(self.deliver(body, signature='0' * 64).status_code, 400)
+        with override_settings(RAZORPAY_WEBHOOK_SECRET=''):
+            self.assertEqual(self.deliver(body).status_code, 400)
+        self.assertEqual(self.deliver(b'[1]').status_code, 400)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.deliver(body, event_id='evt_1').json(), {'status': 'queued'})
+        self.assertEqual(self.deliver(body, event_id='evt_1').status_code, 200)
+        # without an event id the body hash tells redeliveries apart
+        self.deliver(body)
+        self.deliver(body)
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 2)
+        # nothing is applied until the worker runs
+        self.assertEqual(Payment.objects.get(order_id='order_0').status, 'created')
+
+    def queue(self, per_order):
+        for order_id in self.orders:
+            for i in range(per_order):
+                enqueue_event(self.body('payment.authorized' if i % 2 else 'payment.captured', order_id), f'{order_id}-{i}')
+
+    def test_batch_cost_does_not_grow_with_events(self):
+        with transaction.atomic():
+            self.queue(per_order=1)
+            with CaptureQueriesContext(connection) as few:
+                self.assertEqual(process_batch(), 3)
+            transaction.set_rollback(True)
+        self.queue(per_order=5)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(process_batch(), 15)
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(set(Payment.objects.values_list('status', flat=True)), {'captured'})
+
+    def test_unusable_events_are_marked(self):
+        enqueue_event(json.dumps({'event': 'payment.dispute', 'payload': {}}).encode(), 'evt_1')
+        enqueue_event(json.dumps({'event': 'payment.captured', 'payload': {}}).encode(), 'evt_2')
+        process_batch()
+        self.assertEqual(dict(PaymentWebhookEvent.objects.values_list('event_id', 'error')), {
+            'evt_1': 'Unhandled event payment.dispute', 'evt_2': 'Event has no order id',
+        })
+        self.assertFalse(PaymentWebhookEvent.objects.filter(processed_at=None).exists())
+
+    def test_command_drains_the_queue_in_batches(self):
+        self.queue(per_order=2)
+        out = io.StringIO()
+        call_command('process_payment_webhooks', batch_size=4, stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['Applied 4 events', 'Applied 2 events', 'Processed 6 webhook events'])
+        self.assertFalse(PaymentWebhookEvent.objects.filter(processed_at=None).exists())
+
+
+class ValuesSerializerTests(TestCase):
+    """
+    the values serializers have to render byte for byte what the
+    ModelSerializers they replace render
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = CustomUser.objects.create_user('customer@example.com', '+919000000001', 'pw').customer_profile
+        provider = CustomUser.objects.create_user('provider@example.com', '+919000000002', 'pw', is_provider=True).provider_profile
+        ProviderProfile.objects.filter(pk=provider.pk).update(
+            first_name='Zoë', address='Pune\u2028Camp', profile_picture='images/ab/cd/abcd.png',
+            picture_variants={'original': 'images/ab/cd/abcd.png', 'sizes': {'64': {'webp': 'images/ab/cd/abcd-64.webp'}}},
+        )
+        other = CustomUser.objects.create_user('other@example.com', '+919000000003', 'pw', is_provider=True).provider_profile
+        for i, profile in enumerate([provider, other]):
+            service = Service.objects.create(name=f'Service {i}', description='d', price='499.5', provider=profile)
+            Booking.objects.create(customer=customer, service=service, schedule=timezone.now() + timedelta(days=1, microseconds=i))
+
+    def assertSameOutput(self, queryset, serializer_class, values_serializer_class):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        rows = values_serializer_class.values(queryset)
+        self.assertEqual(ORJSONRenderer().render(values_serializer_class.serialize(rows)), expected)
+
+    def test_services(self):
+        self.assertSameOutput(Service.objects.select_related('provider').order_by('name'), ServiceSerializer, ServiceValuesSerializer)
+
+    def test_bookings(self):
+        self.assertSameOutput(Booking.objects.order_by('schedule'), BookingSerializer, BookingValuesSerializer)
+        with timezone.override('Asia/Kolkata'):
+            self.assertSameOutput(Booking.objects.order_by('schedule'), BookingSerializer, BookingValuesSerializer)
+
+    def test_renderer_fallbacks(self):
+        data = {'price': Decimal('1.50'), 'detail': gettext_lazy('Not found.'), 1: 'int key', 'big': 2 ** 70}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        # indented output is left to JSONRenderer
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
@@ -0,0 +1,273 @@
+"""
+resumable chunked uploads of provider documents.
+
+a client creates an upload with the file's name, size and optionally its
+SHA-256, then PATCHes raw chunks with the offset they start at and the
+SHA-256 of the chunk. each chunk is streamed from the request to a file of
+its own in UPLOAD_TEMP_DIR, so memory use does not depend on the chunk size,
+and only a chunk with the right checksum is copied into the partial file. the
+range is claimed first with a conditional UPDATE that moves the offset on, so
+of two requests sending the same range only one ever writes it. the file work,
+copying, hashing and moving, happens after that short transaction, the
+database write lock is never held while a disk is busy. a claim whose copy
+fails is released again. a client that lost track asks for the offset and
+resumes from there. the last chunk moves the file into MEDIA_ROOT with a
+rename, so the documents are never seen half written.
+
+uploads left unfinished are removed by the clean_uploads command
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .cache import get_cache
+from .models import DocumentUpload, ProviderProfile
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """
+    a rejected chunk. `status` is the HTTP status to answer with
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def partial_path(upload):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, f'{upload.pk}.part')
+
+
+def document_dir(upload_pk):
+    return f'provider_documents/{upload_pk}/'
+
+
+# the stored name has to fit ProviderProfile.documents
+MAX_FILENAME_LENGTH = ProviderProfile._meta.get_field('documents').max_length - len(document_dir(uuid.UUID(int=0)))
+
+
+def final_name(upload):
+    return document_dir(upload.pk) + get_valid_filename(upload.filename)
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def start_upload(provider, filename, size, checksum=''):
+    upload = DocumentUpload.objects.create(provider=provider, filename=filename, size=size, checksum=checksum.lower())
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    open(partial_path(upload), 'wb').close()
+    return upload
+
+
+def _lock_key(upload):
+    return f"upload:lock:{upload.pk}"
+
+
+def write_chunk(upload, stream, offset, length, checksum):
+    """
+    writes `length` bytes read from `stream` at `offset` and returns the new
+    offset. a chunk racing another one for the same offset is refused with a
+    409
+    """
+    if length <= 0:
+        raise UploadError("Empty chunk.")
+    if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+        raise UploadError(f"Chunks cannot exceed {settings.UPLOAD_CHUNK_MAX_SIZE} bytes.", status=413)
+
+    cache = get_cache()
+    # saves reading a second copy of a chunk that is still arriving. a slow
+    # chunk can outlive it, the conditional UPDATE in _apply_chunk is what
+    # keeps two writers apart
+    if not cache.add(_lock_key(upload), 1, timeout=300):
+        raise UploadError("Another chunk of this upload is being written.", status=409)
+    try:
+        # the previous chunk may have landed since the upload was read
+        upload.refresh_from_db(fields=['offset', 'status'])
+        if upload.status != 'uploading':
+            raise UploadError(f"The upload is {upload.status}.", status=409)
+        if offset != upload.offset:
+            raise UploadError(f"Expected offset {upload.offset}.", status=409)
+        if offset + length > upload.size:
+            raise UploadError("The chunk runs past the declared size.")
+
+        staged = _stage_chunk(upload, stream, length, checksum)
+        try:
+            _apply_chunk(upload, staged, offset, length)
+        finally:
+            os.remove(staged)
+        return upload.offset
+    finally:
+        cache.delete(_lock_key(upload))
+
+
+def _stage_chunk(upload, stream, length, checksum):
+    """
+    the path of a file holding the chunk, once its checksum matched
+    """
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=settings.UPLOAD_TEMP_DIR, prefix=f'{upload.pk}.', suffix='.chunk')
+    try:
+        with open(fd, 'wb') as f:
+            digest = hashlib.sha256()
+            received = 0
+            while received < length:
+                data = stream.read(min(READ_SIZE, length - received))
+                if not data:
+                    raise UploadError("The chunk ended early.")
+                digest.update(data)
+                f.write(data)
+                received += len(data)
+        if digest.hexdigest() != checksum.lower():
+            raise UploadError("Chunk checksum mismatch.")
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def _apply_chunk(upload, staged, offset, length):
+    """
+    claims offset..offset + length and copies the staged chunk there. the
+    claim only succeeds for the writer that still sees the offset it started
+    from, and a copy or completion that fails releases it again
+    """
+    end = offset + length
+    claimed = DocumentUpload.objects.filter(pk=upload.pk, offset=offset, status='uploading').update(
+        offset=end, updated_at=timezone.now(),
+    )
+    if not claimed:
+        raise UploadError("Another chunk was written at this offset.", status=409)
+    try:
+        with open(staged, 'rb') as source, open(partial_path(upload), 'r+b') as f:
+            f.seek(offset)
+            shutil.copyfileobj(source, f, READ_SIZE)
+            f.flush()
+            os.fsync(f.fileno())
+        completed = end < upload.size or complete_upload(upload)
+    except BaseException as e:
+        _release_claim(upload, offset, end)
+        if isinstance(e, OSError):
+            raise UploadError("The chunk could not be stored, send it again.", status=503)
+        raise
+    upload.offset = end
+    if not completed:
+        os.remove(partial_path(upload))
+        raise UploadError("File checksum mismatch, the upload has to start over.", status=422)
+
+
+def _release_claim(upload, offset, end):
+    """
+    moves the offset back to where the failed chunk started, so the client
+    sends it again
+    """
+    released = DocumentUpload.objects.filter(pk=upload.pk, offset=end, status='uploading').update(offset=offset)
+    if not released:
+        # only possible once the cache lock expired and a later chunk was
+        # claimed meanwhile. the partial file has a hole, nothing to resume
+        DocumentUpload.objects.filter(pk=upload.pk).update(status='failed', error="A chunk could not be stored")
+        raise UploadError("A chunk could not be stored, the upload has to start over.", status=422)
+
+
+def _move_into_place(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.replace(source, target)
+    except OSError:
+        # another filesystem, copy next to the target and rename from there
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.part')
+        os.close(fd)
+        shutil.copyfile(source, tmp)
+        os.replace(tmp, target)
+        os.remove(source)
+
+
+def complete_upload(upload):
+    """
+    sets the finished file as the provider's documents. False when the file
+    fails its checksum, which fails the upload. the file is hashed and moved
+    outside any transaction, only the two row updates hold the write lock
+    """
+    path = partial_path(upload)
+    if upload.checksum and file_checksum(path) != upload.checksum:
+        DocumentUpload.objects.filter(pk=upload.pk).update(status='failed', error="File checksum mismatch")
+        upload.status = 'failed'
+        return False
+
+    name = final_name(upload)
+    target = default_storage.path(name)
+    _move_into_place(path, target)
+    try:
+        with transaction.atomic():
+            DocumentUpload.objects.filter(pk=upload.pk).update(status='complete')
+            # save() so the profile receivers drop the cached user
+            provider = ProviderProfile.objects.select_for_update().get(pk=upload.provider_id)
+            provider.documents = name
+            provider.save(update_fields=['documents'])
+    except BaseException:
+        # the rows are unchanged, the file goes back for the retried last chunk
+        _move_into_place(target, path)
+        raise
+    upload.status = 'complete'
+    return True
+
+
+def abort_upload(upload):
+    cache = get_cache()
+    if not cache.add(_lock_key(upload), 1, timeout=300):
+        raise UploadError("A chunk of this upload is being written.", status=409)
+    try:
+        DocumentUpload.objects.filter(pk=upload.pk).delete()
+        try:
+            os.remove(partial_path(upload))
+        except FileNotFoundError:
+            pass
+    finally:
+        cache.delete(_lock_key(upload))
+
+
+def clean_stale_uploads(max_age):
+    """
+    removes the uploads that received no chunk for max_age seconds and every
+    file in UPLOAD_TEMP_DIR that no unfinished upload owns. returns how many
+    uploads and files went
+    """
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    # one conditional DELETE, an upload a chunk reached since is kept
+    uploads, _ = DocumentUpload.objects.filter(status='uploading', updated_at__lt=cutoff).delete()
+
+    live = {str(pk) for pk in DocumentUpload.objects.filter(status='uploading').values_list('pk', flat=True)}
+    files = 0
+    try:
+        entries = list(os.scandir(settings.UPLOAD_TEMP_DIR))
+    except FileNotFoundError:
+        entries = []
+    for entry in entries:
+        # <upload id>.part and <upload id>.<random>.chunk
+        if entry.name.split('.', 1)[0] in live or not entry.is_file():
+            continue
+        # an upload being started creates its row just before the file
+        if entry.stat().st_mtime >= cutoff.timestamp():
+            continue
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+        files += 1
+    return uploads, files
@@ -2,19 +2,32 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny,IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status,generics, permissions
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.views import APIView
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied
 
 
-from .models import Booking,CustomUser,Service,ProviderProfile
-from .serializers import SignUpserializer, LoginSerializer, OTPVerifySerializer,BookingSerializer,ServiceSerializerAdmin, ServiceSerializer
+from .models import Booking,CustomUser,Service,ProviderProfile,ProviderBookingStats,DocumentUpload
+from .serializers import SignUpserializer, LoginSerializer, LoginCredentialsSerializer, OTPVerifySerializer,BookingSerializer,ServiceSerializerAdmin, ServiceSerializer, SlotQuerySerializer, BulkBookingItemSerializer, BookingStatsQuerySerializer, DocumentUploadSerializer
+from .slots import free_slots, reserve_slot, reserve_slots
 from .otp_service import send_mock_otp, verify_mock_otp
-import razorpay
+from .pagination import KeysetPagination, SearchPagination
+from .login import LoginError, aauthenticate_credentials, login_payload
+from .filters import ServiceFilter
+from django_filters.rest_framework import DjangoFilterBackend
+from .cache import catalog_key, read_through, catalog_cache_stats, invalidate_cached_user
+from .payments import GatewayUnavailable, PaymentGatewayError, get_gateway, order_data, payable_booking, record_order, verify_payment_signature, verify_webhook_signature
+from .webhooks import InvalidEvent, enqueue_event
+from .metrics import can_read_metrics, get_metrics
+from .routers import ReplicaReadMixin
+from .fast_serializers import BookingValuesSerializer, ServiceValuesSerializer, ValuesListMixin
+from .uploads import UploadError, abort_upload, start_upload, write_chunk
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
-import hmac
-import hashlib
+from django.views.decorators.http import require_GET, require_POST
+from django.http import HttpResponse, JsonResponse
+import json
 
 
 
@@ -40,13 +53,18 @@ def verify_otp(request):
         email = serializer.validated_data['email'] #type: ignore
         otp = serializer.validated_data['otp'] #type: ignore
         if verify_mock_otp(email, otp):
-            try:
-                user = CustomUser.objects.get(email=email)
-                user.is_verified = True
-                user.save()
-                return Response({"message": "OTP verified successfully"})
-            except CustomUser.DoesNotExist:
+            # emails are stored lowercased by CustomUser.save
+            users = CustomUser.objects.filter(email=email.lower())
+            if users.filter(is_verified=False).update(is_verified=True, updated_at=timezone.now()):
+                # the UPDATE sends no post_save, the user cached by
+                # CachedJWTAuthentication is dropped here. only the cache
+                # key needs the pk, an account that was already verified
+                # has nothing stale to drop
+                user_id = users.values_list('pk', flat=True).first()
+                transaction.on_commit(lambda: invalidate_cached_user(user_id))
+            elif not users.exists():
                 return Response({"error": "User does not exist"}, status = status.HTTP_404_NOT_FOUND)
+            return Response({"message": "OTP verified successfully"})
         return Response({"error": "Invalid OTP"}, status = status.HTTP_400_BAD_REQUEST)
     return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
 
@@ -55,42 +73,99 @@ def verify_otp(request):
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def login(request):
+    # the serializer fetches the user and checks the password exactly once
     serializer = LoginSerializer(data=request.data)
     if serializer.is_valid():
-        email = serializer.validated_data['email'] #type: ignore
-        password = serializer.validated_data['password'] #type: ignore
-        try:
-            user = CustomUser.objects.get(email=email)
-            if not user.is_verified:
-                return Response({"error": "User not verified"}, status=status.HTTP_401_UNAUTHORIZED)
-            if user.check_password(password):
-                refresh = RefreshToken.for_user(user)
-                return Response({
-                "success": True,
-                "message": "Login successful",
-                "data": {
-                    'refresh': str(refresh),
-                    'access': str(refresh.access_token),
-                    'user': {
-                        'id': user.id,
-                        'username': user.username,
-                        'email': user.email
-                    }
-                },
-                },status=status.HTTP_200_OK)
-            return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
-        except CustomUser.DoesNotExist:
-            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        user = serializer.validated_data['user'] #type: ignore
+        return Response(login_payload(user), status=status.HTTP_200_OK)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class AvailableServicesListView(generics.ListAPIView):
+@csrf_exempt
+async def async_login(request):
+    """
+    login for ASGI deployments, the password hash is checked on a bounded
+    worker pool instead of the thread shared by all sync views
+    """
+    if request.method != 'POST':
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({"detail": "JSON parse error"}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = LoginCredentialsSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        user = await aauthenticate_credentials(serializer.validated_data['email'], serializer.validated_data['password'])  #type: ignore
+    except LoginError as e:
+        return JsonResponse({"non_field_errors": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+    return JsonResponse(login_payload(user), status=status.HTTP_200_OK)
+
+
+class AvailableServicesListView(ValuesListMixin, generics.ListAPIView):
     serializer_class = ServiceSerializer
+    values_serializer_class = ServiceValuesSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):  #type: ignore
+        # the values serializer reads the provider's columns through the join
         return Service.objects.all()
 
+    def list(self, request, *args, **kwargs):
+        # pages are built from the primary, not a replica. a miss right after
+        # a write bumped the catalog version could read a lagging replica, and
+        # the stale page would then be cached for CATALOG_CACHE_TIMEOUT, far
+        # longer than the lag
+        # next/previous links are absolute, so the host is part of the key
+        key = catalog_key('list', request.build_absolute_uri())
+        data = read_through(key, lambda: super(AvailableServicesListView, self).list(request, *args, **kwargs).data)
+        return Response(data)
+
+
+class ServiceDetailView(generics.RetrieveAPIView):
+    serializer_class = ServiceSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = Service.objects.select_related('provider')
+
+    def retrieve(self, request, *args, **kwargs):
+        key = catalog_key('service', kwargs['pk'])
+        data = read_through(key, lambda: super(ServiceDetailView, self).retrieve(request, *args, **kwargs).data)
+        return Response(data)
+
+
+class ServiceSearchView(ReplicaReadMixin, generics.ListAPIView):
+    serializer_class = ServiceSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SearchPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ServiceFilter
+
+    def get_queryset(self):  #type: ignore
+        return Service.objects.select_related('provider')
+
+
+class ServiceSlotsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            service = Service.objects.get(pk=pk)
+        except Service.DoesNotExist:
+            return Response({"error": "Service not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = SlotQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        slots = free_slots(service, serializer.validated_data['start'], serializer.validated_data['end'])  #type: ignore
+        return Response({
+            'service': service.pk,
+            'duration': service.duration,
+            'capacity': service.capacity,
+            'slots': slots,
+        })
+
 
 
 class BookingCreateView(generics.CreateAPIView):
@@ -101,24 +176,74 @@ class BookingCreateView(generics.CreateAPIView):
         user = self.request.user
         if not hasattr(user, 'customer_profile'):
             raise PermissionDenied("Only customers can create bookings.")
-        serializer.save(customer=user.customer_profile) #type: ignore
+        reserve_slot(serializer, user.customer_profile) #type: ignore
+
+
+class BookingBulkCreateView(APIView):
+    """
+    creates up to MAX_ITEMS bookings in one request and reports the outcome of
+    each item by its position in the request body
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    MAX_ITEMS = 100
+
+    def post(self, request):
+        user = request.user
+        if not hasattr(user, 'customer_profile'):
+            raise PermissionDenied("Only customers can create bookings.")
+
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({"error": "Expected a non-empty list of bookings"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.MAX_ITEMS:
+            return Response({"error": f"At most {self.MAX_ITEMS} bookings per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+        errors = {}
+        valid = []
+        for index, item in enumerate(items):
+            serializer = BulkBookingItemSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data['service'], serializer.validated_data['schedule']))  #type: ignore
+            else:
+                errors[index] = serializer.errors
+
+        bookings, booking_errors = reserve_slots(user.customer_profile, valid)
+        errors.update(booking_errors)
+
+        created = iter(BookingSerializer(bookings, many=True).data)
+        results = []
+        for index in range(len(items)):
+            if index in errors:
+                results.append({'index': index, 'status': 'error', 'errors': errors[index]})
+            else:
+                results.append({'index': index, 'status': 'created', 'booking': next(created)})
+
+        if not bookings:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif errors:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response({'created': len(bookings), 'failed': len(errors), 'results': results}, status=response_status)
 
 
 
 
-class CustomerBookingListView(generics.ListAPIView):
+class CustomerBookingListView(ReplicaReadMixin, ValuesListMixin, generics.ListAPIView):
     serializer_class = BookingSerializer
+    values_serializer_class = BookingValuesSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):  #type: ignore
         user = self.request.user
         if hasattr(user, 'customer_profile'):
-            return Booking.objects.filter(customer=user.customer_profile)  #type: ignore
+            return Booking.objects.filter(customer=user.customer_profile).order_by('schedule')  #type: ignore
         return Booking.objects.none()
 
 
-class ProviderBookingListView(generics.ListAPIView):
+class ProviderBookingListView(ReplicaReadMixin, ValuesListMixin, generics.ListAPIView):
     serializer_class = BookingSerializer
+    values_serializer_class = BookingValuesSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):  #type: ignore
@@ -127,7 +252,40 @@ class ProviderBookingListView(generics.ListAPIView):
             provider_profile = user.provider_profile  #type: ignore
         except ProviderProfile.DoesNotExist:
             return Booking.objects.none()
-        return Booking.objects.filter(service__provider=provider_profile)
+        return Booking.objects.filter(service__provider=provider_profile).order_by('schedule')
+
+
+class ProviderBookingStatsView(APIView):
+    """
+    bookings per day and status for the requesting provider, read from the
+    rollup table so the cost depends on the number of days, not bookings
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            provider_profile = request.user.provider_profile
+        except ProviderProfile.DoesNotExist:
+            raise PermissionDenied("Only providers can view booking stats.")
+
+        serializer = BookingStatsQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        start, end = serializer.validated_data['start'], serializer.validated_data['end']  #type: ignore
+
+        rows = (
+            ProviderBookingStats.objects
+            .filter(provider=provider_profile, day__range=(start, end), count__gt=0)
+            .order_by('day', 'status')
+            .values_list('day', 'status', 'count')
+        )
+        days = {}
+        for day, booking_status, count in rows:
+            days.setdefault(day, {})[booking_status] = count
+        return Response({
+            'start': start,
+            'end': end,
+            'days': [{'day': day, 'counts': counts, 'total': sum(counts.values())} for day, counts in days.items()],
+        })
 
 
 class BookingStatusUpdateView(APIView):
@@ -135,7 +293,8 @@ class BookingStatusUpdateView(APIView):
 
     def patch(self, request, pk):
         try:
-            booking = Booking.objects.get(pk=pk)
+            # the service is needed for the ownership check and the stats rollup
+            booking = Booking.objects.select_related('service').get(pk=pk)
         except Booking.DoesNotExist:
             return Response({"error": "Booking not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -144,7 +303,7 @@ class BookingStatusUpdateView(APIView):
         except ProviderProfile.DoesNotExist:
             raise PermissionDenied("You are not authorized to update this booking.")
 
-        if booking.service.provider != provider_profile:
+        if booking.service.provider_id != provider_profile.id:
             raise PermissionDenied("You are not authorized to update this booking.")
 
         new_status = request.data.get('status')
@@ -157,6 +316,81 @@ class BookingStatusUpdateView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+def provider_upload(request, pk):
+    try:
+        provider_profile = request.user.provider_profile
+    except ProviderProfile.DoesNotExist:
+        raise PermissionDenied("Only providers can upload documents.")
+    try:
+        return DocumentUpload.objects.get(pk=pk, provider=provider_profile)
+    except DocumentUpload.DoesNotExist:
+        raise NotFound("Upload not found")
+
+
+def upload_response(upload, response_status=status.HTTP_200_OK):
+    data = DocumentUploadSerializer(upload).data
+    data['chunk_size'] = settings.UPLOAD_CHUNK_MAX_SIZE
+    return Response(data, status=response_status, headers={'Upload-Offset': str(upload.offset)})
+
+
+class DocumentUploadCreateView(APIView):
+    """
+    starts a resumable upload of the provider's documents, see Auth/uploads.py
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        try:
+            provider_profile = request.user.provider_profile
+        except ProviderProfile.DoesNotExist:
+            raise PermissionDenied("Only providers can upload documents.")
+        serializer = DocumentUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = start_upload(provider_profile, **serializer.validated_data)  #type: ignore
+        return upload_response(upload, status.HTTP_201_CREATED)
+
+
+class DocumentUploadView(APIView):
+    """
+    GET returns the offset to resume from. PATCH sends the raw bytes of the
+    next chunk with Upload-Offset and Upload-Checksum (its hex SHA-256)
+    headers. DELETE abandons the upload
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    # the body is streamed to disk by write_chunk, never parsed
+    parser_classes = []
+
+    def get(self, request, pk):
+        return upload_response(provider_upload(request, pk))
+
+    def patch(self, request, pk):
+        upload = provider_upload(request, pk)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response({"error": "Upload-Offset and Content-Length are required"}, status=status.HTTP_400_BAD_REQUEST)
+        checksum = request.headers.get('Upload-Checksum', '')
+        if not checksum:
+            return Response({"error": "Upload-Checksum is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            write_chunk(upload, request.stream, offset, length, checksum)
+        except UploadError as e:
+            return Response({"error": str(e), "offset": upload.offset}, status=e.status, headers={'Upload-Offset': str(upload.offset)})
+        return upload_response(upload)
+
+    def delete(self, request, pk):
+        upload = provider_upload(request, pk)
+        if upload.status == 'complete':
+            return Response({"error": "The upload is complete"}, status=status.HTTP_409_CONFLICT)
+        try:
+            abort_upload(upload)
+        except UploadError as e:
+            return Response({"error": str(e)}, status=e.status)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 #admin views
 
 class ServiceCreateView(generics.CreateAPIView):
@@ -171,36 +405,40 @@ class ServiceUpdateView(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAdminUser]
 
 
+class CatalogCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
 
+    def get(self, request):
+        return Response(catalog_cache_stats())
 
-#payment services
 
-razorpay_client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
 
 
+#payment services
+
 @api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
 def create_order(request):
-    amount = request.data.get('amount')  # Amount in INR
-    if not amount:
-        return Response({'error': 'Amount is required'}, status=400)
+    booking = payable_booking(request.user, request.data.get('booking'))
+    if booking is None:
+        return Response({'error': 'Booking not found'}, status=400)
 
-    amount_paise = int(float(amount) * 100)  # Razorpay uses paise
-    order_data = {
-        'amount': amount_paise,
-        'currency': 'INR',
-        'payment_capture': '1',
-    }
+    # the price of the service, whatever the client sends
+    order = order_data(booking.service.price)
 
     try:
-        razorpay_order = razorpay_client.order.create(data=order_data)  #type: ignore
+        razorpay_order = get_gateway().create_order(order)
+        record_order(razorpay_order, order, booking.pk)
         return Response({ 
             'order_id': razorpay_order['id'],
             'razorpay_key': settings.RAZORPAY_KEY_ID,
-            'amount': amount_paise,
+            'amount': order['amount'],
             'currency': 'INR'
         })
-    except Exception as e:
-        return Response({'error': str(e)}, status=500)
+    except GatewayUnavailable as e:
+        return Response({'error': str(e)}, status=503)
+    except PaymentGatewayError as e:
+        return Response({'error': str(e)}, status=502)
 
 @csrf_exempt
 @api_view(['POST'])
@@ -211,16 +449,37 @@ def verify_payment(request):
         payment_id = data['razorpay_payment_id']
         signature = data['razorpay_signature']
 
-        body = f"{order_id}|{payment_id}"
-        expected_signature = hmac.new(
-            bytes(settings.RAZORPAY_KEY_SECRET, 'utf-8'),
-            bytes(body, 'utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-
-        if expected_signature == signature:
+        if verify_payment_signature(order_id, payment_id, signature):
             return Response({'status': 'Payment verified successfully'})
         else:
             return Response({'error': 'Signature mismatch'}, status=400)
     except KeyError:
         return Response({'error': 'Invalid data'}, status=400)
+
+
+@csrf_exempt
+@require_POST
+def payment_webhook(request):
+    """
+    verifies and queues the event, process_payment_webhooks applies it. kept to
+    one INSERT so bursts of deliveries are acknowledged well inside the
+    gateway's timeout
+    """
+    if not verify_webhook_signature(request.body, request.headers.get('X-Razorpay-Signature')):
+        return JsonResponse({'error': 'Invalid signature'}, status=400)
+    try:
+        enqueue_event(request.body, request.headers.get('X-Razorpay-Event-Id'))
+    except InvalidEvent as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'status': 'queued'})
+
+
+@require_GET
+def metrics(request):
+    """
+    request counts and latency histograms of this worker process, in the
+    Prometheus text exposition format
+    """
+    if not can_read_metrics(request):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    return HttpResponse(get_metrics().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,28 +1,55 @@
 from django.urls import path
-from Auth import views
+from Auth import views, async_views
 from Auth.views import (
     BookingCreateView,
+    BookingBulkCreateView,
     CustomerBookingListView,
+    ProviderBookingListView,
+    ProviderBookingStatsView,
     BookingStatusUpdateView,
     ServiceCreateView,
     ServiceUpdateView,
-    AvailableServicesListView
+    AvailableServicesListView,
+    ServiceDetailView,
+    ServiceSearchView,
+    ServiceSlotsView,
+    CatalogCacheStatsView,
+    DocumentUploadCreateView,
+    DocumentUploadView,
 )
 
 urlpatterns = [
     path('signup/', views.register, name="signup"),
     path('verify-otp/', views.verify_otp, name="verify-otp"),
     path('login/', views.login, name="login"),
+    path('async/login/', views.async_login, name="async-login"),
 
     path('list_services/', AvailableServicesListView.as_view(), name="all_services"),
+    path('services/search/', ServiceSearchView.as_view(), name="service-search"),
+    path('services/<uuid:pk>/', ServiceDetailView.as_view(), name="service-detail"),
+    path('services/<uuid:pk>/slots/', ServiceSlotsView.as_view(), name="service-slots"),
     path('book_service/', BookingCreateView.as_view(), name='booking-service'),    
+    path('book_service/bulk/', BookingBulkCreateView.as_view(), name='booking-service-bulk'),
     path('my/', CustomerBookingListView.as_view(), name='booking-list'),            
-    path('<uuid:pk>/', BookingStatusUpdateView.as_view(), name='booking-update'),  
+    path('provider/', ProviderBookingListView.as_view(), name='provider-booking-list'),
+    path('provider/stats/', ProviderBookingStatsView.as_view(), name='provider-booking-stats'),
+    path('<uuid:pk>/', BookingStatusUpdateView.as_view(), name='booking-update'),
+    path('uploads/', DocumentUploadCreateView.as_view(), name='document-upload-create'),
+    path('uploads/<uuid:pk>/', DocumentUploadView.as_view(), name='document-upload'),  
 
     path('admin/services/', ServiceCreateView.as_view(), name='admin-service-create'),
     path('admin/services/<int:pk>/', ServiceUpdateView.as_view(), name='admin-service-update'),
+    path('admin/cache/stats/', CatalogCacheStatsView.as_view(), name='admin-cache-stats'),
 
 
     path('payment/create/', views.create_order, name="create_order"),
     path('payment/verify/', views.verify_payment, name="verify_payment"),
+    path('payment/webhook/', views.payment_webhook, name="payment_webhook"),
+
+    # native async views, for deployments served through app/asgi.py
+    path('async/list_services/', async_views.service_list, name="async-all-services"),
+    path('async/my/', async_views.customer_bookings, name="async-booking-list"),
+    path('async/bookings/<uuid:pk>/', async_views.booking_detail, name="async-booking-detail"),
+    path('async/payment/create/', async_views.create_order, name="async-create-order"),
+    path('async/payment/verify/', async_views.verify_payment, name="async-verify-payment"),
 ]
\ No newline at end of file
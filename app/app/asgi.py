@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+# sync views run on a new thread per request here, persistent connections
+# would only pile up. DB_CONN_MAX_AGE still overrides it
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
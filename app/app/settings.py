@@ -11,8 +11,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,6 +49,7 @@ EXTERNAL_APPS = [
     'rest_framework',
     'rest_framework_simplejwt',
     'django_ratelimit',
+    'django_filters',
 ]
 
 INSTALLED_APPS += EXTERNAL_APPS
@@ -58,18 +60,37 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Auth.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'Auth.middleware.APILoggingMiddleware',
+    'Auth.profiling.SQLProfilingMiddleware',
 ]
 
+# profile the SQL of every request, or only of requests sending X-SQL-Profile: 1
+# when the header is allowed. see Auth/profiling.py. the header lets any client
+# read query counts and timings, so it is off until explicitly enabled, DEBUG
+# does not turn it on
+SQL_PROFILING = config('SQL_PROFILING', default=False, cast=bool)
+SQL_PROFILING_ALLOW_HEADER = config('SQL_PROFILING_ALLOW_HEADER', default=False, cast=bool)
+# times one SELECT may repeat in a request before it is reported as N+1
+SQL_N_PLUS_ONE_THRESHOLD = 3
+
 #jwt settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    ]
+        'Auth.authentication.CachedJWTAuthentication',
+    ],
+    # orjson when installed, the stock JSON output otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'Auth.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# how long an authenticated user and its profiles stay cached
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', default=60, cast=int)
+
 ROOT_URLCONF = 'app.urls'
 
 AUTH_USER_MODEL = 'Auth.CustomUser'
@@ -95,13 +116,70 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# milliseconds a connection waits for the write lock before "database is locked"
+SQLITE_BUSY_TIMEOUT = config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int)
+
+SQLITE_OPTIONS = {
+    # a deferred transaction that reads and then writes cannot wait for the
+    # lock and fails at once, BEGIN IMMEDIATE queues for it under the timeout.
+    # the booking code relies on this, see Auth/slots.py
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': SQLITE_BUSY_TIMEOUT / 1000,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
     }
 }
 
+# 'production' adds the tuning pragmas below to the locking every profile
+# has, 'default' leaves them out. deployments opt in with
+# DB_PROFILE=production. bench_sqlite_writes compares the two
+DB_PROFILE = config('DB_PROFILE', default='default')
+
+SQLITE_PRAGMAS = {
+    # readers no longer block the writer and commits append to the log
+    'journal_mode': 'WAL',
+    # with WAL this only risks the last commits on power loss, never corruption
+    'synchronous': 'NORMAL',
+    # negative is KiB, so 64MB of page cache per connection
+    'cache_size': config('SQLITE_CACHE_SIZE', default=-64000, cast=int),
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+    'temp_store': 'MEMORY',
+}
+
+SQLITE_PRODUCTION_OPTIONS = {
+    **SQLITE_OPTIONS,
+    'init_command': ''.join(f'PRAGMA {name}={value};' for name, value in SQLITE_PRAGMAS.items()),
+}
+
+if DB_PROFILE == 'production':
+    DATABASES['default']['OPTIONS'] = SQLITE_PRODUCTION_OPTIONS
+    # pragmas run once per connection, so keep connections between requests
+    # with DB_CONN_MAX_AGE seconds. under ASGI every request runs on a thread
+    # of its own and a kept connection is never reused, app/asgi.py defaults
+    # it to 0 there
+    DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=600, cast=int)
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# read replicas, list views read from them and everything else uses the
+# primary. locally these are SQLite files kept up to date by sync_replicas,
+# e.g. DATABASE_REPLICAS=db-replica.sqlite3. see Auth/routers.py
+DATABASE_REPLICAS = []
+for i, name in enumerate(config('DATABASE_REPLICAS', default='', cast=Csv())):
+    alias = f'replica{i + 1}'
+    # tests run against the primary's test database
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': BASE_DIR / name, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['Auth.routers.PrimaryReplicaRouter']
+
+# seconds a user's reads stay on the primary after they wrote
+READ_AFTER_WRITE_WINDOW = config('READ_AFTER_WRITE_WINDOW', default=5, cast=float)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,6 +201,9 @@ AUTH_PASSWORD_VALIDATORS = [
 
 AUTHENTICATION_BACKENDS = ['Auth.auth_backend.EmailBackend']
 
+# threads that check password hashes for the async login view
+PASSWORD_HASHING_WORKERS = config('PASSWORD_HASHING_WORKERS', default=4, cast=int)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -144,6 +225,29 @@ STATIC_URL = 'static/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# media is served by Auth/media.py, pictures to anyone and provider documents
+# to their provider and staff. with MEDIA_ACCEL_REDIRECT set, e.g. to
+# /protected-media/, it only checks the request and leaves sending the file to
+# an nginx `internal` location with that prefix. MEDIA_CACHE_CONTROL applies to
+# pictures, documents are always sent with `private, no-store`
+MEDIA_ACCEL_REDIRECT = config('MEDIA_ACCEL_REDIRECT', default='')
+MEDIA_CACHE_CONTROL = config('MEDIA_CACHE_CONTROL', default='public, max-age=3600')
+MEDIA_CHUNK_SIZE = 64 * 1024
+
+# resumable document uploads, see Auth/uploads.py. partial files live outside
+# MEDIA_ROOT, on the same filesystem so finishing an upload is a rename
+UPLOAD_MAX_SIZE = config('UPLOAD_MAX_SIZE', default=200 * 1024 * 1024, cast=int)
+UPLOAD_CHUNK_MAX_SIZE = config('UPLOAD_CHUNK_MAX_SIZE', default=8 * 1024 * 1024, cast=int)
+UPLOAD_TEMP_DIR = config('UPLOAD_TEMP_DIR', default=os.path.join(BASE_DIR, 'upload_tmp'))
+# seconds after its last chunk an unfinished upload is removed by clean_uploads
+UPLOAD_EXPIRY = config('UPLOAD_EXPIRY', default=24 * 3600, cast=int)
+
+# square sizes, in pixels, every profile picture is resized to. each is
+# stored as WebP and as a JPEG fallback, see Auth/images.py
+IMAGE_VARIANT_SIZES = [64, 128, 256]
+IMAGE_QUALITY = config('IMAGE_QUALITY', default=80, cast=int)
+IMAGE_PROCESSING_WORKERS = config('IMAGE_PROCESSING_WORKERS', default=2, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -152,6 +256,11 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 PHONENUMBER_DEFAULT_REGION = 'IN'
 
 
+# share of successful request records written to the log, errors and slow
+# requests are always written
+API_LOG_SAMPLE_RATE = config('API_LOG_SAMPLE_RATE', default=1.0, cast=float)
+API_LOG_SLOW_THRESHOLD = config('API_LOG_SLOW_THRESHOLD', default=1.0, cast=float)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': True,
@@ -160,6 +269,16 @@ LOGGING = {
             'format': '[{asctime}] {levelname} {name} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'Auth.log.JSONFormatter',
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'Auth.log.SamplingFilter',
+            'rate': API_LOG_SAMPLE_RATE,
+            'slow_threshold': API_LOG_SLOW_THRESHOLD,
+        },
     },
     'handlers': {
         'console': {
@@ -167,9 +286,10 @@ LOGGING = {
             'formatter': 'verbose',
         },
         'file': {
-            'class': 'logging.FileHandler',
+            # formats and writes on a listener thread, not the request thread
+            'class': 'Auth.log.QueuedFileHandler',
             'filename': 'api.log',
-            'formatter': 'verbose',
+            'formatter': 'json',
         },
     },
     'loggers': {
@@ -177,6 +297,23 @@ LOGGING = {
             'handlers': ['console', 'file'],
             'level': 'INFO',
         },
+        'api_logger': {
+            'handlers': ['file'],
+            'filters': ['sampling'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # the mock OTP sender writes every code here, never to api.log
+        'Auth.otp_service': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'sql_profiler': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         'django_redis': {
         'handlers': ['console'],
         'level': 'DEBUG',
@@ -188,17 +325,62 @@ LOGGING = {
     },
 }
 
+# /metrics is only served to staff and to requests sending
+# Authorization: Bearer <METRICS_TOKEN>, e.g. Prometheus' authorization setting
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
 
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": "redis://127.0.0.1:6379/1",
+        "LOCATION": config('REDIS_URL', default="redis://127.0.0.1:6379/1"),
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         }
     }
 }
 
+# tests and redis-less setups fall back to a per-process local memory cache
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+if TESTING or config('USE_LOCMEM_CACHE', default=False, cast=bool):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "app-default",
+        }
+    }
+    # django_ratelimit wants a shared cache, which a single test process doesn't need
+    SILENCED_SYSTEM_CHECKS = ['django_ratelimit.E003', 'django_ratelimit.W001']
+
+# service catalog read-through cache, see Auth/cache.py
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+# OTPs live in the shared cache so any worker can verify them, 'memory' keeps
+# them in a per-process LRU instead, see Auth/otp_service.py
+OTP_STORE = config('OTP_STORE', default='cache')
+OTP_CACHE_ALIAS = 'default'
+OTP_TTL = config('OTP_TTL', default=300, cast=int)
+OTP_MAX_ATTEMPTS = config('OTP_MAX_ATTEMPTS', default=5, cast=int)
+OTP_MEMORY_MAX_ENTRIES = 10000
+
 
 RAZORPAY_KEY_ID = config('RAZORPAY_KEY_ID')
-RAZORPAY_KEY_SECRET = config('RAZORPAY_KEY_SECRET')
\ No newline at end of file
+RAZORPAY_KEY_SECRET = config('RAZORPAY_KEY_SECRET')
+RAZORPAY_WEBHOOK_SECRET = config('RAZORPAY_WEBHOOK_SECRET', default='')
+RAZORPAY_API_BASE = config('RAZORPAY_API_BASE', default='https://api.razorpay.com/v1')
+# seconds an outbound payment gateway call may take
+PAYMENT_GATEWAY_TIMEOUT = config('PAYMENT_GATEWAY_TIMEOUT', default=10, cast=float)
+# 'razorpay' talks to RAZORPAY_API_BASE, 'stub' answers in process. point
+# RAZORPAY_API_BASE at `manage.py run_payment_stub` to exercise the real
+# client without leaving the machine
+PAYMENT_GATEWAY = config('PAYMENT_GATEWAY', default='razorpay')
+PAYMENT_STUB_LATENCY = config('PAYMENT_STUB_LATENCY', default=0, cast=float)
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = config('PAYMENT_GATEWAY_CONNECT_TIMEOUT', default=3, cast=float)
+PAYMENT_GATEWAY_RETRIES = config('PAYMENT_GATEWAY_RETRIES', default=2, cast=int)
+PAYMENT_GATEWAY_POOL_SIZE = config('PAYMENT_GATEWAY_POOL_SIZE', default=20, cast=int)
+PAYMENT_BREAKER_THRESHOLD = config('PAYMENT_BREAKER_THRESHOLD', default=5, cast=int)
+PAYMENT_BREAKER_RESET_TIMEOUT = config('PAYMENT_BREAKER_RESET_TIMEOUT', default=30, cast=float)
+# webhook events applied per transaction by process_payment_webhooks
+PAYMENT_WEBHOOK_BATCH_SIZE = config('PAYMENT_WEBHOOK_BATCH_SIZE', default=500, cast=int)